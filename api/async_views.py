@@ -0,0 +1,121 @@
+import json
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+from currencyData.rates import aget_rate_matrix, convert_batch
+from currencyData.services import save_transaction
+from currencyData.stream import stream_rates, DEFAULT_MAX_PAIRS
+from .views import (
+    rate_validators, not_modified, add_rate_validators, rate_as_of, batch_items, BATCH_ERROR, DEFAULT_BATCH_MAX_ITEMS,
+)
+
+# Async-native variants of the pair and batch endpoints, served without blocking the event loop under an ASGI
+# server (e.g. uvicorn currencyExchange.asgi:application). Rates come from the in-memory rate matrix, the version
+# check uses the async cache API and saving transactions (buffer + Celery enqueue) runs in a worker thread.
+
+def save_transactions(symbols, matrix=None):
+    for symbol in symbols:
+        if len(symbol) == 6:
+            save_transaction(symbol, matrix)
+
+
+save_transactions_async = sync_to_async(save_transactions)
+
+
+@require_GET
+async def getCurrencyRateAsync(request, base_currency, quote_currency):
+    '''
+     Async variant of getCurrencyRate, same payload, errors and ETag / Last-Modified revalidation. With
+     ?as_of=YYYY-MM-DD the rate effective on that date is read from the stored series in a worker thread.
+
+    return:
+        JsonResponse: A dictionary containing the currency pair and the exchange rate
+    '''
+    base, quote = base_currency.upper(), quote_currency.upper()
+    if request.GET.get('as_of'):
+        payload, status_code = await sync_to_async(rate_as_of)(base + quote, request.GET['as_of'])
+        return JsonResponse(payload, status=status_code)
+
+    matrix = await aget_rate_matrix()
+    try:
+        rate = matrix.rate(base, quote)
+    except KeyError as error:
+        return JsonResponse({
+            'error': f'One of the entered currency codes does not exist. Example format: /currency/EUR/USD/ {error}'
+        }, status=400)
+    except ZeroDivisionError:
+        return JsonResponse({
+            'error': 'The quote currency rate is 0. Division by zero is not allowed'
+        }, status=400)
+
+    try:
+        await save_transactions_async([base + quote], matrix)
+    except Exception as error:
+        return JsonResponse({
+            'error': f'An error occurred while saving the transaction: {str(error)}'
+        }, status=400)
+
+    etag, last_modified = rate_validators(matrix, base, quote)
+    response = not_modified(request, etag, last_modified)
+    if response is None:
+        response = JsonResponse({'currency_pair': f'{base}{quote}', 'exchange_rate': rate})
+    return add_rate_validators(response, etag, last_modified)
+
+
+@csrf_exempt
+@require_POST
+async def convertCurrenciesAsync(request):
+    '''
+    Async variant of convertCurrencies, many pairs and amounts resolved with one vectorized computation.
+
+    return:
+        JsonResponse: A list of results in the order of items, items which can not be converted contain an error.
+    '''
+    try:
+        items = batch_items(json.loads(request.body or b'null'))
+    except ValueError:
+        items = None
+    max_items = getattr(settings, 'BATCH_MAX_ITEMS', DEFAULT_BATCH_MAX_ITEMS)
+    if items is None or len(items) > max_items:
+        return JsonResponse({'error': f'{BATCH_ERROR}, at most {max_items} items'}, status=400)
+
+    matrix = await aget_rate_matrix()
+    results = convert_batch(matrix, items)
+
+    await save_transactions_async({result['currency_pair'] for result in results if 'exchange_rate' in result}, matrix)
+
+    return JsonResponse(results, safe=False)
+
+
+@require_GET
+async def streamCurrencyRates(request):
+    '''
+    Server-sent events stream of the rates of the pairs given as ?pairs=EURUSD,USDGBP. The current rates are sent
+    first, then an event for every pair whose rate changed after load_rates or an admin edit.
+
+    The stream never ends, it is served only under an ASGI server. A WSGI server would hold one worker per client
+    for as long as the client stays connected, so the endpoint answers 501 there.
+
+    return:
+        StreamingHttpResponse: text/event-stream with one "rate" event per pair
+    '''
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse({
+            'error': 'The stream is served only under an ASGI server, e.g. uvicorn currencyExchange.asgi:application'
+        }, status=501)
+
+    pairs = {pair.strip().upper() for pair in request.GET.get('pairs', '').split(',') if pair.strip()}
+    max_pairs = getattr(settings, 'RATES_STREAM_MAX_PAIRS', DEFAULT_MAX_PAIRS)
+    if not pairs or len(pairs) > max_pairs or any(len(pair) != 6 or not pair.isalpha() for pair in pairs):
+        return JsonResponse({
+            'error': f'Give 1 to {max_pairs} currency pairs, e.g. /async/currency/stream/?pairs=EURUSD,USDGBP'
+        }, status=400)
+
+    response = StreamingHttpResponse(stream_rates(pairs), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # nginx would buffer the events otherwise
+    response['X-Accel-Buffering'] = 'no'
+    return response
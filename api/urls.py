@@ -1,8 +1,17 @@
 from django.urls import path
-from . import views
+from . import views, async_views
 
 
 urlpatterns = [
     path('', views.getRoutes),
+    path('currency/batch/', views.convertCurrencies, name='convertCurrencies'),
+    path('currency/as-of/', views.convertCurrenciesAsOf, name='convertCurrenciesAsOf'),
+    path('currency/analytics/', views.getCurrencyAnalytics, name='getCurrencyAnalytics'),
     path('currency/<str:base_currency>/<str:quote_currency>/', views.getCurrencyRate, name='getCurrencyRate'),
+    path('currency/<str:base_currency>/<str:quote_currency>/history/', views.getCurrencyHistory, name='getCurrencyHistory'),
+    path('rates/<str:base_currency>/', views.getBaseRates, name='getBaseRates'),
+    path('metrics/', views.getMetrics, name='getMetrics'),
+    path('async/currency/batch/', async_views.convertCurrenciesAsync, name='convertCurrenciesAsync'),
+    path('async/currency/stream/', async_views.streamCurrencyRates, name='streamCurrencyRates'),
+    path('async/currency/<str:base_currency>/<str:quote_currency>/', async_views.getCurrencyRateAsync, name='getCurrencyRateAsync'),
 ]
\ No newline at end of file
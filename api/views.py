@@ -1,8 +1,18 @@
+import datetime
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 from rest_framework import status
-from currencyData.models import Currency
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
+from currencyData.rates import get_rate_matrix, convert_batch
 from currencyData.services import save_transaction
+from currencyData.history import pair_history, convert_as_of, INTERVALS
+from currencyData.analytics import pair_analytics, DEFAULT_WINDOW, MIN_WINDOW, MAX_WINDOW
+from currencyData.metrics import metrics
 
 
 @api_view(['GET'])
@@ -11,16 +21,149 @@ def getRoutes(request):
         {'GET': '/currency/EUR/USD/',
          'description': 'returns exchange rate of value (e.g. : /currency/EUR/USD/)'
          },
+        {'GET': '/currency/EUR/USD/history/?from=2024-01-01&to=2024-12-31&interval=week',
+         'description': 'returns history of a currency pair as columnar arrays, '
+                        'interval: day (default), week or month with open/high/low/close values'
+         },
+        {'GET': '/rates/EUR/',
+         'description': 'returns exchange rates of a base currency against every other currency'
+         },
+        {'GET': '/currency/analytics/?pairs=EURUSD,USDGBP&from=2024-01-01&window=20',
+         'description': 'returns rolling mean, rolling std, volatility and max drawdown of the pairs '
+                        'and the correlation matrix of their currencies'
+         },
+        {'GET': '/currency/EUR/USD/?as_of=2024-12-07',
+         'description': 'returns exchange rate effective on a past date, the previous fixing on weekends and holidays'
+         },
+        {'POST': '/currency/as-of/',
+         'description': 'returns rates of many pairs effective on past dates '
+                        '(e.g. : {"items": [{"pair": "EURUSD", "date": "2024-12-07", "amount": 100}]})'
+         },
+        {'POST': '/currency/batch/',
+         'description': 'converts many pairs and amounts at once '
+                        '(e.g. : {"items": [{"base": "EUR", "quote": "USD", "amount": 100}]} '
+                        'or {"base": "EUR", "quotes": ["USD", "GBP"], "amount": 100})'
+         },
     ]
 
     return Response(routes)
 
 
+def rate_etag(matrix, base, quote):
+    '''
+    ETag of a pair rate, it changes only when a new rates table is published. Unknown pairs have no ETag.
+    '''
+    if base not in matrix or quote not in matrix or matrix.version is None:
+        return None
+    return f'{base}{quote}-{matrix.version.number}-{matrix.version.published_at}'
+
+
+def rate_last_modified(matrix):
+    return datetime.datetime.fromtimestamp(matrix.version.published_at / 1e9, tz=datetime.timezone.utc)
+
+
+def rate_validators(matrix, base, quote):
+    '''
+    Quoted ETag and Last-Modified (seconds since epoch) of a pair rate, (None, None) for unknown pairs.
+    '''
+    etag = rate_etag(matrix, base, quote)
+    if etag is None:
+        return None, None
+    return quote_etag(etag), int(rate_last_modified(matrix).timestamp())
+
+
+def not_modified(request, etag, last_modified):
+    '''
+    Returns 304 when the client already has the rate of the validators, otherwise None.
+    '''
+    if etag is None:
+        return None
+    return get_conditional_response(request, etag=etag, last_modified=last_modified)
+
+
+def add_rate_validators(response, etag, last_modified):
+    '''
+    Adds the validators and the revalidation Cache-Control to a 200 or 304 rate response.
+    '''
+    if etag is not None:
+        response.headers.setdefault('ETag', etag)
+        response.headers.setdefault('Last-Modified', http_date(last_modified))
+    patch_cache_control(response, public=True, max_age=0, must_revalidate=True)
+    return response
+
+
+def request_rate_matrix(request):
+    '''
+    Rate matrix of a request, the published version is checked once and shared by the ETag, Last-Modified and view
+    code of the request.
+    '''
+    # the DRF Request wraps the HttpRequest which the condition decorator receives
+    request = getattr(request, '_request', request)
+    matrix = getattr(request, 'rate_matrix', None)
+    if matrix is None:
+        matrix = request.rate_matrix = get_rate_matrix()
+    return matrix
+
+
+def base_rates_etag(request, base_currency):
+    matrix = request_rate_matrix(request)
+    base = base_currency.upper()
+    if base not in matrix or matrix.version is None:
+        return None
+    return f'{base}-{matrix.version.number}-{matrix.version.published_at}'
+
+
+def base_rates_last_modified(request, base_currency):
+    matrix = request_rate_matrix(request)
+    if base_currency.upper() not in matrix or matrix.version is None:
+        return None
+    return rate_last_modified(matrix)
+
+
+# Default maximum number of pairs of one analytics request, when settings.py does not define ANALYTICS_MAX_PAIRS
+DEFAULT_ANALYTICS_MAX_PAIRS = 100
+
+# Default maximum number of items of one as-of request, when settings.py does not define AS_OF_MAX_ITEMS
+DEFAULT_AS_OF_MAX_ITEMS = 100000
+
+# Default maximum number of items of one batch request, when settings.py does not define BATCH_MAX_ITEMS
+DEFAULT_BATCH_MAX_ITEMS = 1000
+
+
+def batch_items(data):
+    '''
+    Reads items of a batch request, either {"items": [...]} / [...] or {"base": "EUR", "quotes": [...], "amount": 1}.
+
+    :return: list of items or None when the body has no items.
+    '''
+    if isinstance(data, dict) and 'quotes' in data:
+        quotes = data['quotes'] if isinstance(data['quotes'], list) else []
+        items = [{'base': data.get('base'), 'quote': quote, 'amount': data.get('amount', 1)} for quote in quotes]
+    else:
+        items = data.get('items') if isinstance(data, dict) else data
+
+    if not isinstance(items, list) or not items:
+        return None
+    return items
+
+
+BATCH_ERROR = ('Send a list of items {"items": [{"base": "EUR", "quote": "USD", "amount": 100}]} '
+               'or a base with a list of quotes {"base": "EUR", "quotes": ["USD", "GBP"]}')
+
+
 @api_view(['GET'])
 def getCurrencyRate(request, base_currency, quote_currency):
     '''
      Fetches the exchange rate for a currency pair and saves the transaction.
 
+     The rate is read from the in-memory rate matrix of the worker, no database query is needed. Responses carry
+     an ETag and Last-Modified of the rates table, clients and proxies revalidate them and get 304 until load_rates
+     publishes a new table. A revalidated request is a transaction as well, it is saved before the 304 is returned.
+     Error responses carry no validators.
+
+     With ?as_of=YYYY-MM-DD the rate effective on that date is returned instead (the previous fixing on weekends
+     and holidays), no transaction is saved then.
+
     args:
         base_currency (str): The base currency code (e.g., 'EUR').
         quote_currency (str): The quote currency code (e.g., 'USD').
@@ -29,17 +172,17 @@ def getCurrencyRate(request, base_currency, quote_currency):
     return:
         Response: A dictionary containing the currency pair and the exchange rate
     '''
+    if request.GET.get('as_of'):
+        return currency_rate_as_of(f'{base_currency.upper()}{quote_currency.upper()}', request.GET['as_of'])
+
+    matrix = request_rate_matrix(request)
     try:
-        first_currency = Currency.objects.get(code=base_currency.upper())
-        second_currency = Currency.objects.get(code=quote_currency.upper())
-    except Exception as error:
+        rate = matrix.rate(base_currency.upper(), quote_currency.upper())
+        result = {'currency_pair': f'{base_currency.upper()}{quote_currency.upper()}', 'exchange_rate': rate}
+    except KeyError as error:
         return Response({
             'error': f'One of the entered currency codes does not exist. Example format: /currency/EUR/USD/ {error}'
         }, status=status.HTTP_400_BAD_REQUEST)
-
-    try:
-        rate = (first_currency.rate_currency / second_currency.rate_currency)
-        result = {'currency_pair': f'{base_currency.upper()}{quote_currency.upper()}', 'exchange_rate': rate}
     except ZeroDivisionError:
         return Response({
             'error': 'The quote currency rate is 0. Division by zero is not allowed'
@@ -48,10 +191,196 @@ def getCurrencyRate(request, base_currency, quote_currency):
     try:
         symbol = base_currency.upper() + quote_currency.upper()
         if len(symbol) == 6:
-            save_transaction(symbol.upper())
+            save_transaction(symbol.upper(), matrix)
     except Exception as error:
         return Response({
             'error': f'An error occurred while saving the transaction: {str(error)}'
         }, status=status.HTTP_400_BAD_REQUEST)
 
-    return Response(result)
+    etag, last_modified = rate_validators(matrix, base_currency.upper(), quote_currency.upper())
+    response = not_modified(request, etag, last_modified) or Response(result)
+    return add_rate_validators(response, etag, last_modified)
+
+
+@cache_control(public=True, max_age=0, must_revalidate=True)
+@condition(etag_func=base_rates_etag, last_modified_func=base_rates_last_modified)
+@api_view(['GET'])
+def getBaseRates(request, base_currency):
+    '''
+    Returns the exchange rates of a base currency against every other currency.
+
+    The rates are one row of the in-memory rate matrix, converted once per rates version, so the whole row costs
+    about as much as one pair. Transactions are not saved, use the pair endpoint to record them.
+
+    args:
+        base_currency (str): The base currency code (e.g., 'EUR').
+
+    return:
+        Response: The base currency, the effective date of the rates table and a dictionary of quote rates.
+    '''
+    matrix = request_rate_matrix(request)
+    try:
+        quotes = matrix.quotes(base_currency.upper())
+    except KeyError as error:
+        return Response({
+            'error': f'The entered currency code does not exist. Example format: /rates/EUR/ {error}'
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    effective_date = matrix.version.effective_date if matrix.version else None
+    return Response({'base': base_currency.upper(), 'effective_date': effective_date, 'rates': quotes})
+
+
+def rate_as_of(pair, as_of):
+    '''
+    Payload and status code of the rate of a pair effective on a past date, shared by the sync and async views.
+    '''
+    result = convert_as_of([{'pair': pair, 'date': as_of}])[0]
+    if 'error' in result:
+        return {'error': result['error']}, status.HTTP_400_BAD_REQUEST
+    return {
+        'currency_pair': pair,
+        'exchange_rate': result['exchange_rate'],
+        'as_of': as_of,
+        'effective_date': result['effective_date'],
+    }, status.HTTP_200_OK
+
+
+def currency_rate_as_of(pair, as_of):
+    payload, status_code = rate_as_of(pair, as_of)
+    return Response(payload, status=status_code)
+
+
+@api_view(['POST'])
+def convertCurrenciesAsOf(request):
+    '''
+    Returns the rates of many currency pairs effective on past dates, e.g. for a billing run of many invoices.
+
+    The body is a list of items {"items": [{"pair": "EURUSD", "date": "2024-12-07", "amount": 100}, ...]}. All dates
+    are resolved against the stored series with binary searches, without a query per item. Transactions are not saved.
+
+    return:
+        Response: A list of results in the order of items, items which can not be resolved contain an error.
+    '''
+    items = batch_items(request.data)
+    max_items = getattr(settings, 'AS_OF_MAX_ITEMS', DEFAULT_AS_OF_MAX_ITEMS)
+    if items is None or len(items) > max_items:
+        return Response({
+            'error': f'Send a list of 1 to {max_items} items '
+                     '{"items": [{"pair": "EURUSD", "date": "2024-12-07", "amount": 100}]}'
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    return Response(convert_as_of(items))
+
+
+@api_view(['POST'])
+def convertCurrencies(request):
+    '''
+    Converts many currency pairs and amounts in one request.
+
+    The body is either a list of items {"items": [{"base": "EUR", "quote": "USD", "amount": 100}, ...]} or one base
+    currency with a list of quotes {"base": "EUR", "quotes": ["USD", "GBP"], "amount": 100}. All rates are resolved
+    with one vectorized computation over the rate matrix and saved like single pair requests.
+
+    return:
+        Response: A list of results in the order of items, items which can not be converted contain an error.
+    '''
+    items = batch_items(request.data)
+    max_items = getattr(settings, 'BATCH_MAX_ITEMS', DEFAULT_BATCH_MAX_ITEMS)
+    if items is None or len(items) > max_items:
+        return Response({'error': f'{BATCH_ERROR}, at most {max_items} items'}, status=status.HTTP_400_BAD_REQUEST)
+
+    matrix = request_rate_matrix(request)
+    results = convert_batch(matrix, items)
+
+    for symbol in {result['currency_pair'] for result in results if 'exchange_rate' in result}:
+        if len(symbol) == 6:
+            save_transaction(symbol, matrix)
+
+    return Response(results)
+
+
+@api_view(['GET'])
+def getCurrencyHistory(request, base_currency, quote_currency):
+    '''
+    Returns the stored history of a currency pair.
+
+    Rows are read with one indexed query and resampled on the server, the payload holds columnar arrays
+    (dates, open, high, low, close) instead of a list of objects.
+
+    query params:
+        from (str): First date in the format 'YYYY-MM-DD' (optional).
+        to (str): Last date in the format 'YYYY-MM-DD' (optional).
+        interval (str): 'day' (default), 'week' or 'month'.
+    '''
+    interval = request.GET.get('interval', 'day')
+    if interval not in INTERVALS:
+        return Response({
+            'error': f'Interval has to be one of: {", ".join(INTERVALS)}'
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        date_from = datetime.date.fromisoformat(request.GET['from']) if request.GET.get('from') else None
+        date_to = datetime.date.fromisoformat(request.GET['to']) if request.GET.get('to') else None
+    except ValueError as error:
+        return Response({
+            'error': f'Dates have to be in the format YYYY-MM-DD. {error}'
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    if date_from and date_to and date_from > date_to:
+        return Response({
+            'error': 'The from date has to be before the to date'
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    return Response(pair_history(f'{base_currency.upper()}{quote_currency.upper()}', date_from, date_to, interval))
+
+
+def getMetrics(request):
+    '''
+    Exposes request, NBP API and Celery task metrics of all processes in the Prometheus text format.
+    '''
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@api_view(['GET'])
+def getCurrencyAnalytics(request):
+    '''
+    Returns rolling statistics of many currency pairs and the correlation matrix of their currencies.
+
+    The pairs are derived from the stored PLN series of their currencies, any pair is available without saving it.
+
+    query params:
+        pairs (str): Comma separated currency pairs (e.g. 'EURUSD,USDGBP').
+        from (str): First date in the format 'YYYY-MM-DD' (optional).
+        to (str): Last date in the format 'YYYY-MM-DD' (optional).
+        window (int): Number of publication days of the rolling statistics (default 20).
+    '''
+    pairs = list(dict.fromkeys(pair.strip().upper() for pair in request.GET.get('pairs', '').split(',') if pair.strip()))
+    max_pairs = getattr(settings, 'ANALYTICS_MAX_PAIRS', DEFAULT_ANALYTICS_MAX_PAIRS)
+    if not pairs or len(pairs) > max_pairs or any(len(pair) != 6 or not pair.isalpha() for pair in pairs):
+        return Response({
+            'error': f'Give 1 to {max_pairs} currency pairs, e.g. /currency/analytics/?pairs=EURUSD,USDGBP'
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        window = int(request.GET.get('window', DEFAULT_WINDOW))
+    except ValueError:
+        window = 0
+    if not MIN_WINDOW <= window <= MAX_WINDOW:
+        return Response({
+            'error': f'Window has to be a number of days from {MIN_WINDOW} to {MAX_WINDOW}'
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        date_from = datetime.date.fromisoformat(request.GET['from']) if request.GET.get('from') else None
+        date_to = datetime.date.fromisoformat(request.GET['to']) if request.GET.get('to') else None
+    except ValueError as error:
+        return Response({
+            'error': f'Dates have to be in the format YYYY-MM-DD. {error}'
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        return Response(pair_analytics(pairs, date_from, date_to, window))
+    except KeyError as error:
+        return Response({
+            'error': f'There is no stored history of {error}, run backfill_history first'
+        }, status=status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,133 @@
+'''
+Micro-benchmarks and load tests of the rate endpoint, the transaction write path, the history pipeline and the
+Excel export. Everything runs offline against the test database and the stub NBP server:
+
+    pytest benchmarks --benchmark-json=results.json
+
+The export sizes are set with --export-rows (1000000 rows take several minutes under tracemalloc). Latency
+percentiles, throughput and peak memory are saved in the extra_info of every benchmark, compare two result files
+with benchmarks/compare.py.
+'''
+import asyncio
+import datetime
+import math
+import tracemalloc
+import pytest
+from django.core.cache import cache
+from django.urls import reverse
+from currencyData.buffer import transaction_buffer
+from currencyData.models import Currency, CurrencyDailyRate, CurrencyExchangeRate
+from currencyData.services import fetch_historical_rate, generate_excel_currencies, get_today_and_last_30_days, save_transaction
+from loadtest import run_load
+
+LOAD_CONNECTIONS = 50
+LOAD_REQUESTS = 2000
+
+
+def currency_codes(count):
+    return [f'{chr(65 + i // 26)}{chr(65 + i % 26)}X' for i in range(count)]
+
+
+def currency_pairs(count):
+    '''
+    Returns count distinct pairs made of as few synthetic currencies as possible.
+    '''
+    codes = currency_codes(math.ceil((1 + math.sqrt(1 + 4 * count)) / 2))
+    return [base + quote for base in codes for quote in codes if base != quote][:count]
+
+
+@pytest.fixture
+def currencies(db):
+    Currency.objects.create(code='EUR', rate_currency=4.3)
+    Currency.objects.create(code='USD', rate_currency=4.1)
+    Currency.objects.create(code='PLN', rate_currency=1)
+
+
+def test_get_currency_rate(benchmark, client, currencies):
+    url = reverse('getCurrencyRate', args=['EUR', 'USD'])
+
+    response = benchmark(client.get, url)
+
+    assert response.status_code == 200
+
+
+@pytest.mark.django_db(transaction=True)
+def test_get_currency_rate_load(benchmark, live_server, settings):
+    # transactions are written by the buffer thread like in production, not by every request
+    settings.TRANSACTION_BUFFER_FLUSH_INTERVAL = 5
+    Currency.objects.create(code='EUR', rate_currency=4.3)
+    Currency.objects.create(code='USD', rate_currency=4.1)
+    url = live_server.url + reverse('getCurrencyRate', args=['EUR', 'USD'])
+
+    result = benchmark.pedantic(
+        lambda: asyncio.run(run_load(url, LOAD_CONNECTIONS, duration=60, requests=LOAD_REQUESTS)),
+        rounds=1, iterations=1,
+    )
+
+    transaction_buffer.flush()
+    benchmark.extra_info.update(
+        requests_per_second=result['requests_per_second'], errors=result['errors'], **result['latency_ms'],
+    )
+    assert result['errors'] == 0
+
+
+def test_save_transaction(benchmark, currencies):
+    benchmark(save_transaction, 'EURUSD')
+
+    assert CurrencyExchangeRate.objects.filter(currency_exchange_pair='EURUSD').count() == 1
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('pair_count', [10, 100, 1000])
+def test_fetch_historical_rate(benchmark, nbp_server, pair_count):
+    pairs = currency_pairs(pair_count)
+    start, end = get_today_and_last_30_days()
+    fixings = [start + datetime.timedelta(days=day) for day in range((end - start).days + 1)]
+    codes = sorted({pair[:3] for pair in pairs} | {pair[3:] for pair in pairs})
+    for number, code in enumerate(codes):
+        nbp_server.add(f'exchangerates/rates/c/{code.lower()}/{start}/{end}/', {'rates': [
+            {'effectiveDate': day.isoformat(), 'bid': 1 + number / 10} for day in fixings if day.weekday() < 5
+        ]})
+
+    def cold_start():
+        # every round starts without stored series and pair rows, so the NBP requests are measured as well
+        CurrencyDailyRate.objects.all().delete()
+        CurrencyExchangeRate.objects.all().delete()
+        cache.clear()
+
+    error = benchmark.pedantic(fetch_historical_rate, args=(pairs,), setup=cold_start, rounds=3)
+
+    benchmark.extra_info.update(pairs=pair_count, rows=CurrencyExchangeRate.objects.count())
+    assert error is None
+    assert CurrencyExchangeRate.objects.values('currency_exchange_pair').distinct().count() == pair_count
+
+
+@pytest.mark.django_db
+def test_generate_excel_currencies_memory(benchmark, export_rows):
+    pairs = currency_pairs(100)
+    first_day = datetime.date(2000, 1, 3)
+    CurrencyExchangeRate.objects.bulk_create(
+        (
+            CurrencyExchangeRate(
+                currency_exchange_pair=pairs[row % len(pairs)],
+                currency_exchange_rate=1 + row % 1000 / 1000,
+                currency_exchange_date=first_day + datetime.timedelta(days=row // len(pairs)),
+            )
+            for row in range(export_rows)
+        ),
+        batch_size=5000,
+    )
+
+    def export():
+        tracemalloc.start()
+        try:
+            response = generate_excel_currencies(CurrencyExchangeRate.objects.all(), 'benchmark')
+            size = response.file_to_stream.seek(0, 2)
+            response.close()
+            return size, tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    size, peak = benchmark.pedantic(export, rounds=1, iterations=1)
+
+    benchmark.extra_info.update(rows=export_rows, file_mb=size / 2 ** 20, peak_memory_mb=peak / 2 ** 20)
@@ -0,0 +1,109 @@
+'''
+Benchmark of (pair, date) history reads and writes on the CurrencyExchangeRate table before and after the unique
+composite (currency_exchange_pair, currency_exchange_date DESC) constraint. Both schemas run against the Django
+test database: "after" is the migrated table, "before" drops the constraint and indexes the pair alone, as the
+table was indexed before the migration.
+
+    pytest benchmarks/bench_history_index.py --history-rows 1000000
+
+The query plan of the history queryset is saved in the extra_info of every read benchmark.
+'''
+import datetime
+import pytest
+from django.db import connection, models
+from currencyData.history import load_pair_history
+from currencyData.models import CurrencyExchangeRate
+from currencyData.services import save_historical_data
+from bench_api import currency_pairs
+
+PAIRS = 200
+FIRST_DAY = datetime.date(2002, 1, 2)
+
+PAIR_INDEX = models.Index(fields=['currency_exchange_pair'], name='bench_currency_exchange_pair')
+
+
+def history_queryset(pair, date_from, date_to):
+    # the queryset load_pair_history runs
+    return (
+        CurrencyExchangeRate.objects
+        .filter(currency_exchange_pair=pair, currency_exchange_date__isnull=False)
+        .filter(currency_exchange_date__gte=date_from, currency_exchange_date__lte=date_to)
+        .order_by('currency_exchange_date')
+        .values_list('currency_exchange_date', 'currency_exchange_rate')
+    )
+
+
+@pytest.fixture(params=['before', 'after'])
+def schema(request):
+    '''
+    Yields the schema name, "before" replaces the unique constraint by a plain pair index for the test.
+    '''
+    constraint = next(
+        constraint for constraint in CurrencyExchangeRate._meta.constraints
+        if constraint.name == 'unique_currency_exchange_pair_date'
+    )
+    if request.param == 'after':
+        yield request.param
+        return
+    # the tests run outside of a transaction, SQLite cannot rebuild a table inside of one
+    with connection.schema_editor() as editor:
+        editor.remove_constraint(CurrencyExchangeRate, constraint)
+        editor.add_index(CurrencyExchangeRate, PAIR_INDEX)
+    try:
+        yield request.param
+    finally:
+        with connection.schema_editor() as editor:
+            editor.remove_index(CurrencyExchangeRate, PAIR_INDEX)
+            editor.add_constraint(CurrencyExchangeRate, constraint)
+
+
+@pytest.fixture
+def history(schema, history_rows):
+    '''
+    Fills the table with history_rows rows of PAIRS pairs, one row per pair and day.
+
+    :return: tuple (pairs, last stored day).
+    '''
+    pairs = currency_pairs(PAIRS)
+    CurrencyExchangeRate.objects.bulk_create(
+        (
+            CurrencyExchangeRate(
+                currency_exchange_pair=pairs[row % PAIRS],
+                currency_exchange_rate=1 + row % 1000 / 1000,
+                currency_exchange_date=FIRST_DAY + datetime.timedelta(days=row // PAIRS),
+            )
+            for row in range(history_rows)
+        ),
+        batch_size=5000,
+    )
+    return pairs, FIRST_DAY + datetime.timedelta(days=(history_rows - 1) // PAIRS)
+
+
+@pytest.mark.django_db(transaction=True)
+def test_load_pair_history(benchmark, schema, history, history_rows):
+    pairs, last_day = history
+    pair = pairs[PAIRS // 2]
+    first_day = last_day - datetime.timedelta(days=365)
+
+    dates, rates = benchmark(load_pair_history, pair, first_day, last_day)
+
+    benchmark.extra_info.update(
+        schema=schema, rows=history_rows, plan=history_queryset(pair, first_day, last_day).explain(),
+    )
+    assert len(dates) == min(366, (last_day - FIRST_DAY).days + 1)
+
+
+@pytest.mark.django_db(transaction=True)
+def test_save_historical_data(benchmark, schema, history, history_rows):
+    pairs, last_day = history
+    # a sync of the last stored day and the next one, half of the rows are already stored
+    days = [last_day, last_day + datetime.timedelta(days=1)]
+    data = [(pair, day, 1.0) for day in days for pair in pairs]
+
+    def rollback():
+        CurrencyExchangeRate.objects.filter(currency_exchange_date=days[1]).delete()
+
+    saved = benchmark.pedantic(save_historical_data, args=(data,), setup=rollback, rounds=20)
+
+    benchmark.extra_info.update(schema=schema, rows=history_rows)
+    assert saved == PAIRS
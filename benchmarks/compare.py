@@ -0,0 +1,82 @@
+'''
+Compares two benchmark result files (pytest benchmarks --benchmark-json=...) and flags regressions.
+
+    git checkout main && pytest benchmarks --benchmark-json=base.json
+    git checkout feature && pytest benchmarks --benchmark-json=head.json
+    python benchmarks/compare.py base.json head.json --threshold 10
+
+Besides the median time of every benchmark the numbers saved in extra_info are compared (latency percentiles,
+throughput, peak memory). The script exits with status 1 when any of them got worse by more than the threshold.
+'''
+import argparse
+import json
+import sys
+
+# metrics for which a bigger value is better, all other metrics should go down
+HIGHER_IS_BETTER = {'requests_per_second'}
+# extra_info values which describe the benchmark and are not compared
+PARAMETERS = {'rows', 'pairs', 'errors'}
+
+
+def load_metrics(path):
+    '''
+    :return: dict, { benchmark name: { metric: value } }
+    '''
+    with open(path) as file:
+        results = json.load(file)
+
+    metrics = {}
+    for benchmark in results['benchmarks']:
+        values = {'median_s': benchmark['stats']['median']}
+        values.update(
+            (name, value) for name, value in benchmark.get('extra_info', {}).items()
+            if name not in PARAMETERS and isinstance(value, (int, float))
+        )
+        metrics[benchmark['name']] = values
+    return metrics
+
+
+def compare(base, head, threshold):
+    '''
+    :return: list of dicts with the change of every metric present in both results, in percent.
+    '''
+    changes = []
+    for name in sorted(base.keys() & head.keys()):
+        for metric in sorted(base[name].keys() & head[name].keys()):
+            before, after = base[name][metric], head[name][metric]
+            if not before:
+                continue
+            change = (after - before) / before * 100
+            worse = -change if metric in HIGHER_IS_BETTER else change
+            changes.append({
+                'benchmark': name, 'metric': metric, 'base': before, 'head': after,
+                'change_percent': change, 'regression': worse > threshold,
+            })
+    return changes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('base', help='results of the reference commit')
+    parser.add_argument('head', help='results of the compared commit')
+    parser.add_argument('--threshold', type=float, default=10.0, help='allowed change in percent (default: 10)')
+    parser.add_argument('--json', action='store_true', help='print the comparison as JSON')
+    args = parser.parse_args()
+
+    changes = compare(load_metrics(args.base), load_metrics(args.head), args.threshold)
+    regressions = [change for change in changes if change['regression']]
+
+    if args.json:
+        print(json.dumps({'threshold': args.threshold, 'changes': changes}, indent=2))
+    else:
+        for change in changes:
+            flag = 'REGRESSION' if change['regression'] else ''
+            print(f"{change['benchmark']:<50} {change['metric']:<20} {change['base']:>14.6g} {change['head']:>14.6g} "
+                  f"{change['change_percent']:>+8.1f}% {flag}")
+        print(f'{len(regressions)} regression(s) above {args.threshold}%')
+
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,34 @@
+import pytest
+from currencyData.tasks import update_pair_history
+# the benchmarks run with the same local cache, fresh rates and stub NBP server as the tests
+from tests.conftest import fresh_worker, local_settings, nbp_server  # noqa: F401
+
+# rows exported by the generate_excel_currencies benchmark, --export-rows=10000,100000,1000000 for the full run
+DEFAULT_EXPORT_ROWS = '10000,100000'
+# rows stored before the history index benchmarks, --history-rows=1000000 for the full run
+DEFAULT_HISTORY_ROWS = 100000
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        '--export-rows', default=DEFAULT_EXPORT_ROWS,
+        help='comma separated row counts of the export benchmark (default: %(default)s)',
+    )
+    parser.addoption(
+        '--history-rows', type=int, default=DEFAULT_HISTORY_ROWS,
+        help='rows stored before the history index benchmarks (default: %(default)s)',
+    )
+
+
+def pytest_generate_tests(metafunc):
+    if 'export_rows' in metafunc.fixturenames:
+        rows = [int(count) for count in metafunc.config.getoption('export_rows').split(',')]
+        metafunc.parametrize('export_rows', rows)
+    if 'history_rows' in metafunc.fixturenames:
+        metafunc.parametrize('history_rows', [metafunc.config.getoption('history_rows')])
+
+
+@pytest.fixture(autouse=True)
+def no_broker(monkeypatch):
+    """Keep the Celery broker out of the measurements, history refresh tasks are not sent."""
+    monkeypatch.setattr(update_pair_history, 'apply_async', lambda *args, **kwargs: None)
@@ -0,0 +1,156 @@
+'''
+Asyncio HTTP load driver used to compare the WSGI and ASGI rate endpoints.
+
+Every connection is a keep-alive HTTP/1.1 client sending requests one after another, so --connections is the
+number of concurrent clients. Start the servers first, e.g.:
+
+    gunicorn currencyExchange.wsgi:application -w 4 -b 127.0.0.1:8000
+    uvicorn currencyExchange.asgi:application --workers 4 --port 8001
+
+and compare them:
+
+    python benchmarks/loadtest.py --connections 1000 --duration 30 \
+        --target wsgi=http://127.0.0.1:8000/currency/EUR/USD/ \
+        --target asgi=http://127.0.0.1:8001/async/currency/EUR/USD/
+
+Results (throughput and latency percentiles in milliseconds) are printed as JSON.
+'''
+import argparse
+import asyncio
+import json
+import time
+from urllib.parse import urlsplit
+
+
+class HTTPConnection:
+    '''
+    Minimal keep-alive HTTP/1.1 client, enough for JSON responses with Content-Length or chunked bodies.
+    '''
+
+    def __init__(self, url):
+        parts = urlsplit(url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.reader = None
+        self.writer = None
+
+    async def request(self, method, path, body=b'', headers=None):
+        reused = self.writer is not None
+        if not reused:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+
+        head = [f'{method} {path} HTTP/1.1', f'Host: {self.host}:{self.port}', f'Content-Length: {len(body)}']
+        head += [f'{name}: {value}' for name, value in (headers or {}).items()]
+        self.writer.write(('\r\n'.join(head) + '\r\n\r\n').encode() + body)
+        await self.writer.drain()
+
+        status_line = await self.reader.readline()
+        if not status_line and reused:
+            # the server closed the idle keep-alive connection, send the request again on a new one
+            await self.close()
+            return await self.request(method, path, body, headers)
+        status = int(status_line.split()[1])
+        response_headers = {}
+        while (line := await self.reader.readline()) not in (b'\r\n', b''):
+            name, _, value = line.decode().partition(':')
+            response_headers[name.strip().lower()] = value.strip()
+
+        if response_headers.get('transfer-encoding') == 'chunked':
+            content = b''
+            while (size := int((await self.reader.readline()).strip(), 16)):
+                content += await self.reader.readexactly(size)
+                await self.reader.readline()
+            await self.reader.readline()
+        else:
+            content = await self.reader.readexactly(int(response_headers.get('content-length', 0)))
+
+        if response_headers.get('connection') == 'close' or status_line.startswith(b'HTTP/1.0'):
+            await self.close()
+        return status, response_headers, content
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.reader = self.writer = None
+
+
+def percentiles(latencies, points=(50, 90, 99)):
+    ordered = sorted(latencies)
+    if not ordered:
+        return {f'p{point}': None for point in points}
+    return {f'p{point}': ordered[min(len(ordered) - 1, int(len(ordered) * point / 100))] * 1000 for point in points}
+
+
+async def run_load(url, connections=100, duration=10.0, requests=None, method='GET', body=b'', headers=None):
+    '''
+    Sends requests to the url from many concurrent keep-alive connections.
+
+    :return: dict with requests, errors, requests per second and latency percentiles (ms).
+    '''
+    path = urlsplit(url).path or '/'
+    if urlsplit(url).query:
+        path += '?' + urlsplit(url).query
+    latencies = []
+    errors = 0
+    remaining = [requests]
+    deadline = time.perf_counter() + duration
+
+    async def client():
+        nonlocal errors
+        connection = HTTPConnection(url)
+        try:
+            while time.perf_counter() < deadline:
+                if remaining[0] is not None:
+                    if remaining[0] <= 0:
+                        break
+                    remaining[0] -= 1
+                started = time.perf_counter()
+                try:
+                    status, _, _ = await connection.request(method, path, body, headers)
+                except (OSError, asyncio.IncompleteReadError, ValueError, IndexError):
+                    errors += 1
+                    await connection.close()
+                    continue
+                latencies.append(time.perf_counter() - started)
+                if status >= 400:
+                    errors += 1
+        finally:
+            await connection.close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(connections)))
+    elapsed = time.perf_counter() - started
+
+    return {
+        'url': url,
+        'connections': connections,
+        'requests': len(latencies),
+        'errors': errors,
+        'seconds': elapsed,
+        'requests_per_second': len(latencies) / elapsed if elapsed else 0,
+        'latency_ms': percentiles(latencies),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--target', action='append', required=True, help='name=url, can be given many times')
+    parser.add_argument('--connections', type=int, default=100)
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--requests', type=int, default=None, help='stop after this many requests per target')
+    parser.add_argument('--method', default='GET')
+    parser.add_argument('--body', default='', help='request body, e.g. a JSON batch')
+    args = parser.parse_args()
+
+    headers = {'Content-Type': 'application/json'} if args.body else None
+    results = {}
+    for target in args.target:
+        name, _, url = target.partition('=') if '=' in target.split('://')[0] else ('', '', target)
+        results[name or url] = asyncio.run(run_load(
+            url, args.connections, args.duration, args.requests, args.method, args.body.encode(), headers,
+        ))
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,10 @@
+from django import forms
 from django.contrib import admin
 from django.urls import path
 from rangefilter.filters import DateRangeFilter
 from .models import CurrencyExchangeRate
 from django.http import HttpResponse
-from .services import generate_excel_currencies
+from .services import generate_excel_currencies, generate_csv_currencies, EXCEL_MAX_ROWS
 
 
 
@@ -21,18 +22,51 @@ class CurrencyExchangeRateAdmin(admin.ModelAdmin):
         return custom_urls + urls
 
     def export_currencies_pair(self, request):
-        pair = request.GET.get('currency_exchange_pair')
+        '''
+        Exports the filtered history to Excel (default) or to CSV (?export_format=csv).
 
-        if not pair:
+        One or more pairs can be chosen (?currency_exchange_pair=EURUSD,USDGBP), the date range filter can be used
+        with or without pairs to export every pair in that range.
+        '''
+        pairs = [
+            pair.strip().upper()
+            for value in request.GET.getlist('currency_exchange_pair') + request.GET.getlist('currency_exchange_pair__in')
+            for pair in value.split(',') if pair.strip()
+        ]
+        date_field = forms.DateField(required=False)
+        try:
+            date_from = date_field.clean(request.GET.get('currency_exchange_date__range__gte'))
+            date_to = date_field.clean(request.GET.get('currency_exchange_date__range__lte'))
+        except forms.ValidationError:
+            date_from = date_to = None
+
+        if not pairs and not (date_from or date_to):
             return HttpResponse("If you want to Export history to Excel first you have to choose <b>currency pair</b> by clicking for example <b>EURUSD</b> in FILTER"
-                                " <a href='/admin/currencyData/currencyexchangerate/'>Go back</a>", content_type="text/html")
+                                " or choose a <b>date range</b> <a href='/admin/currencyData/currencyexchangerate/'>Go back</a>", content_type="text/html")
+
+        queryset = CurrencyExchangeRate.objects.all()
+        if pairs:
+            queryset = queryset.filter(currency_exchange_pair__in=pairs)
+        if date_from:
+            queryset = queryset.filter(currency_exchange_date__gte=date_from)
+        if date_to:
+            queryset = queryset.filter(currency_exchange_date__lte=date_to)
+
+        # the name goes to the file name and the worksheet title, only plain pair codes are used for it
+        name = '_'.join(pairs) if 0 < len(pairs) <= 3 and all(pair.isalnum() for pair in pairs) else 'currencies'
 
-        queryset = CurrencyExchangeRate.objects.filter(currency_exchange_pair=pair)
+        if request.GET.get('export_format') == 'csv':
+            return generate_csv_currencies(queryset, name)
 
-        if not queryset.exists():
-            return HttpResponse(f"There is no pair of currencies like: {pair} <a href='/admin/currencyData/currencyexchangerate/'>GO BACK</a>")
+        if queryset.count() > EXCEL_MAX_ROWS:
+            return HttpResponse(f"The chosen history has more rows than an Excel sheet can hold ({EXCEL_MAX_ROWS}), choose fewer"
+                                " pairs, a shorter date range or the CSV export <a href='/admin/currencyData/currencyexchangerate/'>GO BACK</a>",
+                                status=400)
 
+        response = generate_excel_currencies(queryset, name)
+        if response is None:
+            return HttpResponse(f"There is no pair of currencies like: {', '.join(pairs) or name} in chosen dates <a href='/admin/currencyData/currencyexchangerate/'>GO BACK</a>")
 
-        return generate_excel_currencies(queryset,pair)
+        return response
 
 
@@ -0,0 +1,231 @@
+import functools
+import numpy
+from .models import CurrencyDailyRate
+from .series import load_currency_series, get_series_version
+
+# Default rolling window (publication days) and the bounds accepted by the analytics endpoint
+DEFAULT_WINDOW = 20
+MIN_WINDOW = 2
+MAX_WINDOW = 260
+
+# publication days per year, used to annualize the volatility of daily returns
+TRADING_DAYS_PER_YEAR = 252
+
+# number of analytics results kept in memory by every worker
+ANALYTICS_CACHE_SIZE = 128
+
+
+class SeriesMatrix:
+    '''
+    Dense currencies x dates matrix of the stored PLN rates, days without a fixing of a currency are NaN.
+
+    The history of any pair is one row divided by another, so the rows of many pairs are derived with a single
+    broadcast division.
+    '''
+
+    def __init__(self, series):
+        self.codes = sorted(series)
+        self.index = {code: position for position, code in enumerate(self.codes)}
+        self.dates = numpy.array(sorted(set().union(*series.values())), dtype='datetime64[D]')
+        self.values = numpy.full((len(self.codes), len(self.dates)), numpy.nan)
+        for code, rates in series.items():
+            if rates:
+                columns = numpy.searchsorted(self.dates, numpy.array(list(rates), dtype='datetime64[D]'))
+                self.values[self.index[code], columns] = list(rates.values())
+        self.values.setflags(write=False)
+        # { code: (dates, rates) } fixings of single currencies read by as_of, filled on first use
+        self._fixings = {}
+
+    def __contains__(self, code):
+        return code in self.index
+
+    def columns(self, date_from=None, date_to=None):
+        start = numpy.searchsorted(self.dates, numpy.datetime64(date_from, 'D')) if date_from else 0
+        end = numpy.searchsorted(self.dates, numpy.datetime64(date_to, 'D'), side='right') if date_to else len(self.dates)
+        return slice(start, end)
+
+    def fixings(self, code):
+        '''
+        Sorted dates and rates of the days on which the currency has a fixing.
+        '''
+        fixings = self._fixings.get(code)
+        if fixings is None:
+            row = self.values[self.index[code]]
+            published = ~numpy.isnan(row)
+            fixings = self._fixings[code] = (self.dates[published], row[published])
+        return fixings
+
+    def as_of(self, codes, dates):
+        '''
+        Rates of the currencies effective on the dates: the fixing of the date or of the last day before it with a
+        fixing (weekends, holidays). Every currency is resolved with one binary search over its sorted dates.
+
+        :param codes: sequence of currency codes.
+        :param dates: sequence of dates of the same length.
+
+        :return: tuple (rates, fixing_dates) of numpy arrays, NaN / NaT when there is no fixing on or before a date
+                 or the currency has no stored series.
+        '''
+        codes = numpy.asarray(codes)
+        dates = numpy.asarray(dates, dtype='datetime64[D]')
+        rates = numpy.full(len(codes), numpy.nan)
+        fixing_dates = numpy.full(len(codes), numpy.datetime64('NaT'), dtype='datetime64[D]')
+        for code in numpy.unique(codes).tolist():
+            if code not in self:
+                continue
+            lookups = numpy.flatnonzero(codes == code)
+            code_dates, code_rates = self.fixings(code)
+            positions = numpy.searchsorted(code_dates, dates[lookups], side='right') - 1
+            found = positions >= 0
+            rates[lookups[found]] = code_rates[positions[found]]
+            fixing_dates[lookups[found]] = code_dates[positions[found]]
+        return rates, fixing_dates
+
+    def pairs(self, pairs, columns=slice(None)):
+        '''
+        pairs x dates matrix of cross rates, NaN where one of the currencies has no fixing.
+        '''
+        base = self.values[[self.index[pair[:3]] for pair in pairs], columns]
+        quote = self.values[[self.index[pair[3:]] for pair in pairs], columns]
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            rates = base / quote
+        rates[~numpy.isfinite(rates)] = numpy.nan
+        return rates
+
+
+@functools.lru_cache(maxsize=2)
+def _series_matrix(version):
+    # version is part of the cache key only, a new series version builds a new matrix
+    codes = set(CurrencyDailyRate.objects.values_list('code', flat=True).distinct()) | {'PLN'}
+    return SeriesMatrix(load_currency_series(codes))
+
+
+def get_series_matrix():
+    '''
+    Returns the currencies x dates matrix of all stored series, built once per series version.
+
+    :return: SeriesMatrix
+    '''
+    return _series_matrix(get_series_version())
+
+
+def rolling_sum(values, window):
+    '''
+    Sums of the last window values of every row, NaN until a row has window values.
+    '''
+    sums = numpy.full(values.shape, numpy.nan)
+    if values.shape[1] >= window:
+        cumulative = numpy.cumsum(values, axis=1)
+        sums[:, window - 1] = cumulative[:, window - 1]
+        sums[:, window:] = cumulative[:, window:] - cumulative[:, :-window]
+    return sums
+
+
+def rolling_mean_std(values, window):
+    '''
+    Rolling mean and sample standard deviation of every row of a pairs x dates matrix in one pass of cumulative
+    sums. A window which contains a NaN gives NaN.
+
+    :return: tuple (means, stds) of numpy arrays shaped like values.
+    '''
+    missing = numpy.isnan(values)
+    # every row is centered on its mean, the cumulative sums of squares do not lose precision
+    with numpy.errstate(invalid='ignore'):
+        offsets = numpy.nanmean(numpy.where(missing.all(axis=1, keepdims=True), 0, values), axis=1, keepdims=True)
+    centered = numpy.where(missing, 0, values - offsets)
+
+    counts = rolling_sum(missing.astype(numpy.float64), window)
+    sums = rolling_sum(centered, window)
+    squares = rolling_sum(centered ** 2, window)
+    complete = counts == 0
+
+    means = numpy.where(complete, sums / window + offsets, numpy.nan)
+    variance = numpy.maximum(squares - sums ** 2 / window, 0) / (window - 1)
+    stds = numpy.where(complete, numpy.sqrt(variance), numpy.nan)
+    return means, stds
+
+
+def max_drawdowns(values):
+    '''
+    Largest fall from a running maximum of every row, as a fraction of the maximum (e.g. -0.12).
+    '''
+    peaks = numpy.fmax.accumulate(numpy.where(numpy.isnan(values), -numpy.inf, values), axis=1)
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        drawdowns = values / peaks - 1
+    drawdowns[~numpy.isfinite(drawdowns)] = numpy.nan
+    return numpy.array([numpy.nanmin(row) if not numpy.isnan(row).all() else numpy.nan for row in drawdowns])
+
+
+def correlation_matrix(values):
+    '''
+    Correlation of the daily log returns of the rows, on the days on which all rows have a return.
+    '''
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        returns = numpy.diff(numpy.log(values), axis=1)
+    returns = returns[:, numpy.isfinite(returns).all(axis=0)]
+    if len(values) == 0 or returns.shape[1] < 2:
+        return numpy.full((len(values), len(values)), numpy.nan)
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        return numpy.atleast_2d(numpy.corrcoef(returns))
+
+
+def json_list(values):
+    '''
+    Converts a numpy array into nested lists with None instead of NaN, valid JSON.
+    '''
+    values = numpy.asarray(values, dtype=object)
+    values[numpy.isnan(values.astype(numpy.float64))] = None
+    return values.tolist()
+
+
+@functools.lru_cache(maxsize=ANALYTICS_CACHE_SIZE)
+def _pair_analytics(pairs, date_from, date_to, window, version):
+    matrix = _series_matrix(version)
+    columns = matrix.columns(date_from, date_to)
+    rates = matrix.pairs(pairs, columns)
+
+    means, stds = rolling_mean_std(rates, window)
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        returns = numpy.diff(numpy.log(rates), axis=1)
+    volatility = numpy.full(rates.shape, numpy.nan)
+    volatility[:, 1:] = rolling_mean_std(returns, window)[1] * numpy.sqrt(TRADING_DAYS_PER_YEAR)
+    drawdowns = max_drawdowns(rates)
+
+    # currencies of the pairs against PLN, PLN itself has no returns to correlate
+    currencies = sorted({code for pair in pairs for code in (pair[:3], pair[3:])} - {'PLN'})
+    correlations = correlation_matrix(matrix.values[[matrix.index[code] for code in currencies], columns])
+
+    return {
+        'window': window,
+        'dates': numpy.datetime_as_string(matrix.dates[columns], unit='D').tolist(),
+        'pairs': {
+            pair: {
+                'rates': json_list(rates[row]),
+                'rolling_mean': json_list(means[row]),
+                'rolling_std': json_list(stds[row]),
+                'volatility': json_list(volatility[row]),
+                'max_drawdown': json_list(drawdowns[row]),
+            }
+            for row, pair in enumerate(pairs)
+        },
+        'correlation': {'currencies': currencies, 'matrix': json_list(correlations)},
+    }
+
+
+def pair_analytics(pairs, date_from=None, date_to=None, window=DEFAULT_WINDOW):
+    '''
+    Rolling mean, rolling standard deviation, annualized volatility of daily log returns and max drawdown of the
+    pairs, with the correlation matrix of the daily returns of their currencies against PLN.
+
+    All pairs are derived from the currencies x dates matrix with one broadcast division and the rolling statistics
+    of all of them are computed together. Results are kept in an LRU cache per series version.
+
+    :raises KeyError: when a currency has no stored series.
+    :return: dict ready to be sent as JSON, NaN values are None.
+    '''
+    version = get_series_version()
+    matrix = _series_matrix(version)
+    missing = sorted({code for pair in pairs for code in (pair[:3], pair[3:])} - set(matrix.codes))
+    if missing:
+        raise KeyError(', '.join(missing))
+    return _pair_analytics(tuple(pairs), date_from, date_to, window, version)
@@ -5,6 +5,14 @@ class CurrencydataConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'currencyData'
 
+    def ready(self):
+        # connect the signals which keep the in-memory rate matrix in sync with the Currency table
+        from . import rates
+        # connect the Celery signals which time the tasks
+        from . import metrics
+        # connect the rates_published receiver which wakes up the rate streams
+        from . import stream
+
 
 
 
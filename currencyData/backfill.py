@@ -0,0 +1,128 @@
+import datetime
+import json
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from django.conf import settings
+from django.core.cache import cache
+from .models import CurrencyDailyRate
+from .nbp import nbp_client, history_windows, DEFAULT_MAX_WORKERS
+from .series import SERIES_VERSION_KEY
+from .trading_calendar import learn_trading_days
+
+# Default number of fixings saved by one bulk insert
+DEFAULT_CHUNK_SIZE = 5000
+
+
+class Checkpoint:
+    '''
+    JSON file with the (code, window) requests whose fixings are saved, an interrupted backfill skips them when
+    it is started again. The file is replaced atomically, so it is never left half written.
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self.done = set()
+        if path and os.path.exists(path):
+            with open(path) as file:
+                self.done = set(json.load(file)['done'])
+
+    @staticmethod
+    def key(code, window):
+        return f'{code}:{window[0]}:{window[1]}'
+
+    def __contains__(self, item):
+        return self.key(*item) in self.done
+
+    def save(self, items):
+        self.done.update(self.key(*item) for item in items)
+        if not self.path:
+            return
+        temporary = f'{self.path}.tmp'
+        with open(temporary, 'w') as file:
+            json.dump({'done': sorted(self.done)}, file)
+        os.replace(temporary, self.path)
+
+
+def backfill_currency_series(codes, date_start, date_end, checkpoint=None, chunk_size=DEFAULT_CHUNK_SIZE,
+                             max_workers=None, progress=None):
+    '''
+    Fetches the daily rates of the currencies between two dates into the local series store.
+
+    The range is split into windows of MAX_RATES_DAYS days, the windows of all currencies are requested by a bounded
+    pool of threads and at most twice as many requests as threads are in flight. Fetched fixings are collected and
+    saved with one bulk insert per chunk_size rows, a window is added to the checkpoint after its rows are saved.
+
+    :param checkpoint: Checkpoint or None, windows in the checkpoint are skipped.
+    :param progress: callable(saved_rows, elapsed_seconds) called after every saved chunk.
+
+    :return: tuple (saved_rows, elapsed_seconds)
+    '''
+    checkpoint = checkpoint or Checkpoint(None)
+    requests = [
+        (code, window) for code in sorted(set(codes) - {'PLN'})
+        for window in history_windows(date_start, date_end) if (code, window) not in checkpoint
+    ]
+    max_workers = max(1, max_workers or getattr(settings, 'NBP_MAX_WORKERS', DEFAULT_MAX_WORKERS))
+
+    def fetch(request):
+        code, (start, end) = request
+        return [
+            CurrencyDailyRate(
+                code=code, rate_currency=item['bid'], rate_date=datetime.date.fromisoformat(item['effectiveDate'])
+            )
+            for item in nbp_client.rates(code, start, end, cached=False)
+        ]
+
+    started = time.perf_counter()
+    saved = 0
+    rows, fetched, published = [], [], set()
+
+    def flush():
+        nonlocal saved, rows, fetched
+        if rows:
+            CurrencyDailyRate.objects.bulk_create(rows, batch_size=1000, ignore_conflicts=True)
+            saved += len(rows)
+            published.update(row.rate_date for row in rows)
+        checkpoint.save(fetched)
+        rows, fetched = [], []
+        if progress is not None:
+            progress(saved, time.perf_counter() - started)
+
+    pending = iter(requests)
+    errors = []
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            running = {}
+            while True:
+                # after an error nothing new is requested, the running requests are finished and saved
+                while not errors and len(running) < max_workers * 2:
+                    request = next(pending, None)
+                    if request is None:
+                        break
+                    running[executor.submit(fetch, request)] = request
+                if not running:
+                    break
+                finished, unused = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    request = running.pop(future)
+                    if future.exception() is not None:
+                        errors.append(future.exception())
+                        continue
+                    rows.extend(future.result())
+                    fetched.append(request)
+                if len(rows) >= chunk_size:
+                    flush()
+        if errors:
+            raise errors[0]
+    finally:
+        try:
+            # windows fetched before an error or an interruption are saved, the next run resumes after them
+            if rows or fetched:
+                flush()
+        finally:
+            # saved fixings are published even when the backfill stops, cached series of the old version are not read
+            if saved:
+                cache.set(SERIES_VERSION_KEY, time.time_ns(), timeout=None)
+                learn_trading_days(published=published)
+    return saved, time.perf_counter() - started
@@ -0,0 +1,118 @@
+import atexit
+import logging
+import os
+import threading
+from django.conf import settings
+from django.db import close_old_connections
+from .models import CurrencyExchangeRate
+
+logger = logging.getLogger(__name__)
+
+# Defaults used when settings.py does not define TRANSACTION_BUFFER_FLUSH_INTERVAL / TRANSACTION_BUFFER_MAX_SIZE
+DEFAULT_FLUSH_INTERVAL = 5
+DEFAULT_MAX_SIZE = 500
+
+
+class TransactionBuffer:
+    '''
+    Write-behind buffer for the transactions saved by the /currency/<base>/<quote>/ endpoint.
+
+    Observations are coalesced in memory by (pair, date) and written in batches by a background thread,
+    so the response time of the endpoint does not depend on database write contention. The buffer is
+    flushed every TRANSACTION_BUFFER_FLUSH_INTERVAL seconds, as soon as it holds TRANSACTION_BUFFER_MAX_SIZE
+    pairs and when the process exits. A flush interval of 0 writes every observation immediately.
+    '''
+
+    def __init__(self):
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._pid = None
+        atexit.register(self.flush)
+
+    @property
+    def flush_interval(self):
+        return getattr(settings, 'TRANSACTION_BUFFER_FLUSH_INTERVAL', DEFAULT_FLUSH_INTERVAL)
+
+    @property
+    def max_size(self):
+        return getattr(settings, 'TRANSACTION_BUFFER_MAX_SIZE', DEFAULT_MAX_SIZE)
+
+    def add(self, pair, date, rate, currency_id):
+        '''
+        Records an observation of a currency pair, the latest rate of a (pair, date) wins.
+        '''
+        with self._lock:
+            self._pending[(pair, date)] = (rate, currency_id)
+            size = len(self._pending)
+
+        if not self.flush_interval:
+            self.flush()
+            return
+
+        self._ensure_worker()
+        if size >= self.max_size:
+            self._wakeup.set()
+
+    def flush(self):
+        '''
+        Writes all pending observations with one bulk upsert.
+
+        :return: int, number of written rows.
+        '''
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+
+        try:
+            objects = [
+                CurrencyExchangeRate(
+                    currency_id=currency_id,
+                    currency_exchange_pair=pair,
+                    currency_exchange_rate=rate,
+                    currency_exchange_date=date,
+                )
+                for (pair, date), (rate, currency_id) in pending.items()
+            ]
+            # the (pair, date) unique constraint turns the insert into an upsert, the latest rate of a day wins
+            CurrencyExchangeRate.objects.bulk_create(
+                objects,
+                batch_size=self.max_size,
+                update_conflicts=True,
+                unique_fields=['currency_exchange_pair', 'currency_exchange_date'],
+                update_fields=['currency_exchange_rate'],
+            )
+        except Exception:
+            # keep the observations for the next flush, newer ones already buffered take precedence
+            with self._lock:
+                for key, value in pending.items():
+                    self._pending.setdefault(key, value)
+            raise
+        return len(objects)
+
+    def _ensure_worker(self):
+        # the thread is started lazily, so every forked web worker gets its own one
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='transaction-buffer', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Could not flush the transaction buffer')
+            finally:
+                close_old_connections()
+
+
+transaction_buffer = TransactionBuffer()
@@ -0,0 +1,206 @@
+import datetime
+import functools
+import numpy
+from django.conf import settings
+from .models import CurrencyExchangeRate
+from .series import load_currency_series, get_series_version
+from .analytics import get_series_matrix
+from .trading_calendar import today, get_trading_calendar
+
+INTERVALS = ('day', 'week', 'month')
+
+# number of derived pair series kept in memory by every worker
+PAIR_CACHE_SIZE = 256
+
+# Default number of publication days the effective rate of an as-of lookup may be older than the latest fixing date
+# of the requested date, when settings.py does not define AS_OF_MAX_STALE_DAYS
+DEFAULT_AS_OF_MAX_STALE_DAYS = 3
+
+
+def load_pair_history(pair, date_from=None, date_to=None):
+    '''
+    Reads the stored history of a currency pair with one indexed query.
+
+    :return: tuple (dates, rates) of numpy arrays sorted by date, dates as datetime64[D].
+    '''
+    queryset = CurrencyExchangeRate.objects.filter(currency_exchange_pair=pair, currency_exchange_date__isnull=False)
+    if date_from:
+        queryset = queryset.filter(currency_exchange_date__gte=date_from)
+    if date_to:
+        queryset = queryset.filter(currency_exchange_date__lte=date_to)
+
+    rows = list(queryset.order_by('currency_exchange_date').values_list('currency_exchange_date', 'currency_exchange_rate'))
+    dates = numpy.array([date for date, rate in rows], dtype='datetime64[D]')
+    rates = numpy.array([rate for date, rate in rows], dtype=numpy.float64)
+    return dates, rates
+
+
+def currency_arrays(series):
+    '''
+    Converts a { date: rate } series into sorted numpy arrays (dates as datetime64[D], rates as float64).
+    '''
+    dates = numpy.array(list(series), dtype='datetime64[D]')
+    rates = numpy.array(list(series.values()), dtype=numpy.float64)
+    order = numpy.argsort(dates, kind='stable')
+    return dates[order], rates[order]
+
+
+def divide_aligned(base_dates, base_rates, quote_dates, quote_rates):
+    '''
+    Divides two sorted series on the dates both of them have, days without a fixing of one currency
+    (NBP holidays, missing data) are left out instead of being filled.
+
+    :return: tuple (dates, rates) of numpy arrays.
+    '''
+    dates, base_index, quote_index = numpy.intersect1d(base_dates, quote_dates, assume_unique=True, return_indices=True)
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        rates = base_rates[base_index] / quote_rates[quote_index]
+    valid = numpy.isfinite(rates)
+    return dates[valid], rates[valid]
+
+
+@functools.lru_cache(maxsize=PAIR_CACHE_SIZE)
+def _derived_pair_series(base, quote, version):
+    # version is part of the cache key only, a new series version makes old entries unreachable
+    series = load_currency_series({base, quote})
+    dates, rates = divide_aligned(*currency_arrays(series[base]), *currency_arrays(series[quote]))
+    dates.setflags(write=False)
+    rates.setflags(write=False)
+    return dates, rates
+
+
+def derived_pair_history(pair, date_from=None, date_to=None):
+    '''
+    Derives the history of any currency pair from the stored PLN series of both currencies, no pair rows have to
+    be materialized. The full series of hot pairs are kept in an LRU cache per series version.
+
+    :return: tuple (dates, rates) of numpy arrays sorted by date.
+    '''
+    dates, rates = _derived_pair_series(pair[:3], pair[3:], get_series_version())
+    start = numpy.searchsorted(dates, numpy.datetime64(date_from, 'D')) if date_from else 0
+    end = numpy.searchsorted(dates, numpy.datetime64(date_to, 'D'), side='right') if date_to else len(dates)
+    return dates[start:end], rates[start:end]
+
+
+def resample_ohlc(dates, rates, interval='day'):
+    '''
+    Aggregates a sorted daily series into open/high/low/close values per day, week (starting on Monday) or month.
+
+    :return: dict of numpy arrays { 'dates': period starts, 'open': ..., 'high': ..., 'low': ..., 'close': ... }
+    '''
+    if interval == 'week':
+        # 1970-01-01 was a Thursday, shifting by 3 days makes Monday the first day of every week
+        periods = dates - (dates.astype(numpy.int64) + 3) % 7
+    elif interval == 'month':
+        periods = dates.astype('datetime64[M]').astype('datetime64[D]')
+    else:
+        periods = dates
+
+    if not len(rates):
+        empty = numpy.array([], dtype=numpy.float64)
+        return {'dates': periods, 'open': empty, 'high': empty, 'low': empty, 'close': empty}
+
+    starts = numpy.flatnonzero(numpy.r_[True, periods[1:] != periods[:-1]])
+    ends = numpy.r_[starts[1:], len(rates)] - 1
+    return {
+        'dates': periods[starts],
+        'open': rates[starts],
+        'high': numpy.maximum.reduceat(rates, starts),
+        'low': numpy.minimum.reduceat(rates, starts),
+        'close': rates[ends],
+    }
+
+
+def pair_history(pair, date_from=None, date_to=None, interval='day'):
+    '''
+    Returns the history of a currency pair as compact columnar arrays, ready to be sent as JSON.
+
+    The history is derived from the stored currency series, pairs whose currencies have no stored series fall back
+    to the materialized CurrencyExchangeRate rows.
+    '''
+    dates, rates = derived_pair_history(pair, date_from, date_to)
+    if not len(dates):
+        dates, rates = load_pair_history(pair, date_from, date_to)
+    ohlc = resample_ohlc(dates, rates, interval)
+    return {
+        'currency_pair': pair,
+        'interval': interval,
+        'dates': numpy.datetime_as_string(ohlc['dates'], unit='D').tolist(),
+        'open': ohlc['open'].tolist(),
+        'high': ohlc['high'].tolist(),
+        'low': ohlc['low'].tolist(),
+        'close': ohlc['close'].tolist(),
+    }
+
+
+def pair_rates_as_of(pairs, dates):
+    '''
+    Rates of the pairs effective on the dates, derived from the stored PLN series. A date without a fixing
+    (weekend, holiday) gets the rate of the previous fixing, the lookups of every currency are one binary search
+    over its sorted dates.
+
+    :return: tuple (rates, effective_dates) of numpy arrays, NaN / NaT when one of the currencies has no fixing on
+             or before the date. The effective date is the older of the fixing dates of both currencies.
+    '''
+    matrix = get_series_matrix()
+    base_rates, base_dates = matrix.as_of([pair[:3] for pair in pairs], dates)
+    quote_rates, quote_dates = matrix.as_of([pair[3:] for pair in pairs], dates)
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        rates = base_rates / quote_rates
+    rates[~numpy.isfinite(rates)] = numpy.nan
+    return rates, numpy.minimum(base_dates, quote_dates)
+
+
+def convert_as_of(items):
+    '''
+    Resolves many (pair, date) lookups at once, e.g. the rates of all invoices of a billing run.
+
+    :param items: list of dicts { 'pair': 'EURUSD', 'date': '2024-12-07', 'amount': 100 }, amount is optional.
+
+    :return: list of results in the order of items. Items which can not be resolved get an 'error' key instead of
+             failing the whole batch: future dates and dates whose last stored fixing is more than
+             AS_OF_MAX_STALE_DAYS publication days older than the fixing of the date (the series is not synced).
+    '''
+    results = []
+    valid = []
+    last_day = today()
+    for item in items:
+        if not isinstance(item, dict):
+            results.append({'error': 'Every item has to be an object with pair, date and amount'})
+            continue
+
+        pair = str(item.get('pair', '')).upper()
+        result = {'currency_pair': pair, 'date': item.get('date')}
+        results.append(result)
+        try:
+            date = datetime.date.fromisoformat(str(item.get('date')))
+            amount = float(item.get('amount', 1))
+        except (TypeError, ValueError):
+            result['error'] = 'The date has to be in the format YYYY-MM-DD and the amount a number'
+            continue
+        if date > last_day:
+            result['error'] = 'The date can not be in the future'
+        elif len(pair) != 6 or not pair.isalpha():
+            result['error'] = f"The pair '{pair}' is not a currency pair, e.g. EURUSD"
+        else:
+            valid.append((result, pair, date, amount))
+
+    if valid:
+        results_valid, pairs, dates, amounts = zip(*valid)
+        rates, effective_dates = pair_rates_as_of(pairs, dates)
+        converted = rates * numpy.array(amounts)
+        max_stale = getattr(settings, 'AS_OF_MAX_STALE_DAYS', DEFAULT_AS_OF_MAX_STALE_DAYS)
+        stale = effective_dates < get_trading_calendar().business_days_back_many(max_stale, dates)
+        for result, amount, rate, effective_date, is_stale, converted_amount in zip(
+            results_valid, amounts, rates.tolist(), effective_dates.tolist(), stale.tolist(), converted.tolist()
+        ):
+            if numpy.isnan(rate):
+                result['error'] = 'There is no stored rate of the pair on or before the date'
+            elif is_stale:
+                result['error'] = (f'The last stored rate of the pair is from {effective_date}, more than '
+                                   f'{max_stale} publication days before the date')
+            else:
+                result.update(exchange_rate=rate, effective_date=effective_date, amount=amount,
+                              converted_amount=converted_amount)
+    return results
+
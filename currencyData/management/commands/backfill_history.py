@@ -0,0 +1,61 @@
+import datetime
+from django.core.management.base import BaseCommand, CommandError
+from currencyData.backfill import Checkpoint, backfill_currency_series, DEFAULT_CHUNK_SIZE
+from currencyData.models import Currency
+from currencyData.nbp import NBPError
+from currencyData.trading_calendar import FIRST_DAY, latest_fixing_date
+
+
+def date_argument(value):
+    try:
+        return datetime.date.fromisoformat(value)
+    except ValueError:
+        raise CommandError(f'Enter a date in the format YYYY-MM-DD, not {value}')
+
+
+class Command(BaseCommand):
+    help = 'FETCH DAILY RATES OF MANY YEARS FROM NBP API ADD TO THE SERIES STORE'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='date_start', type=date_argument, default=FIRST_DAY,
+                            help=f'First day (YYYY-MM-DD), default {FIRST_DAY}')
+        parser.add_argument('--to', dest='date_end', type=date_argument, default=None,
+                            help='Last day (YYYY-MM-DD), default the latest fixing date')
+        parser.add_argument('--codes', default='',
+                            help='Comma separated currency codes, default all loaded currencies')
+        parser.add_argument('--checkpoint', default='backfill_history.json',
+                            help='JSON file with the fetched windows, an interrupted run resumes from it')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                            help='Rows saved by one bulk insert')
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Concurrent NBP requests, default NBP_MAX_WORKERS')
+
+    def handle(self, *args, **options):
+        date_start, date_end = options['date_start'], options['date_end'] or latest_fixing_date()
+        if date_start > date_end:
+            raise CommandError('--from must not be after --to')
+
+        codes = [code.strip().upper() for code in options['codes'].split(',') if code.strip()]
+        if not codes:
+            codes = list(Currency.objects.exclude(code='PLN').values_list('code', flat=True))
+        if not codes:
+            raise CommandError('There are no currencies, run load_rates or pass --codes')
+
+        def progress(saved, elapsed):
+            self.stdout.write(f'Saved {saved} rates ({saved / elapsed if elapsed else 0:.0f} rows/s)')
+
+        try:
+            saved, elapsed = backfill_currency_series(
+                codes, max(date_start, FIRST_DAY), date_end,
+                checkpoint=Checkpoint(options['checkpoint']),
+                chunk_size=options['chunk_size'],
+                max_workers=options['workers'],
+                progress=progress,
+            )
+        except NBPError as error:
+            raise CommandError(f'Could not fetch rates from the NBP API {error}, run the command again to resume')
+
+        self.stdout.write(
+            f'Backfilled {saved} rates of {len(codes)} currencies from {date_start} to {date_end} '
+            f'in {elapsed:.1f}s ({saved / elapsed if elapsed else 0:.0f} rows/s)'
+        )
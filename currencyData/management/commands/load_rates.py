@@ -1,18 +1,20 @@
-from django.core.management.base import BaseCommand
-from currencyData.models import Currency
-from currencyData.services import get_currency
+from django.core.management.base import BaseCommand, CommandError
+from currencyData.nbp import NBPError
+from currencyData.services import refresh_currency_rates
 
 class Command(BaseCommand):
     help = 'FETCH DATA FROM NBP API ADD TO THE MODEL'
 
     def handle(self, *args, **options):
-        # Delete all existing objects
-        if Currency.objects.exists():
-            Currency.objects.all().delete()
+        # Upsert all currencies in one transaction, nothing is deleted so history and the API stay available
+        try:
+            rate_table = refresh_currency_rates()
+        except NBPError as error:
+            raise CommandError(f'Could not fetch rates from the NBP API {error}')
 
-        # Fetch and add new currencies
-        for code, rate in get_currency().items():
-            Currency.objects.get_or_create(code=code, rate_currency=rate)
-        Currency.objects.get_or_create(code='PLN', rate_currency=1)
+        if rate_table is None:
+            self.stdout.write('NBP did not publish a table today, rates were not changed')
+        else:
+            self.stdout.write(f'Loaded rates of {rate_table.effective_date} (version {rate_table.version})')
 
 
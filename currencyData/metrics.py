@@ -0,0 +1,285 @@
+import atexit
+import bisect
+import logging
+import os
+import random
+import threading
+import time
+from celery.signals import task_prerun, task_postrun
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+# Defaults used when settings.py does not define METRICS_FLUSH_INTERVAL / METRICS_SAMPLE_RATE
+DEFAULT_FLUSH_INTERVAL = 10
+DEFAULT_SAMPLE_RATE = 1.0
+
+TIME_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 500)
+
+SERIES_KEY = 'metrics:series:{name}'
+VALUE_KEY = 'metrics:value:{name}:{labels}:{part}'
+
+# sums are kept in the cache as integers (cache.incr), in millionths
+SUM_SCALE = 1_000_000
+
+
+class Metric:
+    '''
+    Base class of the Prometheus counters and histograms.
+
+    Observations are aggregated in the memory of the process and added to the shared cache by Metrics.flush,
+    so /metrics of any web worker shows the totals of all web and Celery processes.
+    '''
+
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        metrics.register(self)
+
+    def label_values(self, labels):
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def parts(self):
+        return ('value',)
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        metrics.add(self, self.label_values(labels), {'value': amount})
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=TIME_BUCKETS):
+        self.buckets = tuple(buckets)
+        super().__init__(name, documentation, labelnames)
+
+    def parts(self):
+        # the bucket of the first upper bound >= value is counted, buckets are made cumulative by render
+        return tuple(range(len(self.buckets) + 1)) + ('count', 'sum')
+
+    def observe(self, value, **labels):
+        bucket = bisect.bisect_left(self.buckets, value)
+        metrics.add(self, self.label_values(labels), {bucket: 1, 'count': 1, 'sum': round(value * SUM_SCALE)})
+
+    def time(self, **labels):
+        return Timer(self, labels)
+
+
+class Timer:
+    '''
+    Context manager observing the seconds spent in its block.
+    '''
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.started, **self.labels)
+
+
+class Metrics:
+    '''
+    Registry of the metrics and write-behind aggregation of their values in the shared cache.
+
+    Every process collects deltas in memory, they are added to the cache every METRICS_FLUSH_INTERVAL seconds by
+    a background thread, after every Celery task and when the process exits. A flush interval of 0 adds every
+    observation immediately.
+    '''
+
+    def __init__(self):
+        self.registry = {}
+        self._pending = {}
+        self._series = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        atexit.register(self.flush)
+
+    @property
+    def flush_interval(self):
+        return getattr(settings, 'METRICS_FLUSH_INTERVAL', DEFAULT_FLUSH_INTERVAL)
+
+    def register(self, metric):
+        self.registry[metric.name] = metric
+
+    def add(self, metric, label_values, values):
+        with self._lock:
+            pending = self._pending.setdefault((metric.name, label_values), {})
+            for part, value in values.items():
+                pending[part] = pending.get(part, 0) + value
+
+        if not self.flush_interval:
+            self.flush()
+        else:
+            self._ensure_worker()
+
+    def flush(self):
+        '''
+        Adds the pending deltas to the shared cache.
+
+        :return: int, number of flushed series.
+        '''
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+
+        added = set()
+        try:
+            for series, values in pending.items():
+                name, label_values = series
+                for part, value in values.items():
+                    key = VALUE_KEY.format(name=name, labels='|'.join(label_values), part=part)
+                    # add is a no-op for existing keys, incr is atomic in Redis
+                    cache.add(key, 0, timeout=None)
+                    cache.incr(key, value)
+                    added.add((series, part))
+                self._series.setdefault(name, set()).add(label_values)
+        except Exception:
+            # keep the deltas which were not added for the next flush
+            with self._lock:
+                for series, values in pending.items():
+                    for part, value in values.items():
+                        if (series, part) not in added:
+                            entry = self._pending.setdefault(series, {})
+                            entry[part] = entry.get(part, 0) + value
+            raise
+
+        # the list of series of a metric is a plain value, every flush adds the series this process knows again
+        for name in {name for name, label_values in pending}:
+            key = SERIES_KEY.format(name=name)
+            known = set(cache.get(key, ()))
+            if not self._series[name] <= known:
+                cache.set(key, sorted(known | self._series[name]), timeout=None)
+        return len(pending)
+
+    def render(self):
+        '''
+        Returns all metrics in the Prometheus text exposition format.
+        '''
+        self.flush()
+        lines = []
+        for name, metric in sorted(self.registry.items()):
+            lines.append(f'# HELP {name} {metric.documentation}')
+            lines.append(f'# TYPE {name} {metric.kind}')
+
+            series = [tuple(label_values) for label_values in cache.get(SERIES_KEY.format(name=name), ())]
+            keys = {
+                (label_values, part): VALUE_KEY.format(name=name, labels='|'.join(label_values), part=part)
+                for label_values in series for part in metric.parts()
+            }
+            values = cache.get_many(list(keys.values()))
+
+            for label_values in series:
+                def value(part):
+                    return values.get(keys[(label_values, part)], 0)
+
+                labels = list(zip(metric.labelnames, label_values))
+                if metric.kind == 'counter':
+                    lines.append(f'{name}{format_labels(labels)} {value("value")}')
+                    continue
+
+                cumulative = 0
+                for bucket, bound in enumerate(metric.buckets + ('+Inf',)):
+                    cumulative += value(bucket)
+                    lines.append(f'{name}_bucket{format_labels(labels + [("le", bound)])} {cumulative}')
+                lines.append(f'{name}_sum{format_labels(labels)} {value("sum") / SUM_SCALE}')
+                lines.append(f'{name}_count{format_labels(labels)} {value("count")}')
+        return '\n'.join(lines) + '\n'
+
+    def _ensure_worker(self):
+        # the thread is started lazily, so every forked web worker gets its own one
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='metrics-flush', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Could not flush the metrics')
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for name, value in labels)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + '}'
+
+
+def sampled():
+    '''
+    Decides whether the current request is measured in detail, METRICS_SAMPLE_RATE is the measured fraction.
+    '''
+    rate = getattr(settings, 'METRICS_SAMPLE_RATE', DEFAULT_SAMPLE_RATE)
+    return rate >= 1 or random.random() < rate
+
+
+metrics = Metrics()
+
+HTTP_REQUESTS = Counter(
+    'http_requests_total', 'Number of handled HTTP requests.', ('view', 'method', 'status'),
+)
+HTTP_REQUEST_DURATION = Histogram(
+    'http_request_duration_seconds', 'Time spent handling sampled HTTP requests.', ('view',),
+)
+HTTP_REQUEST_QUERIES = Histogram(
+    'http_request_db_queries', 'Number of SQL queries of sampled HTTP requests.', ('view',), COUNT_BUCKETS,
+)
+HTTP_REQUEST_DB_DURATION = Histogram(
+    'http_request_db_duration_seconds', 'Time spent in SQL queries of sampled HTTP requests.', ('view',),
+)
+NBP_REQUESTS = Counter(
+    'nbp_requests_total', 'Number of NBP API calls by result (ok, not_found, error, cached).', ('endpoint', 'result'),
+)
+NBP_REQUEST_DURATION = Histogram(
+    'nbp_request_duration_seconds', 'Time spent waiting for the NBP API.', ('endpoint',),
+)
+CELERY_TASKS = Counter(
+    'celery_tasks_total', 'Number of finished Celery tasks by state.', ('task', 'state'),
+)
+CELERY_TASK_DURATION = Histogram(
+    'celery_task_duration_seconds', 'Run time of Celery tasks.', ('task',),
+)
+
+
+_task_started = {}
+
+
+@task_prerun.connect
+def task_started(task_id=None, **kwargs):
+    _task_started[task_id] = time.perf_counter()
+
+
+@task_postrun.connect
+def task_finished(task_id=None, task=None, state=None, **kwargs):
+    started = _task_started.pop(task_id, None)
+    if started is not None:
+        CELERY_TASK_DURATION.observe(time.perf_counter() - started, task=task.name)
+    CELERY_TASKS.inc(task=task.name, state=state)
+    try:
+        # pool processes can be replaced at any time, their metrics are saved after every task
+        metrics.flush()
+    except Exception:
+        logger.exception('Could not flush the metrics')
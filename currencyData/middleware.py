@@ -0,0 +1,79 @@
+import time
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.db import connection
+from .metrics import HTTP_REQUESTS, HTTP_REQUEST_DURATION, HTTP_REQUEST_QUERIES, HTTP_REQUEST_DB_DURATION, sampled
+
+
+class QueryCounter:
+    '''
+    Database execute wrapper counting the queries of a request and the time spent in them.
+    '''
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += time.perf_counter() - started
+
+
+def view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match else 'unmatched'
+
+
+class MetricsMiddleware:
+    '''
+    Counts every request by view, method and status. A sample of METRICS_SAMPLE_RATE requests is measured in
+    detail (duration, number of SQL queries and time spent in them), the rest pays only for one counter.
+
+    Async views are served without leaving the event loop, their queries run in worker threads and are not counted.
+    '''
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        if not sampled():
+            response = self.get_response(request)
+            HTTP_REQUESTS.inc(view=view_name(request), method=request.method, status=response.status_code)
+            return response
+
+        queries = QueryCounter()
+        started = time.perf_counter()
+        with connection.execute_wrapper(queries):
+            response = self.get_response(request)
+        self.record(request, response, time.perf_counter() - started, queries)
+        return response
+
+    async def __acall__(self, request):
+        if not sampled():
+            response = await self.get_response(request)
+            HTTP_REQUESTS.inc(view=view_name(request), method=request.method, status=response.status_code)
+            return response
+
+        started = time.perf_counter()
+        response = await self.get_response(request)
+        self.record(request, response, time.perf_counter() - started)
+        return response
+
+    def record(self, request, response, seconds, queries=None):
+        view = view_name(request)
+        HTTP_REQUESTS.inc(view=view, method=request.method, status=response.status_code)
+        HTTP_REQUEST_DURATION.observe(seconds, view=view)
+        if queries is not None:
+            HTTP_REQUEST_QUERIES.observe(queries.count, view=view)
+            HTTP_REQUEST_DB_DURATION.observe(queries.seconds, view=view)
@@ -0,0 +1,28 @@
+# Generated by Django 5.1.3 on 2026-10-18 19:19
+
+import django.core.validators
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('currencyData', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CurrencyDailyRate',
+            fields=[
+                ('code', models.CharField(max_length=3)),
+                ('rate_currency', models.FloatField(default=0.0, validators=[django.core.validators.MinValueValidator(0.0)])),
+                ('rate_date', models.DateField()),
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False, unique=True)),
+            ],
+            options={
+                'ordering': ['code', 'rate_date'],
+                'constraints': [models.UniqueConstraint(fields=('code', 'rate_date'), name='unique_currency_daily_rate')],
+            },
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.1.3 on 2026-10-18 19:19
+
+from django.db import migrations, models
+
+
+def remove_duplicates(apps, schema_editor):
+    '''
+    Keeps one row of every (pair, date) before the unique constraint is created.
+    '''
+    CurrencyExchangeRate = apps.get_model('currencyData', 'CurrencyExchangeRate')
+    duplicates = (
+        CurrencyExchangeRate.objects.exclude(currency_exchange_pair__isnull=True)
+        .exclude(currency_exchange_date__isnull=True)
+        .values('currency_exchange_pair', 'currency_exchange_date')
+        .annotate(count=models.Count('id'))
+        .filter(count__gt=1)
+    )
+    for duplicate in list(duplicates):
+        ids = list(
+            CurrencyExchangeRate.objects.filter(
+                currency_exchange_pair=duplicate['currency_exchange_pair'],
+                currency_exchange_date=duplicate['currency_exchange_date'],
+            ).values_list('id', flat=True)
+        )
+        CurrencyExchangeRate.objects.filter(id__in=ids[1:]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('currencyData', '0002_currencydailyrate'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicates, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='currencyexchangerate',
+            name='currencyDat_currenc_5310cf_idx',
+        ),
+        migrations.AddConstraint(
+            model_name='currencyexchangerate',
+            constraint=models.UniqueConstraint(models.F('currency_exchange_pair'), models.OrderBy(models.F('currency_exchange_date'), descending=True), name='unique_currency_exchange_pair_date'),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.1.3 on 2026-10-18 19:22
+
+from django.db import migrations, models
+
+
+def remove_duplicate_codes(apps, schema_editor):
+    '''
+    Keeps one Currency of every code before the code becomes unique, history rows of the removed duplicates
+    are moved to the kept one so they are not deleted by the cascade.
+    '''
+    Currency = apps.get_model('currencyData', 'Currency')
+    CurrencyExchangeRate = apps.get_model('currencyData', 'CurrencyExchangeRate')
+    duplicates = (
+        Currency.objects.exclude(code__isnull=True)
+        .values('code')
+        .annotate(count=models.Count('id'))
+        .filter(count__gt=1)
+    )
+    for duplicate in list(duplicates):
+        ids = list(Currency.objects.filter(code=duplicate['code']).values_list('id', flat=True))
+        CurrencyExchangeRate.objects.filter(currency_id__in=ids[1:]).update(currency_id=ids[0])
+        Currency.objects.filter(id__in=ids[1:]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('currencyData', '0003_currency_exchange_pair_date_unique'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_codes, migrations.RunPython.noop),
+        migrations.CreateModel(
+            name='RateTable',
+            fields=[
+                ('version', models.BigAutoField(primary_key=True, serialize=False)),
+                ('effective_date', models.DateField()),
+                ('loaded_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['-version'],
+            },
+        ),
+        migrations.AlterField(
+            model_name='currency',
+            name='code',
+            field=models.CharField(blank=True, max_length=3, null=True, unique=True),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.3 on 2026-10-18 19:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('currencyData', '0004_currency_code_unique_ratetable'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TradingDay',
+            fields=[
+                ('date', models.DateField(primary_key=True, serialize=False)),
+                ('published', models.BooleanField()),
+            ],
+            options={
+                'ordering': ['date'],
+            },
+        ),
+    ]
@@ -6,6 +6,7 @@ import uuid
 class Currency(models.Model):
     code = models.CharField(
         max_length=3,
+        unique=True,
         null=True,
         blank=True
     )
@@ -26,14 +27,42 @@ class Currency(models.Model):
         return f'{self.code}'
 
 
+class RateTable(models.Model):
+    '''
+    One load of the NBP table into the Currency model. The version grows with every load, caches key on it.
+    '''
+    class Meta:
+        ordering = ['-version']
+
+    version = models.BigAutoField(
+        primary_key=True
+    )
+
+    effective_date = models.DateField()
+
+    loaded_at = models.DateTimeField(
+        auto_now_add=True
+    )
+
+    def __str__(self):
+        return f'{self.version} - {self.effective_date}'
+
+
 
 class CurrencyExchangeRate(models.Model):
     class Meta:
         ordering = ['currency_exchange_pair', '-currency_exchange_date']
         indexes=[
-            models.Index(fields=['currency_exchange_pair']),
             models.Index(fields=['currency_exchange_date'])
         ]
+        constraints = [
+            # one rate per pair and day, the index matches ordering so history of a pair is read in index order
+            models.UniqueConstraint(
+                models.F('currency_exchange_pair'),
+                models.F('currency_exchange_date').desc(),
+                name='unique_currency_exchange_pair_date'
+            )
+        ]
 
     currency = models.ForeignKey(
         Currency,
@@ -67,3 +96,53 @@ class CurrencyExchangeRate(models.Model):
     def __str__(self):
         return f'{self.currency_exchange_pair} - {self.currency_exchange_date}'
 
+
+
+class CurrencyDailyRate(models.Model):
+    '''
+    Daily NBP bid rate of one currency in PLN. Past fixings never change, so every (code, date) is fetched once.
+    '''
+    class Meta:
+        ordering = ['code', 'rate_date']
+        constraints = [
+            models.UniqueConstraint(fields=['code', 'rate_date'], name='unique_currency_daily_rate')
+        ]
+
+    code = models.CharField(
+        max_length=3
+    )
+
+    rate_currency = models.FloatField(
+        default=0.0,
+        validators=[MinValueValidator(0.0)]
+    )
+
+    rate_date = models.DateField()
+
+    id = models.UUIDField(
+        default=uuid.uuid4,
+        unique=True,
+        primary_key=True,
+        editable=False
+    )
+
+    def __str__(self):
+        return f'{self.code} - {self.rate_date}'
+
+
+class TradingDay(models.Model):
+    '''
+    Day on which NBP published a table although the trading calendar rules say it is a holiday, or did not publish
+    one on a business day. Learned from fetched tables, it corrects the calendar of every worker.
+    '''
+    class Meta:
+        ordering = ['date']
+
+    date = models.DateField(
+        primary_key=True
+    )
+
+    published = models.BooleanField()
+
+    def __str__(self):
+        return f'{self.date} - {"published" if self.published else "closed"}'
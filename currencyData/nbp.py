@@ -0,0 +1,188 @@
+import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from django.conf import settings
+from django.core.cache import cache
+from .metrics import NBP_REQUESTS, NBP_REQUEST_DURATION
+
+# Defaults used when settings.py does not define the NBP_* settings
+DEFAULT_API_URL = 'https://api.nbp.pl/api/'
+DEFAULT_TIMEOUT = (3.05, 10)
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF = 0.5
+DEFAULT_MAX_WORKERS = 8
+
+# longest range of one exchangerates/rates request accepted by NBP
+MAX_RATES_DAYS = 93
+
+# seconds a response of a conditional request is kept for revalidation
+VALIDATED_TIMEOUT = 7 * 24 * 60 * 60
+
+
+def history_windows(date_start, date_end, days=MAX_RATES_DAYS):
+    '''
+    Splits a date range into consecutive windows of at most days days (both bounds included).
+
+    :return: list of tuples (window_start, window_end)
+    '''
+    windows = []
+    while date_start <= date_end:
+        window_end = min(date_start + datetime.timedelta(days=days - 1), date_end)
+        windows.append((date_start, window_end))
+        date_start = window_end + datetime.timedelta(days=1)
+    return windows
+
+
+class NBPError(ValueError):
+    '''
+    Raised when the NBP API answers with an unexpected status code or can not be reached.
+    '''
+
+
+class NBPClient:
+    '''
+    Shared client of the NBP API.
+
+    All requests go through one pooled requests.Session (keep-alive), with timeouts and exponential backoff
+    retries on 429 and 5xx responses. Responses for closed days (dates before today) never change, so they are
+    kept in the Django cache and are never downloaded twice.
+    '''
+
+    def __init__(self):
+        self._session = None
+        self._lock = threading.Lock()
+
+    @property
+    def base_url(self):
+        return getattr(settings, 'NBP_API_URL', DEFAULT_API_URL)
+
+    @property
+    def session(self):
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    self._session = self._create_session()
+        return self._session
+
+    def _create_session(self):
+        retry = Retry(
+            total=getattr(settings, 'NBP_RETRIES', DEFAULT_RETRIES),
+            backoff_factor=getattr(settings, 'NBP_BACKOFF', DEFAULT_BACKOFF),
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=('GET',),
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        max_workers = getattr(settings, 'NBP_MAX_WORKERS', DEFAULT_MAX_WORKERS)
+        adapter = HTTPAdapter(max_retries=retry, pool_connections=max_workers, pool_maxsize=max_workers)
+
+        session = requests.Session()
+        session.headers['Accept'] = 'application/json'
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    def get(self, path, closed=False, conditional=False):
+        '''
+        Sends a GET request to the NBP API.
+
+        :param path: str, path relative to NBP_API_URL (e.g. 'exchangerates/tables/c/2024-12-04/').
+        :param closed: bool, True when the data can not change anymore, the response is cached forever.
+        :param conditional: bool, the response is cached with its ETag / Last-Modified and revalidated with
+                            If-None-Match / If-Modified-Since, an unchanged resource is not downloaded again.
+
+        :return: parsed JSON or None when NBP has no data (404).
+        '''
+        url = f'{self.base_url}{path}'
+        cache_key = f'nbp:{url}'
+        validated_key = f'nbp:validated:{url}'
+        # 'exchangerates/tables/...' -> 'tables', 'exchangerates/rates/...' -> 'rates'
+        endpoint = path.split('/')[1]
+        if closed:
+            cached = cache.get(cache_key)
+            if cached is not None:
+                NBP_REQUESTS.inc(endpoint=endpoint, result='cached')
+                return cached
+
+        headers = {}
+        validated = cache.get(validated_key) if conditional else None
+        if validated is not None:
+            headers = {name: value for name, value in (
+                ('If-None-Match', validated['etag']), ('If-Modified-Since', validated['last_modified']),
+            ) if value}
+
+        try:
+            with NBP_REQUEST_DURATION.time(endpoint=endpoint):
+                response = self.session.get(
+                    url, headers=headers, timeout=getattr(settings, 'NBP_TIMEOUT', DEFAULT_TIMEOUT),
+                )
+        except requests.RequestException as error:
+            NBP_REQUESTS.inc(endpoint=endpoint, result='error')
+            raise NBPError({'error': f'Connection error {error}'})
+
+        if response.status_code == 304 and validated is not None:
+            NBP_REQUESTS.inc(endpoint=endpoint, result='not_modified')
+            return validated['data']
+        if response.status_code == 404:
+            NBP_REQUESTS.inc(endpoint=endpoint, result='not_found')
+            return None
+        if response.status_code != 200:
+            NBP_REQUESTS.inc(endpoint=endpoint, result='error')
+            raise NBPError({'error': f'Connection error {response.status_code}'})
+        NBP_REQUESTS.inc(endpoint=endpoint, result='ok')
+
+        data = response.json()
+        if closed:
+            cache.set(cache_key, data, timeout=None)
+        if conditional and (response.headers.get('ETag') or response.headers.get('Last-Modified')):
+            cache.set(validated_key, {
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified'),
+                'data': data,
+            }, timeout=VALIDATED_TIMEOUT)
+        return data
+
+    def table(self, date, table='c'):
+        '''
+        Returns the exchange rates table published on the date, or None when there is no table that day.
+        '''
+        data = self.get(f'exchangerates/tables/{table}/{date}/', closed=date < datetime.date.today())
+        return data[0] if data else None
+
+    def current_table(self, table='c'):
+        '''
+        Returns the newest published exchange rates table, revalidated with a conditional request.
+        '''
+        data = self.get(f'exchangerates/tables/{table}/', conditional=True)
+        return data[0] if data else None
+
+    def rates(self, code, date_start, date_end, table='c', cached=True):
+        '''
+        Returns the list of rates of one currency between two dates (both included, at most MAX_RATES_DAYS days).
+
+        :param cached: bool, False does not keep closed ranges in the cache (e.g. a backfill of many years which is
+                       saved to the database anyway).
+        '''
+        data = self.get(
+            f'exchangerates/rates/{table}/{code.lower()}/{date_start}/{date_end}/',
+            closed=cached and date_end < datetime.date.today(),
+        )
+        return data['rates'] if data else []
+
+
+def fetch_concurrently(function, items, max_workers=None):
+    '''
+    Calls function for every item with a bounded pool of threads, the pooled session is shared between them.
+
+    :return: dict, { item: function(item) }
+    '''
+    items = list(items)
+    max_workers = max_workers or getattr(settings, 'NBP_MAX_WORKERS', DEFAULT_MAX_WORKERS)
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(items)))) as executor:
+        return dict(zip(items, executor.map(function, items)))
+
+
+nbp_client = NBPClient()
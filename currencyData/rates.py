@@ -0,0 +1,248 @@
+import collections
+import threading
+import time
+import numpy
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import Signal, receiver
+from .models import Currency, RateTable
+from .snapshot import read_snapshot, snapshot_path, write_snapshot
+
+# Shared key holding the RatesVersion of the currently published rates table. Every worker compares it
+# with the version of its own matrix and rebuilds the matrix only when they differ.
+RATES_VERSION_KEY = 'currency_rates:version'
+
+# Sent with the new RatesVersion every time new rates are published (load_rates, admin edits).
+rates_published = Signal()
+
+# number: RateTable version, effective_date: NBP date of the table, published_at: nanoseconds since epoch
+RatesVersion = collections.namedtuple('RatesVersion', ['number', 'effective_date', 'published_at'])
+
+
+class RateMatrix:
+    '''
+    In-memory cross-rate matrix of every Currency stored in the database.
+
+    matrix[i, j] holds the price of codes[i] expressed in codes[j], so a pair lookup is a dict access
+    and an array index instead of two database queries.
+    '''
+
+    def __init__(self, codes, rates, ids, version=None, matrix=None):
+        self.codes = list(codes)
+        self.ids = list(ids)
+        self.index = {code: position for position, code in enumerate(self.codes)}
+        self.rates = numpy.asarray(rates, dtype=numpy.float64)
+        self.version = version
+        # { base code: { quote code: rate } } rows read by the all-quotes endpoint, filled on first use
+        self._quotes = {}
+
+        if matrix is not None:
+            # precomputed cross rates, e.g. the read-only rows of the memory-mapped snapshot
+            self.matrix = matrix
+        else:
+            # rows divided by columns, a zero quote rate gives inf/nan which is rejected in rate()
+            with numpy.errstate(divide='ignore', invalid='ignore'):
+                self.matrix = self.rates[:, None] / self.rates[None, :]
+
+    def __contains__(self, code):
+        return code in self.index
+
+    def rate(self, base_code, quote_code):
+        '''
+        Returns the exchange rate of a currency pair.
+
+        :raises KeyError: when one of the codes does not exist.
+        :raises ZeroDivisionError: when the quote currency rate is 0.
+        '''
+        base, quote = self.index[base_code], self.index[quote_code]
+        if self.rates[quote] == 0:
+            raise ZeroDivisionError(f'The rate of {quote_code} is 0')
+        return float(self.matrix[base, quote])
+
+    def currency_id(self, code):
+        return self.ids[self.index[code]]
+
+    def quotes(self, base_code):
+        '''
+        Rates of one base against every other currency, read from one row of the matrix. The row is converted once
+        per matrix, so once per published rates version. Quotes with a zero rate are left out.
+
+        :raises KeyError: when the base code does not exist.
+        :return: dict, { quote code: rate }
+        '''
+        quotes = self._quotes.get(base_code)
+        if quotes is None:
+            row = self.matrix[self.index[base_code]].copy()
+            row[self.rates == 0] = numpy.nan
+            quotes = {
+                code: rate for code, rate in zip(self.codes, row.tolist()) if code != base_code and rate == rate
+            }
+            self._quotes[base_code] = quotes
+        return quotes
+
+    def rates_many(self, base_codes, quote_codes):
+        '''
+        Vectorized rate of many pairs at once, codes have to exist. A zero quote rate gives nan.
+
+        :return: numpy.ndarray of rates.
+        '''
+        base = numpy.array([self.index[code] for code in base_codes], dtype=numpy.intp)
+        quote = numpy.array([self.index[code] for code in quote_codes], dtype=numpy.intp)
+        rates = self.matrix[base, quote]
+        rates[self.rates[quote] == 0] = numpy.nan
+        return rates
+
+
+def build_rate_matrix(version=None):
+    '''
+    Builds a RateMatrix from the Currency table with a single query.
+    '''
+    rows = Currency.objects.exclude(code__isnull=True).values_list('code', 'rate_currency', 'id')
+    codes, rates, ids = [], [], []
+    for code, rate, currency_id in rows:
+        codes.append(code)
+        rates.append(rate)
+        ids.append(currency_id)
+    return RateMatrix(codes, rates, ids, version=version)
+
+
+def convert_batch(matrix, items):
+    '''
+    Converts many amounts with one vectorized computation over the rate matrix.
+
+    :param items: list of dicts { 'base': 'EUR', 'quote': 'USD', 'amount': 100 }, amount is optional (default 1).
+
+    :return: list of results in the order of items. Items which can not be converted get an 'error' key instead
+             of failing the whole batch.
+    '''
+    results = []
+    valid = []
+    for item in items:
+        if not isinstance(item, dict):
+            results.append({'error': 'Every item has to be an object with base, quote and amount'})
+            continue
+
+        base, quote = str(item.get('base', '')).upper(), str(item.get('quote', '')).upper()
+        result = {'currency_pair': f'{base}{quote}'}
+        results.append(result)
+        try:
+            amount = float(item.get('amount', 1))
+        except (TypeError, ValueError):
+            amount = numpy.nan
+        if not numpy.isfinite(amount):
+            result['error'] = f"The amount '{item.get('amount')}' is not a number"
+        elif base not in matrix or quote not in matrix:
+            result['error'] = 'One of the entered currency codes does not exist.'
+        else:
+            valid.append((result, base, quote, amount))
+
+    if valid:
+        results_valid, bases, quotes, amounts = zip(*valid)
+        rates = matrix.rates_many(bases, quotes)
+        converted = rates * numpy.array(amounts)
+        for result, amount, rate, converted_amount in zip(results_valid, amounts, rates.tolist(), converted.tolist()):
+            if numpy.isnan(rate):
+                result['error'] = 'The quote currency rate is 0. Division by zero is not allowed'
+            else:
+                result.update(exchange_rate=rate, amount=amount, converted_amount=converted_amount)
+    return results
+
+
+_matrix = None
+_matrix_lock = threading.Lock()
+
+
+def latest_rates_version():
+    '''
+    Returns the version of the last loaded RateTable (or version 0 when rates were never loaded).
+    '''
+    table = RateTable.objects.first()
+    if table is None:
+        return RatesVersion(0, None, time.time_ns())
+    return RatesVersion(table.version, table.effective_date, int(table.loaded_at.timestamp() * 1e9))
+
+
+def get_rates_version():
+    '''
+    Returns the published RatesVersion, when the shared cache has none yet the last loaded RateTable is published,
+    so all workers agree on it.
+    '''
+    version = cache.get(RATES_VERSION_KEY)
+    if version is None:
+        cache.add(RATES_VERSION_KEY, latest_rates_version(), timeout=None)
+        version = cache.get(RATES_VERSION_KEY)
+    return version
+
+
+def get_rate_matrix():
+    '''
+    Returns the rate matrix of this worker, it is built once and rebuilt only when a new rates version
+    has been published (e.g. by load_rates).
+
+    The new matrix is read from the memory-mapped snapshot file when the snapshot has the published version,
+    otherwise it is built from the database.
+
+    :return: RateMatrix
+    '''
+    global _matrix
+    version = get_rates_version()
+    matrix = _matrix
+    if matrix is not None and matrix.version == version:
+        return matrix
+
+    with _matrix_lock:
+        if _matrix is None or _matrix.version != version:
+            # the new matrix is fully built before it replaces the old one, readers never see half of it
+            snapshot = read_snapshot()
+            if snapshot is not None and snapshot.version == version:
+                _matrix = snapshot.matrix()
+            else:
+                # only the publisher writes the snapshot, a worker could read rates which are not committed yet
+                _matrix = build_rate_matrix(version)
+        return _matrix
+
+
+async def aget_rate_matrix():
+    '''
+    Async variant of get_rate_matrix, the version is read with the async cache API. Rebuilding the matrix from the
+    database (once per published version) runs in a worker thread, so the event loop is never blocked.
+
+    :return: RateMatrix
+    '''
+    version = await cache.aget(RATES_VERSION_KEY)
+    matrix = _matrix
+    if version is not None and matrix is not None and matrix.version == version:
+        return matrix
+    return await sync_to_async(get_rate_matrix)()
+
+
+def invalidate_rate_matrix(number=None, effective_date=None):
+    '''
+    Publishes a new rates version, every worker rebuilds its matrix on the next lookup.
+
+    :param number: int, version of the loaded RateTable, by default the current table number is kept
+                   (e.g. a rate was edited in the admin).
+    :param effective_date: datetime.date, effective date of the loaded table.
+    '''
+    global _matrix
+    if number is None:
+        current = cache.get(RATES_VERSION_KEY) or latest_rates_version()
+        number, effective_date = current.number, current.effective_date
+    version = RatesVersion(number, effective_date, time.time_ns())
+    matrix = None
+    if snapshot_path() is not None:
+        # the snapshot is written before the version is published, the other workers map it instead of querying
+        matrix = build_rate_matrix(version)
+        write_snapshot(matrix)
+    cache.set(RATES_VERSION_KEY, version, timeout=None)
+    _matrix = matrix
+    rates_published.send(sender=RateMatrix, version=version)
+
+
+@receiver([post_save, post_delete], sender=Currency)
+def currency_changed(sender, **kwargs):
+    # keeps the matrix in sync with changes made outside load_rates (admin, shell, tests), the new version is
+    # published after the commit, so no worker reads or caches rates which could still be rolled back
+    transaction.on_commit(invalidate_rate_matrix)
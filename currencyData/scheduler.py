@@ -0,0 +1,85 @@
+import logging
+import time
+from django.conf import settings
+from django.core.cache import cache
+from .tasks import update_pair_history
+
+logger = logging.getLogger(__name__)
+
+# Default number of seconds pairs are collected before one update_pair_history task refreshes all of them
+DEFAULT_DEBOUNCE = 50
+
+DIRTY_KEY = 'history_refresh:dirty:{pair}'
+SLOT_KEY = 'history_refresh:slot:{slot}'
+SEQUENCE_KEY = 'history_refresh:sequence'
+CONSUMED_KEY = 'history_refresh:consumed'
+SCHEDULED_KEY = 'history_refresh:scheduled'
+MISSING_KEY = 'history_refresh:missing:{slot}'
+
+
+def get_debounce():
+    return getattr(settings, 'HISTORY_REFRESH_DEBOUNCE', DEFAULT_DEBOUNCE)
+
+
+def schedule_history_refresh(pair):
+    '''
+    Marks the history of a pair as dirty and makes sure one debounced update_pair_history task is queued.
+
+    Only atomic cache operations are used (add / incr), so concurrent requests in many processes never queue
+    the same pair twice, and all pairs requested within HISTORY_REFRESH_DEBOUNCE seconds share one task.
+
+    :return: bool, True when the pair was not pending yet.
+    '''
+    debounce = get_debounce()
+    if not cache.add(DIRTY_KEY.format(pair=pair), True, timeout=debounce * 5):
+        return False
+
+    # every dirty pair gets its own numbered slot, the task reads the slots between the consumed and last number
+    cache.add(SEQUENCE_KEY, 0, timeout=None)
+    slot = cache.incr(SEQUENCE_KEY)
+    cache.set(SLOT_KEY.format(slot=slot), pair, timeout=None)
+
+    if cache.add(SCHEDULED_KEY, True, timeout=debounce * 2):
+        try:
+            update_pair_history.apply_async(countdown=debounce)
+        except Exception as error:
+            # history refresh is best effort, a broker outage must not fail the rate lookup
+            cache.delete(SCHEDULED_KEY)
+            logger.warning('Could not schedule update_pair_history: %s', error)
+    return True
+
+
+def pop_dirty_pairs():
+    '''
+    Returns all pairs marked dirty since the last call and clears them.
+
+    :return: set of pairs (e.g. {'EURUSD', 'USDGBP'})
+    '''
+    # from now on a newly requested pair queues the next task
+    cache.delete(SCHEDULED_KEY)
+
+    first = cache.get(CONSUMED_KEY, 0) + 1
+    last = cache.get(SEQUENCE_KEY, 0)
+    keys = [SLOT_KEY.format(slot=slot) for slot in range(first, last + 1)]
+    slots = cache.get_many(keys)
+
+    # slots are consumed in order up to the first one which is numbered but not written yet, it and all later slots
+    # are left for the task queued by its writer. A slot which stays missing longer than the dirty mark of its pair
+    # (the writer died) is skipped.
+    consumed = first - 1
+    for slot, key in enumerate(keys, start=first):
+        if key not in slots:
+            missing_since = cache.get_or_set(MISSING_KEY.format(slot=slot), time.time(), timeout=None)
+            if time.time() - missing_since < get_debounce() * 5:
+                break
+        consumed = slot
+
+    consumed_keys = [key for key in keys[:consumed - first + 1] if key in slots]
+    pairs = {slots[key] for key in consumed_keys}
+    cache.set(CONSUMED_KEY, consumed, timeout=None)
+    cache.delete_many(
+        consumed_keys
+        + [MISSING_KEY.format(slot=slot) for slot in range(first, consumed + 1)]
+        + [DIRTY_KEY.format(pair=pair) for pair in pairs]
+    )
+    return pairs
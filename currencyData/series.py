@@ -0,0 +1,161 @@
+import datetime
+import time
+from django.core.cache import cache
+from django.db.models import Count, Min, Max, Q
+from .models import CurrencyDailyRate
+from .nbp import nbp_client, fetch_concurrently, history_windows
+from .trading_calendar import get_trading_calendar, latest_fixing_date, learn_trading_days
+
+# Shared key holding the version of the stored series, bumped every time new fixings are saved.
+SERIES_VERSION_KEY = 'currency_series:version'
+
+ONE_DAY = datetime.timedelta(days=1)
+
+
+def get_series_version():
+    '''
+    Returns the version of the stored series, when the shared cache has none (never saved or evicted) a new version
+    is started, so series cached under an older version are never served again.
+    '''
+    version = cache.get(SERIES_VERSION_KEY)
+    if version is None:
+        cache.add(SERIES_VERSION_KEY, time.time_ns(), timeout=None)
+        version = cache.get(SERIES_VERSION_KEY)
+    return version
+
+
+def sync_currency_series(codes, date_start, date_end):
+    '''
+    Makes sure the local series of every currency covers the range, only the missing head and tail and the
+    publication days missing inside the stored series are requested from the NBP API, in windows of at most
+    MAX_RATES_DAYS days (one request per currency in steady state, none when the range is known).
+
+    PLN is not stored, its rate is always 1 on the publication days of the trading calendar. The dates of the
+    fetched fixings correct the calendar, publication days inside the series on which NBP has no fixing of any
+    requested currency are learned as closed.
+
+    :return: int, number of saved fixings.
+    '''
+    codes = sorted(set(codes) - {'PLN'})
+    calendar = get_trading_calendar()
+    known = {
+        code: (first, last, stored) for code, first, last, stored in
+        CurrencyDailyRate.objects.filter(code__in=codes).values('code')
+        .annotate(
+            first=Min('rate_date'), last=Max('rate_date'),
+            stored=Count('rate_date', filter=Q(rate_date__range=(date_start, date_end))),
+        ).values_list('code', 'first', 'last', 'stored')
+    }
+
+    def missing_days(code):
+        # publication days inside the stored series, counted first so complete series are not read
+        first, last, stored = known[code]
+        start, end = max(date_start, first), min(date_end, last)
+        expected = calendar.days_between(start, end) if start <= end else []
+        if stored >= len(expected):
+            return []
+        dates = set(
+            CurrencyDailyRate.objects.filter(code=code, rate_date__range=(start, end))
+            .values_list('rate_date', flat=True)
+        )
+        return [day for day in expected if day not in dates]
+
+    def missing_ranges(code):
+        if code not in known:
+            return history_windows(date_start, date_end)
+        first, last = known[code][:2]
+        ranges = []
+        if date_start < first:
+            ranges.append((date_start, min(date_end, first - ONE_DAY)))
+        # consecutive missing publication days are requested together
+        runs = []
+        for day in gaps[code]:
+            if runs and calendar.business_days_back(1, day) == runs[-1][1]:
+                runs[-1] = (runs[-1][0], day)
+            else:
+                runs.append((day, day))
+        ranges.extend(runs)
+        if date_end > last:
+            ranges.append((max(date_start, last + ONE_DAY), date_end))
+        return [window for start, end in ranges for window in history_windows(start, end)]
+
+    def fetch(code):
+        return [
+            CurrencyDailyRate(
+                code=code, rate_currency=item['bid'], rate_date=datetime.date.fromisoformat(item['effectiveDate'])
+            )
+            for start, end in ranges[code] for item in nbp_client.rates(code, start, end)
+        ]
+
+    gaps = {code: missing_days(code) if code in known else [] for code in codes}
+    ranges = {code: missing_ranges(code) for code in codes}
+    missing = [code for code in codes if ranges[code]]
+    rows = [row for fetched in fetch_concurrently(fetch, missing).values() for row in fetched]
+    published = {row.rate_date for row in rows}
+    # a table has all currencies, a requested day without a fixing of any currency had no table
+    closed = {day for days in gaps.values() for day in days} - published
+    if rows:
+        CurrencyDailyRate.objects.bulk_create(rows, batch_size=1000, ignore_conflicts=True)
+        cache.set(SERIES_VERSION_KEY, time.time_ns(), timeout=None)
+    if rows or closed:
+        learn_trading_days(published=published, closed=closed)
+    return len(rows)
+
+
+def extend_currency_series(effective_date, rates):
+    '''
+    Appends the fixings of a newly published table to the stored series which end on the previous publication day,
+    so the series stay without gaps. Series of other currencies are completed by sync_currency_series when they are
+    read.
+
+    :param rates: dict, { currency code: bid rate } of the table.
+
+    :return: int, number of saved fixings.
+    '''
+    previous = get_trading_calendar().business_days_back(1, effective_date)
+    codes = (
+        CurrencyDailyRate.objects.filter(code__in=set(rates) - {'PLN'}).values('code')
+        .annotate(last=Max('rate_date')).filter(last=previous).values_list('code', flat=True)
+    )
+    rows = [CurrencyDailyRate(code=code, rate_currency=rates[code], rate_date=effective_date) for code in codes]
+    if rows:
+        CurrencyDailyRate.objects.bulk_create(rows, ignore_conflicts=True)
+        cache.set(SERIES_VERSION_KEY, time.time_ns(), timeout=None)
+    return len(rows)
+
+
+def load_currency_series(codes, date_start=None, date_end=None):
+    '''
+    Reads stored series of the currencies, dates without bounds read the whole series.
+
+    PLN gets a rate of 1 on every publication day of the trading calendar, missing bounds are taken from the
+    stored series.
+
+    :return: dict, { 'EUR': {date1: rate1, date2: rate2, ... }, 'USD': { ....} }
+    '''
+    rows = CurrencyDailyRate.objects.all()
+    if date_start:
+        rows = rows.filter(rate_date__gte=date_start)
+    if date_end:
+        rows = rows.filter(rate_date__lte=date_end)
+
+    series = {code: {} for code in codes}
+    for code, rate_date, rate in rows.filter(code__in=codes).order_by('rate_date').values_list('code', 'rate_date', 'rate_currency'):
+        series[code][rate_date] = rate
+
+    if 'PLN' in series:
+        if not date_start or not date_end:
+            stored = rows.aggregate(first=Min('rate_date'), last=Max('rate_date'))
+            date_start, date_end = date_start or stored['first'], date_end or stored['last']
+        if date_start and date_end:
+            days = get_trading_calendar().days_between(date_start, min(date_end, latest_fixing_date()))
+            series['PLN'] = {rate_date: 1 for rate_date in days}
+    return series
+
+
+def currency_series(codes, date_start, date_end):
+    '''
+    Returns series of the currencies between two dates, fetching only the fixings which are not stored yet.
+    '''
+    sync_currency_series(codes, date_start, date_end)
+    return load_currency_series(codes, date_start, date_end)
@@ -1,37 +1,59 @@
-import requests
-import pandas
-from .models import CurrencyExchangeRate, Currency
-from .tasks import update_pair_history
-from django.core.cache import cache
-from openpyxl.utils import get_column_letter
-from django.http import HttpResponse
+import csv
+import datetime
+import re
+import tempfile
+import numpy
+from .models import CurrencyExchangeRate, Currency, RateTable
+from .rates import get_rate_matrix, invalidate_rate_matrix
+from .buffer import transaction_buffer
+from .nbp import nbp_client, NBPError
+from .series import currency_series, extend_currency_series
+from .scheduler import schedule_history_refresh
+from .trading_calendar import today, latest_fixing_date, business_days_back, learn_trading_days
+from django.db import transaction
+from django.db.models import Max
+from django.http import FileResponse, StreamingHttpResponse
 
 def get_today_and_last_30_days(start_date='', end_date=''):
     """
-    Calculates a 30-day date range, ensuring both start and end dates fall on working days (Mon-Fri).
+    Calculates a 30-day date range, ensuring both start and end dates fall on days on which NBP published a table.
 
-    If dates are on weekends, they are adjusted to the previous Friday.
+    Dates on weekends and holidays are moved back to the previous publication day of the trading calendar.
 
     :return: tuple dates (start_date, end_date) as working days
     """
     # for future use
-    # start_date = pandas.Timestamp(start_date)
+    # start_date = datetime.date.fromisoformat(start_date)
 
-    # Get the current day
-    end_date = pandas.Timestamp.now().normalize()
+    end_date = latest_fixing_date()
 
-    # Current day - 30 calendar working days
-    start_date = end_date - pandas.Timedelta(days=30)
+    # Current day - 30 calendar days, moved back to a publication day
+    start_date = latest_fixing_date(today() - datetime.timedelta(days=30))
 
-    # Ensure sure that is not a weekend
-    if end_date.weekday() >= 5:
-        end_date = end_date - pandas.offsets.BDay(1)
+    return start_date, end_date
 
-    # Ensure the start_date (30 days ago) is not a weekend
-    if start_date.weekday() >= 5:
-        start_date = start_date - pandas.offsets.BDay(1)
 
-    return start_date.date(), end_date.date()
+def get_currency_table():
+    '''
+    Fetches the current NBP table C.
+
+    :return: tuple (effective_date, rates) with rates as a dict of currency codes and bid rates, or None when
+             NBP did not publish a table that day.
+    :raises NBPError: when the NBP API can not be reached.
+    '''
+    # fetch the table of the last publication day of the trading calendar (weekends and holidays are skipped)
+    fixing_date = latest_fixing_date()
+    table = nbp_client.table(fixing_date)
+    if table is None:
+        if fixing_date < today():
+            # NBP did not publish a table on a past business day, the calendar learns the closed day
+            learn_trading_days(closed=[fixing_date])
+        return None
+    if 'rates' not in table:
+        raise NBPError({'error': f'There is no rates in {table}'})
+    effective_date = datetime.date.fromisoformat(table.get('effectiveDate', fixing_date.isoformat()))
+    learn_trading_days(published=[effective_date])
+    return effective_date, {currency['code']: currency['bid'] for currency in table['rates']}
 
 
 def get_currency():
@@ -40,19 +62,107 @@ def get_currency():
     :return:  dict: A dictionary with currency codes as keys and bid rates as values
 
     '''
-    # fetch current data day. Check that this day is not a Saturday or Sunday.
-    today = ((pandas.Timestamp.now().normalize() - pandas.offsets.BDay(1)).date() if pandas.Timestamp.now().weekday() >= 5 else pandas.Timestamp.now().normalize().date())
-    NBP_API = 'https://api.nbp.pl/api/exchangerates/tables/c/'
     # take currency code and rate from NBP API
     try:
-        data = requests.get(f'{NBP_API}{today}/')
-        if data.status_code == 200:
-            if 'rates' in data.json()[0]:
-                return {currency['code']: currency['bid'] for currency in data.json()[0]['rates']}
-            else:
-                return {'error': f'There is no rates in {data.json()[0]}'}
-    except:
-        return {'error': f'Something Went Wrong {data.status_code}'}
+        table = get_currency_table()
+    except NBPError as error:
+        return {'error': f'Something Went Wrong {error}'}
+
+    if table is not None:
+        return table[1]
+
+
+def refresh_currency_rates():
+    '''
+    Loads the current NBP table into the Currency model without deleting anything.
+
+    All codes are upserted with one bulk_create(update_conflicts=True) inside a transaction, so history rows keep
+    their currencies and the pair endpoint keeps answering during the load. Every load records a RateTable with
+    its effective date and a new version which is published to all workers after the commit.
+
+    :return: RateTable or None when NBP did not publish a table.
+    :raises NBPError: when the NBP API can not be reached.
+    '''
+    table = get_currency_table()
+    if table is None:
+        return None
+    return save_currency_rates(*table)
+
+
+def save_currency_rates(effective_date, rates):
+    '''
+    Upserts the rates of a table into the Currency model and records its RateTable, the new version is published
+    to all workers after the commit of the outer transaction.
+
+    :return: RateTable
+    '''
+    rates = dict(rates, PLN=1)
+    with transaction.atomic():
+        Currency.objects.bulk_create(
+            [Currency(code=code, rate_currency=rate) for code, rate in rates.items()],
+            update_conflicts=True,
+            unique_fields=['code'],
+            update_fields=['rate_currency'],
+        )
+        rate_table = RateTable.objects.create(effective_date=effective_date)
+        # publish the new table, every worker swaps its in-memory rate matrix on the next request
+        transaction.on_commit(lambda: invalidate_rate_matrix(rate_table.version, effective_date))
+    return rate_table
+
+
+def poll_currency_rates():
+    '''
+    Loads the newest NBP table C when it was published after the last load, called by the refresh_rates task
+    of the Celery beat schedule.
+
+    Nothing is requested when the table of the latest fixing date of the trading calendar is loaded already. Until
+    the new table is published NBP is asked with a conditional request, which is answered with 304 Not Modified
+    while the table does not change. A new table updates Currency and extends the stored currency series and pair
+    history by its day in one transaction.
+
+    :return: RateTable or None when there is no new table.
+    :raises NBPError: when the NBP API can not be reached.
+    '''
+    loaded = RateTable.objects.first()
+    if loaded is not None and loaded.effective_date >= latest_fixing_date():
+        return None
+
+    table = nbp_client.current_table()
+    if table is None:
+        return None
+    if 'rates' not in table:
+        raise NBPError({'error': f'There is no rates in {table}'})
+    effective_date = datetime.date.fromisoformat(table['effectiveDate'])
+    if loaded is not None and loaded.effective_date >= effective_date:
+        return None
+
+    learn_trading_days(published=[effective_date])
+    rates = {currency['code']: currency['bid'] for currency in table['rates']}
+    with transaction.atomic():
+        rate_table = save_currency_rates(effective_date, rates)
+        extend_currency_series(effective_date, rates)
+        extend_pair_history(effective_date, rates)
+    return rate_table
+
+
+def extend_pair_history(effective_date, rates):
+    '''
+    Saves the rates of a new table for the stored pairs whose history ends on the previous publication day. Pairs
+    with gaps are completed by fetch_historical_rate when they are requested again.
+
+    :return: int, number of saved rows.
+    '''
+    rates = dict(rates, PLN=1)
+    previous = business_days_back(1, effective_date)
+    pairs = (
+        CurrencyExchangeRate.objects.values('currency_exchange_pair')
+        .annotate(last=Max('currency_exchange_date')).filter(last=previous)
+        .values_list('currency_exchange_pair', flat=True)
+    )
+    return save_historical_data([
+        (pair, effective_date, rates[pair[:3]] / rates[pair[3:]])
+        for pair in pairs if rates.get(pair[:3]) and rates.get(pair[3:])
+    ])
 
 
 def process_rates(code, date_start='', date_end=''):
@@ -68,146 +178,246 @@ def process_rates(code, date_start='', date_end=''):
     '''
     start_end_date = get_today_and_last_30_days(date_start, date_end)
 
-    api_url = 'https://api.nbp.pl/api/exchangerates/rates/c/'
+    # the local series store requests only the days which are not stored yet, PLN is a fixed value of 1
+    # on every day on which NBP published a table
+    series = currency_series([code], *start_end_date)[code]
+    return {date.isoformat(): rate for date, rate in series.items()}
 
-    if code == 'PLN':
-        # Use EUR to check calendar holidays (market closed days) since PLN is a fixed value of 1.
-        url = f'{api_url}eur/{start_end_date[0]}/{start_end_date[1]}/'
-        data = requests.get(url)
-        if data.status_code == 200:
-            return {item['effectiveDate']: 1 for item in data.json()['rates']}
 
-    else:
-        url = f'{api_url}{code}/{start_end_date[0]}/{start_end_date[1]}/'
-        data = requests.get(url)
-        if data.status_code == 200:
-            return {item['effectiveDate']: item['bid'] for item in data.json().get('rates')}
-
-        else:
-            raise ValueError({'error': f'Connection error {data.status_code}'})
-
-
-def fetch_historical_rate():
+def fetch_historical_rate(pairs=None):
     '''
-    Fetches and calculates historical exchange rates for all currency pairs.
+    Fetches and calculates historical exchange rates for the given currency pairs (all stored pairs by default).
 
-    This function retrieves historical exchange rates for all currency pairs stored
-    in the database. To optimize performance, it keeps already fetched currency rates
-    in memory, ensuring faster access if the same currency is requested again. The
-    calculated rates are then saved for each pair.
+    This function takes the distinct set of currency pairs stored in the database and reads the history of
+    every currency only once from the local series store. The series are joined on date into one table (dates x currencies) and the cross
+    rates of all pairs are calculated with one vectorized division. Missing rows are saved in bulk.
 
+    The number of queries does not depend on the number of pairs or stored days.
 
     :return: None
     '''
-    exchange = CurrencyExchangeRate.objects.all()
+    if pairs is None:
+        pairs = CurrencyExchangeRate.objects.values_list('currency_exchange_pair', flat=True).distinct()
+    pairs = sorted(pair for pair in set(pairs) if pair and len(pair) == 6)
+    if not pairs:
+        return
+
+    codes = {pair[:3] for pair in pairs} | {pair[3:] for pair in pairs}
 
-    # cache dict { 'EUR': {data1:rate1, date2:rate2, ... }, 'USD': { ....} }
-    # to avoid many request to the API for same rate which could make slower database save
-    rates_stored = {}
-    def get_stored_rates(code):
-        if code not in rates_stored:
-            rates_stored[code] = process_rates(code)
-        return rates_stored[code]
+    try:
+        # { 'EUR': {date1: rate1, ... }, 'USD': { ....} } read from the local series store, only fixings
+        # which are not stored yet are requested from the NBP API
+        series = {
+            code: {as_date(date): rate for date, rate in rates.items()}
+            for code, rates in currency_series(codes, *get_today_and_last_30_days()).items()
+        }
+
+        # dates x currencies table, days on which a currency has no rate are NaN
+        dates = sorted(set().union(*series.values()))
+        rows = {date: row for row, date in enumerate(dates)}
+        columns = {code: column for column, code in enumerate(series)}
+        table = numpy.full((len(dates), len(columns)), numpy.nan)
+        for code, rates in series.items():
+            table[[rows[date] for date in rates], columns[code]] = list(rates.values())
+
+        # dates x pairs, days on which one of the currencies has no rate (holidays) are dropped
+        base = table[:, [columns[pair[:3]] for pair in pairs]]
+        quote = table[:, [columns[pair[3:]] for pair in pairs]]
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            cross = base / quote
+        date_index, pair_index = numpy.nonzero(numpy.isfinite(cross))
+
+        save_historical_data([
+            (pairs[pair], dates[date], rate)
+            for date, pair, rate in zip(date_index.tolist(), pair_index.tolist(), cross[date_index, pair_index].tolist())
+        ])
+    except Exception as error:
+        return f'An error occurred {error}'
 
-    # currency & quote_currency asking get_cached_rates for rates and date. it reduces API request to minimum
-    for pair in exchange:
-        base_code = pair.currency_exchange_pair[0:3]
-        quote_code = pair.currency_exchange_pair[3:]
 
-        currency = get_stored_rates(base_code)
-        quote_currency = get_stored_rates(quote_code)
+def as_date(value):
+    return datetime.date.fromisoformat(value) if isinstance(value, str) else value
 
-        try:
-            combined_rates = [
-                (date, rate / quote_currency[date]) for date, rate in currency.items() if date in quote_currency
-            ]
-            save_historical_data(pair.currency_exchange_pair, combined_rates)
-        except Exception as error:
-            return f'An error occurred {error}'
 
-def save_transaction(code):
+def save_transaction(code, matrix=None):
     '''
 
     This function checks if the base and quote currencies exist in the database. If they exist, it save the currency pair
     to the CurrencyExchangeRate model with the current exchange rate and date, after that celery send task to fetch
     historical rates from 30 working days.
 
-    To avoid sending duplicate task to the Celery queue, a lock mechanism is implemented using Django caching system.
+    The row is not written on the request path, it is added to the write-behind transaction buffer which coalesces
+    observations of the same pair and date and saves them in batches.
+
+    To avoid sending duplicate task to the Celery queue, the pair is only marked dirty with atomic cache operations
+    and one debounced task refreshes all dirty pairs.
+
+    :param matrix: RateMatrix already resolved by the request, by default the current one is read.
 
     :return None
     '''
 
-    today = ((pandas.Timestamp.now().normalize() - pandas.offsets.BDay(1)).date() if pandas.Timestamp.now().weekday() >= 5 else pandas.Timestamp.now().normalize().date())
-    currency = Currency.objects.get(code=code[0:3])
+    if matrix is None:
+        matrix = get_rate_matrix()
+    # the row is dated by the table the rate comes from, before NBP publishes today's table that is the previous one
+    if matrix.version is not None and matrix.version.effective_date is not None:
+        fixing_date = matrix.version.effective_date
+    else:
+        fixing_date = latest_fixing_date()
     try:
-        quote_currency = Currency.objects.get(code=code[3:])
-    except Exception as error:
+        rate = matrix.rate(code[:3], code[3:])
+    except KeyError as error:
         raise ValueError(f"The base currency '{code[:3]}' or the quote currency '{code[3:]}' does not exist. Details: {error}")
 
 
-    CurrencyExchangeRate.objects.get_or_create(
-        currency=currency,
-        currency_exchange_pair=code,
-        currency_exchange_rate=currency.rate_currency/quote_currency.rate_currency,
-        currency_exchange_date=today
-    )
-    lock_key = f'loading_history:{code}'
+    # the row is written by the write-behind buffer, the request does not wait for the database
+    transaction_buffer.add(code, fixing_date, rate, matrix.currency_id(code[:3]))
 
-    # Used django cache to locking a pair of code (e.g, USDEUR) for 50 sec if someone request for it to many times to protect overload celery queue.
-    if not cache.get(lock_key):
-        cache.set(lock_key, True, timeout=50)
-        update_pair_history.delay()
+    # pairs requested within HISTORY_REFRESH_DEBOUNCE seconds are refreshed together by one celery task
+    schedule_history_refresh(code)
 
 
 
-def save_historical_data(symbol, historical_data):
+def save_historical_data(historical_data):
     '''
-    Saves historical exchange rate data for a currency pair.
+    Saves historical exchange rate data for many currency pairs.
 
-    historical_data: list of tuples, each containing a date (str) and rate (float).
-    '''
+    The stored (pair, date) keys in the range of the data are read with one query and only the missing rows are
+    inserted with bulk_create. The unique constraint skips rows saved by another worker in the meantime.
+
+    historical_data: list of tuples, each containing a pair (str), date (datetime.date) and rate (float).
 
-    base_currency = Currency.objects.get(code=symbol[:3])
-    for date, rate in historical_data:
-        CurrencyExchangeRate.objects.get_or_create(
-            currency_exchange_pair=symbol,
+    :return: int, number of saved rows (rows inserted concurrently by another worker may be counted as well).
+    '''
+    if not historical_data:
+        return 0
+
+    pairs = {pair for pair, date, rate in historical_data}
+    dates = [date for pair, date, rate in historical_data]
+    stored = set(
+        CurrencyExchangeRate.objects
+        .filter(currency_exchange_pair__in=pairs, currency_exchange_date__range=(min(dates), max(dates)))
+        .values_list('currency_exchange_pair', 'currency_exchange_date')
+    )
+    missing = {}
+    for pair, date, rate in historical_data:
+        if (pair, date) not in stored:
+            missing.setdefault((pair, date), rate)
+    if not missing:
+        return 0
+
+    currency_ids = dict(
+        Currency.objects.filter(code__in={pair[:3] for pair, date in missing}).values_list('code', 'id')
+    )
+    rows = [
+        CurrencyExchangeRate(
+            currency_id=currency_ids.get(pair[:3]),
+            currency_exchange_pair=pair,
+            currency_exchange_rate=rate,
             currency_exchange_date=date,
-            defaults={
-                'currency_exchange_rate': rate,
-                'currency': base_currency,
-            }
         )
+        for (pair, date), rate in missing.items()
+    ]
+    # rows stored by another worker since the read are skipped by the unique constraint
+    CurrencyExchangeRate.objects.bulk_create(
+        rows,
+        batch_size=1000,
+        ignore_conflicts=True,
+    )
+    return len(rows)
+
+
+EXPORT_COLUMNS = ('currency_exchange_pair', 'currency_exchange_rate', 'currency_exchange_date')
+EXPORT_HEADERS = ('Currency Pair', 'Exchange Rate', 'Exchange Date')
+EXPORT_CHUNK_SIZE = 2000
+
+# rows of an Excel worksheet without the header row, larger exports have to be downloaded as CSV
+EXCEL_MAX_ROWS = 1_048_575
+# characters Excel does not allow in worksheet titles, titles have at most 31 characters
+INVALID_TITLE_CHARACTERS = re.compile(r'[\\/?*\[\]:]')
+EXCEL_MAX_TITLE = 31
+
+
+def export_rows(queryset):
+    '''
+    Iterates the rows of an export chunk by chunk, without caching the whole queryset in memory.
+    '''
+    return queryset.values_list(*EXPORT_COLUMNS).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+
 
 def generate_excel_currencies(queryset, pair):
     '''
     Function generate an Excel file, includes exchange rate pair, exchange rate , exchange rate date.
 
+    The workbook is created in openpyxl write-only mode, rows are written to a temporary file as they are read
+    from the database and the file is streamed to the browser, so memory stays flat regardless of row count.
+
     :param queryset: QuerySet, filtered data containing exchange rate details.
 
-    :param pair: str, currency pair (e.g., 'USDEUR')
+    :param pair: str, currency pair (e.g., 'USDEUR') or another name of the export (e.g., 'USDEUR_USDGBP')
 
-    :return: HttpResponse, response containing the Excel file for download.
+    :return: FileResponse, response containing the Excel file for download, or None when there are no rows.
     '''
-    # prepare data to export to an Excel file.
-    data = list(queryset.values('currency_exchange_pair', 'currency_exchange_rate', 'currency_exchange_date'))
-    df = pandas.DataFrame(list(data))
-    df.rename(columns={
-        'currency_exchange_pair': 'Currency Pair',
-        'currency_exchange_rate': 'Exchange Rate',
-        'currency_exchange_date': 'Exchange Date',
-    }, inplace=True)
+    rows = export_rows(queryset)
+    first_row = next(rows, None)
+    if first_row is None:
+        return None
+
+    # openpyxl is loaded only by the export, it is not needed by the API and Celery workers
+    from openpyxl import Workbook
+    from openpyxl.utils import get_column_letter
+
+    workbook = Workbook(write_only=True)
+    title = INVALID_TITLE_CHARACTERS.sub('_', f'Exchange Rates {pair}')[:EXCEL_MAX_TITLE]
+    worksheet = workbook.create_sheet(title=title)
+
+    # add spaces in Excel file
+    for column in range(1, len(EXPORT_HEADERS) + 1):
+        worksheet.column_dimensions[get_column_letter(column)].width = 15
+
+    worksheet.append(EXPORT_HEADERS)
+    worksheet.append(first_row)
+    for row in rows:
+        worksheet.append(row)
+
+    excel_file = tempfile.TemporaryFile()
+    workbook.save(excel_file)
+    excel_file.seek(0)
 
     # create trigger to download an Excel file in web browser
-    response = HttpResponse(content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-    response['Content-Disposition'] = f'attachment; filename="{pair}_exchange_rates.xlsx"'
+    return FileResponse(
+        excel_file,
+        as_attachment=True,
+        filename=f'{pair}_exchange_rates.xlsx',
+        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    )
+
 
-    with pandas.ExcelWriter(response, engine='openpyxl') as writer:
-        df.to_excel(writer, index=False, sheet_name=f'Exchange Rates {pair}')
-        worksheet = writer.sheets[f'Exchange Rates {pair}']
+class Echo:
+    '''
+    File-like object which returns written values instead of storing them, used to stream CSV rows.
+    '''
+    def write(self, value):
+        return value
+
+
+def generate_csv_currencies(queryset, pair):
+    '''
+    Function streams a CSV file, includes exchange rate pair, exchange rate , exchange rate date.
+
+    :param queryset: QuerySet, filtered data containing exchange rate details.
+
+    :param pair: str, currency pair (e.g., 'USDEUR') or another name of the export.
+
+    :return: StreamingHttpResponse, rows are sent while they are read from the database.
+    '''
+    writer = csv.writer(Echo())
 
-        # add spaces in Excel file
-        for column, column_title in enumerate(df.columns, start=1):
-            column_letter = get_column_letter(column)
-            worksheet.column_dimensions[column_letter].width = 15
+    def rows():
+        yield writer.writerow(EXPORT_HEADERS)
+        for row in export_rows(queryset):
+            yield writer.writerow(row)
 
-    return response
\ No newline at end of file
+    response = StreamingHttpResponse(rows(), content_type='text/csv')
+    response['Content-Disposition'] = f'attachment; filename="{pair}_exchange_rates.csv"'
+    return response
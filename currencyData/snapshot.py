@@ -0,0 +1,141 @@
+import datetime
+import logging
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import uuid
+import numpy
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# magic, format, table version, published_at (ns), effective date (proleptic ordinal, 0 = none), number of codes
+HEADER = struct.Struct('<4sHqqiI')
+MAGIC = b'CXRS'
+FORMAT = 2
+
+
+class RateSnapshot:
+    '''
+    Read-only view of a snapshot file: the header, then rates (float64), the cross-rate matrix (float64, codes x
+    codes), Currency ids (16 byte UUIDs) and codes (3 ASCII bytes) of every currency. The arrays point into the
+    memory map, all processes reading the same file share one physical copy of them.
+    '''
+
+    def __init__(self, buffer):
+        magic, file_format, number, published_at, ordinal, count = HEADER.unpack_from(buffer)
+        if magic != MAGIC or file_format != FORMAT:
+            raise ValueError('Not a rates snapshot')
+        # imported here, rates imports this module
+        from .rates import RatesVersion
+        effective_date = datetime.date.fromordinal(ordinal) if ordinal else None
+        self.version = RatesVersion(number, effective_date, published_at)
+
+        offset = HEADER.size
+        self.rates = numpy.frombuffer(buffer, dtype='<f8', count=count, offset=offset)
+        offset += 8 * count
+        self.cross = numpy.frombuffer(buffer, dtype='<f8', count=count * count, offset=offset).reshape(count, count)
+        offset += 8 * count * count
+        self.ids = numpy.frombuffer(buffer, dtype='S16', count=count, offset=offset)
+        offset += 16 * count
+        self.codes = numpy.frombuffer(buffer, dtype='S3', count=count, offset=offset)
+
+    def matrix(self):
+        from .rates import RateMatrix
+        return RateMatrix(
+            [code.decode() for code in self.codes.tolist()],
+            self.rates,
+            [uuid.UUID(bytes=currency_id) for currency_id in self.ids.tolist()],
+            version=self.version,
+            # the worker reads the cross rates from the shared pages instead of dividing its own copy
+            matrix=self.cross,
+        )
+
+
+def snapshot_path():
+    '''
+    Path of the snapshot file, None when RATES_SNAPSHOT_PATH is not set.
+    '''
+    path = getattr(settings, 'RATES_SNAPSHOT_PATH', None)
+    return os.fspath(path) if path else None
+
+
+def write_snapshot(matrix):
+    '''
+    Writes the codes, rates, cross rates and version of a RateMatrix to the snapshot file. It is called only by the
+    process which publishes a new rates version, after the new rates were committed.
+
+    The file is written next to the old one and renamed over it, readers map either the old or the new file and
+    never see half of it. A snapshot which can not be written is logged, the workers build their matrix from the
+    database then.
+
+    :return: bool, True when the snapshot was written.
+    '''
+    path = snapshot_path()
+    if path is None:
+        return False
+
+    version = matrix.version
+    count = len(matrix.codes)
+    header = HEADER.pack(
+        MAGIC, FORMAT, version.number, version.published_at,
+        version.effective_date.toordinal() if version.effective_date else 0, count,
+    )
+    body = (
+        numpy.asarray(matrix.rates, dtype='<f8').tobytes()
+        + numpy.asarray(matrix.matrix, dtype='<f8').tobytes()
+        + b''.join(uuid.UUID(str(currency_id)).bytes for currency_id in matrix.ids)
+        + numpy.array([code.encode() for code in matrix.codes], dtype='S3').tobytes()
+    )
+    try:
+        directory = os.path.dirname(os.path.abspath(path))
+        with tempfile.NamedTemporaryFile(dir=directory, prefix='.rates-', delete=False) as file:
+            file.write(header + body)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(file.name, path)
+    except OSError as error:
+        logger.warning('Could not write the rates snapshot %s: %s', path, error)
+        return False
+    return True
+
+
+_snapshot = None
+# (device, inode, size, mtime) of the mapped file, a new file is mapped only when it changed
+_signature = None
+_snapshot_lock = threading.Lock()
+
+
+def read_snapshot():
+    '''
+    Returns the mapped snapshot file. The file is stat-ed on every call and mapped again only after it was
+    replaced, so reading an unchanged snapshot costs one stat.
+
+    :return: RateSnapshot or None when there is no valid snapshot.
+    '''
+    global _snapshot, _signature
+    path = snapshot_path()
+    if path is None:
+        return None
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    signature = (stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns)
+    if signature == _signature:
+        return _snapshot
+
+    with _snapshot_lock:
+        if signature != _signature:
+            try:
+                with open(path, 'rb') as file:
+                    # the mapping stays valid after the file is closed or replaced
+                    buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+                _snapshot = RateSnapshot(buffer)
+            except (OSError, ValueError, struct.error) as error:
+                logger.warning('Could not read the rates snapshot %s: %s', path, error)
+                _snapshot = None
+            _signature = signature
+        return _snapshot
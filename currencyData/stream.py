@@ -0,0 +1,250 @@
+import asyncio
+import json
+import logging
+import math
+import threading
+from django.conf import settings
+from django.dispatch import receiver
+from .rates import aget_rate_matrix, rates_published
+
+logger = logging.getLogger(__name__)
+
+# Redis pub/sub channel on which every process announces newly published rates
+RATES_CHANNEL = 'currencyExchange:currency_rates:updates'
+
+# Defaults used when settings.py does not define the RATES_STREAM_* settings
+DEFAULT_HEARTBEAT = 15
+DEFAULT_POLL_INTERVAL = 30
+DEFAULT_MAX_PAIRS = 100
+
+# seconds before a lost Redis subscription is opened again
+RECONNECT_DELAY = 5
+
+
+def redis_url():
+    '''
+    URL of the shared Redis cache, None when the cache is local to the process (pub/sub is not used then).
+    '''
+    cache = settings.CACHES['default']
+    return cache['LOCATION'] if cache['BACKEND'].endswith('RedisCache') else None
+
+
+def format_event(version, pair, rate):
+    data = json.dumps({'currency_pair': pair, 'exchange_rate': rate})
+    return f'event: rate\nid: {version.number if version else 0}\ndata: {data}\n\n'
+
+
+def rate_events(matrix, pairs):
+    '''
+    Server-sent events of the rates of the pairs, every event is formatted once and shared by all subscribers.
+
+    :return: dict, { pair: (rate, event) } of the pairs which can be converted.
+    '''
+    pairs = [pair for pair in pairs if pair[:3] in matrix and pair[3:] in matrix]
+    if not pairs:
+        return {}
+    rates = matrix.rates_many([pair[:3] for pair in pairs], [pair[3:] for pair in pairs]).tolist()
+    return {
+        pair: (rate, format_event(matrix.version, pair, rate))
+        for pair, rate in zip(pairs, rates) if not math.isnan(rate)
+    }
+
+
+class Subscriber:
+    '''
+    One stream client. Updates of a pair replace the not yet sent ones, so a slow client never queues more than one
+    event per pair.
+    '''
+
+    def __init__(self, pairs):
+        self.pairs = frozenset(pairs)
+        self.pending = {}
+        self.ready = asyncio.Event()
+
+    def push(self, events):
+        self.pending.update(events)
+        self.ready.set()
+
+    async def next_events(self, timeout):
+        '''
+        Waits for updates, returns [] when nothing changed within the timeout.
+        '''
+        try:
+            await asyncio.wait_for(self.ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            return []
+        self.ready.clear()
+        pending, self.pending = self.pending, {}
+        return list(pending.values())
+
+
+class RateBroadcaster:
+    '''
+    Fans out rate updates to all stream subscribers of the process.
+
+    One task per process waits for new rates: a message on the Redis channel (load_rates or an admin edit in any
+    process), a local rates_published signal, or every RATES_STREAM_POLL_INTERVAL seconds as a fallback for lost
+    messages. The new rates of all subscribed pairs are computed once with one vectorized lookup and only the
+    changed pairs are pushed to the subscribers of these pairs.
+    '''
+
+    def __init__(self):
+        self.subscribers = set()
+        self.rates = {}
+        self.version = None
+        self._loop = None
+        self._task = None
+        self._wakeup = None
+
+    async def subscribe(self, pairs):
+        '''
+        Registers a subscriber of the pairs.
+
+        :return: tuple (Subscriber, list of events with the current rates of the pairs)
+        '''
+        self._ensure_task()
+        subscriber = Subscriber(pairs)
+        events = rate_events(await aget_rate_matrix(), subscriber.pairs)
+        for pair, (rate, event) in events.items():
+            # pairs followed already keep their last broadcast rate, the next change is sent to everybody
+            self.rates.setdefault(pair, rate)
+        self.subscribers.add(subscriber)
+        return subscriber, [event for rate, event in events.values()]
+
+    def unsubscribe(self, subscriber):
+        self.subscribers.discard(subscriber)
+        if not self.subscribers and self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def notify(self):
+        '''
+        Wakes the broadcaster up, safe to call from any thread.
+        '''
+        loop, wakeup = self._loop, self._wakeup
+        if loop is None or loop.is_closed():
+            return
+        try:
+            loop.call_soon_threadsafe(wakeup.set)
+        except RuntimeError:
+            # the loop was closed in the meantime
+            pass
+
+    async def broadcast(self):
+        '''
+        Pushes the changed rates of the subscribed pairs to their subscribers.
+
+        :return: int, number of notified subscribers.
+        '''
+        matrix = await aget_rate_matrix()
+        if matrix.version == self.version:
+            return 0
+        self.version = matrix.version
+
+        events = rate_events(matrix, set().union(*(subscriber.pairs for subscriber in self.subscribers)))
+        changed = {}
+        for pair, (rate, event) in events.items():
+            if self.rates.get(pair) != rate:
+                self.rates[pair] = rate
+                changed[pair] = event
+
+        notified = 0
+        for subscriber in list(self.subscribers):
+            updates = {pair: changed[pair] for pair in subscriber.pairs & changed.keys()}
+            if updates:
+                subscriber.push(updates)
+                notified += 1
+        return notified
+
+    def _ensure_task(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # a new event loop (e.g. a restarted server) starts without the subscribers of the old one
+            self._loop, self._wakeup, self._task = loop, asyncio.Event(), None
+            self.subscribers, self.rates, self.version = set(), {}, None
+        if self._task is None or self._task.done():
+            self._task = loop.create_task(self._run())
+
+    async def _run(self):
+        listener = asyncio.create_task(self._listen()) if redis_url() else None
+        poll_interval = getattr(settings, 'RATES_STREAM_POLL_INTERVAL', DEFAULT_POLL_INTERVAL)
+        try:
+            while True:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+                try:
+                    await self.broadcast()
+                except Exception:
+                    logger.exception('Could not broadcast the rates')
+        finally:
+            if listener is not None:
+                listener.cancel()
+
+    async def _listen(self):
+        import redis.asyncio
+
+        while True:
+            client = redis.asyncio.from_url(redis_url())
+            try:
+                async with client.pubsub() as pubsub:
+                    await pubsub.subscribe(RATES_CHANNEL)
+                    async for message in pubsub.listen():
+                        if message['type'] == 'message':
+                            self._wakeup.set()
+            except asyncio.CancelledError:
+                raise
+            except Exception as error:
+                logger.warning('Rates stream subscription lost: %s', error)
+                await asyncio.sleep(RECONNECT_DELAY)
+            finally:
+                await client.aclose()
+
+
+broadcaster = RateBroadcaster()
+
+_publisher = None
+_publisher_lock = threading.Lock()
+
+
+def publish_rates_update():
+    '''
+    Announces new rates to the broadcasters of all processes through Redis.
+    '''
+    global _publisher
+    url = redis_url()
+    if url is None:
+        return
+    try:
+        with _publisher_lock:
+            if _publisher is None:
+                import redis
+                _publisher = redis.Redis.from_url(url)
+        _publisher.publish(RATES_CHANNEL, 'rates')
+    except Exception as error:
+        # the broadcasters poll the rates version as well, a lost message only delays the update
+        logger.warning('Could not publish the rates update: %s', error)
+
+
+@receiver(rates_published)
+def rates_changed(sender, version, **kwargs):
+    broadcaster.notify()
+    publish_rates_update()
+
+
+async def stream_rates(pairs):
+    '''
+    Async generator of the server-sent events of a client: the current rates first, then the changed rates after
+    every publication and a comment every RATES_STREAM_HEARTBEAT seconds to keep the connection open.
+    '''
+    heartbeat = getattr(settings, 'RATES_STREAM_HEARTBEAT', DEFAULT_HEARTBEAT)
+    subscriber, events = await broadcaster.subscribe(pairs)
+    try:
+        yield 'retry: 5000\n\n' + ''.join(events)
+        while True:
+            events = await subscriber.next_events(heartbeat)
+            yield ''.join(events) if events else ': keep-alive\n\n'
+    finally:
+        broadcaster.unsubscribe(subscriber)
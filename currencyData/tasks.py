@@ -1,11 +1,32 @@
 from celery import shared_task
 
 @shared_task
-def update_pair_history():
+def update_pair_history(pairs=None):
     '''
-    Celery task to fetch and update historical exchange rates for all currency pairs.
+    Celery task to fetch and update historical exchange rates.
+
+    The task is debounced by schedule_history_refresh, it refreshes only the pairs which were marked dirty since
+    the previous run (or the given pairs).
     '''
 
     from .services import fetch_historical_rate
-    fetch_historical_rate()
+    from .scheduler import pop_dirty_pairs
+
+    pairs = set(pairs) if pairs is not None else pop_dirty_pairs()
+    if pairs:
+        fetch_historical_rate(pairs)
+
+
+
+@shared_task
+def refresh_rates():
+    '''
+    Celery beat task polling NBP for the new table C after its publication window.
+
+    :return: int, version of the loaded table or None when there was no new table.
+    '''
+
+    from .services import poll_currency_rates
 
+    rate_table = poll_currency_rates()
+    return rate_table.version if rate_table is not None else None
@@ -0,0 +1,214 @@
+import datetime
+import threading
+import time
+import numpy
+from django.core.cache import cache
+from .models import TradingDay
+
+# Shared key holding the version of the learned trading days, bumped every time a correction is saved.
+CALENDAR_VERSION_KEY = 'trading_calendar:version'
+
+# seconds between checks of the shared version, the calendar is rebuilt only when it changed
+VERSION_CHECK_INTERVAL = 60
+
+# first day of the NBP API archive
+FIRST_DAY = datetime.date(2002, 1, 2)
+
+
+def today():
+    return datetime.date.today()
+
+
+def easter_sunday(year):
+    '''
+    Date of Easter Sunday in the Gregorian calendar (Meeus/Jones/Butcher algorithm).
+    '''
+    a = year % 19
+    b, c = divmod(year, 100)
+    d, e = divmod(b, 4)
+    g = (b - (b + 8) // 25 + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month, day = divmod(h + l - 7 * m + 114, 31)
+    return datetime.date(year, month, day + 1)
+
+
+def polish_holidays(year):
+    '''
+    Public holidays in Poland, NBP does not publish exchange rate tables on them.
+    '''
+    easter = easter_sunday(year)
+    holidays = {
+        datetime.date(year, 1, 1),
+        datetime.date(year, 5, 1),
+        datetime.date(year, 5, 3),
+        datetime.date(year, 8, 15),
+        datetime.date(year, 11, 1),
+        datetime.date(year, 11, 11),
+        datetime.date(year, 12, 25),
+        datetime.date(year, 12, 26),
+        easter + datetime.timedelta(days=1),
+        # Corpus Christi
+        easter + datetime.timedelta(days=60),
+    }
+    if year >= 2011:
+        holidays.add(datetime.date(year, 1, 6))
+    if year >= 2025:
+        holidays.add(datetime.date(year, 12, 24))
+    return holidays
+
+
+class TradingCalendar:
+    '''
+    Sorted array of the days on which NBP publishes exchange rate tables, from FIRST_DAY to the end of the next year.
+
+    The days follow the rules (Monday to Friday without Polish public holidays) corrected by the learned
+    TradingDay rows. For every calendar day the index of the last publication day on or before it is precomputed,
+    so the lookups are O(1).
+    '''
+
+    def __init__(self, corrections=None, version=None, built_on=None):
+        self.version = version
+        self.built_on = built_on or today()
+        self.first = numpy.datetime64(FIRST_DAY, 'D')
+        last = numpy.datetime64(datetime.date(self.built_on.year + 1, 12, 31), 'D')
+
+        holidays = [day for year in range(FIRST_DAY.year, self.built_on.year + 2) for day in polish_holidays(year)]
+        calendar = numpy.arange(self.first, last + 1)
+        published = numpy.is_busday(calendar, holidays=numpy.array(holidays, dtype='datetime64[D]'))
+        for date, is_published in (corrections or {}).items():
+            offset = (date - FIRST_DAY).days
+            if 0 <= offset < len(published):
+                published[offset] = is_published
+
+        self.days = calendar[published]
+        # index of the last publication day on or before every calendar day (-1 before the first one)
+        self.latest = numpy.cumsum(published) - 1
+
+    def __len__(self):
+        return len(self.days)
+
+    def _latest_index(self, date):
+        offset = (date - FIRST_DAY).days
+        if offset < 0:
+            raise ValueError(f'The trading calendar starts on {FIRST_DAY}')
+        index = self.latest[min(offset, len(self.latest) - 1)]
+        if index < 0:
+            raise ValueError(f'There is no NBP table before {date}')
+        return int(index)
+
+    def is_published(self, date):
+        '''
+        True when NBP publishes a table on the date.
+        '''
+        index = self._latest_index(date)
+        return self.days[index].item() == date
+
+    def latest_fixing_date(self, date=None):
+        '''
+        Last publication day on or before the date (today by default).
+        '''
+        return self.days[self._latest_index(date or today())].item()
+
+    def business_days_back(self, count, date=None):
+        '''
+        Publication day count tables before the latest fixing date of the date (0 is the latest fixing date).
+        '''
+        return self.days[max(self._latest_index(date or today()) - count, 0)].item()
+
+    def business_days_back_many(self, count, dates):
+        '''
+        business_days_back of many dates at once.
+
+        :param dates: sequence of dates.
+
+        :return: numpy array of datetime64[D], NaT for dates before the first table.
+        '''
+        offsets = (numpy.asarray(dates, dtype='datetime64[D]') - self.first).astype(numpy.int64)
+        indexes = self.latest[numpy.clip(offsets, 0, len(self.latest) - 1)]
+        days = self.days[numpy.maximum(indexes - count, 0)]
+        return numpy.where((offsets >= 0) & (indexes >= 0), days, numpy.datetime64('NaT'))
+
+    def days_between(self, date_start, date_end):
+        '''
+        Publication days between two dates (both included) as a list of datetime.date.
+        '''
+        start = numpy.searchsorted(self.days, numpy.datetime64(date_start, 'D'))
+        end = numpy.searchsorted(self.days, numpy.datetime64(date_end, 'D'), side='right')
+        return self.days[start:end].tolist()
+
+
+_calendar = None
+_checked_at = 0
+_calendar_lock = threading.Lock()
+
+
+def get_trading_calendar():
+    '''
+    Returns the trading calendar of this worker. It is rebuilt on a new day and when corrections were learned by any
+    worker, the shared version is checked at most every VERSION_CHECK_INTERVAL seconds.
+
+    :return: TradingCalendar
+    '''
+    global _calendar, _checked_at
+    calendar = _calendar
+    now = time.monotonic()
+    if calendar is not None and calendar.built_on == today() and now - _checked_at < VERSION_CHECK_INTERVAL:
+        return calendar
+
+    with _calendar_lock:
+        version = cache.get(CALENDAR_VERSION_KEY)
+        if _calendar is None or _calendar.built_on != today() or _calendar.version != version:
+            corrections = dict(TradingDay.objects.values_list('date', 'published'))
+            _calendar = TradingCalendar(corrections, version)
+        _checked_at = now
+        return _calendar
+
+
+def latest_fixing_date(date=None):
+    '''
+    Last day on or before the date (today by default) on which NBP published a table.
+    '''
+    return get_trading_calendar().latest_fixing_date(date)
+
+
+def business_days_back(count, date=None):
+    '''
+    Publication day count tables before the latest fixing date of the date (today by default).
+    '''
+    return get_trading_calendar().business_days_back(count, date)
+
+
+def learn_trading_days(published=(), closed=()):
+    '''
+    Saves the days on which NBP did (published) or did not (closed) publish a table, when they differ from the
+    calendar. Every worker rebuilds its calendar after the next version check.
+
+    :return: int, number of saved corrections.
+    '''
+    calendar = get_trading_calendar()
+    corrections = [
+        TradingDay(date=date, published=is_published)
+        for days, is_published in ((published, True), (closed, False))
+        for date in set(days)
+        if FIRST_DAY <= date and calendar.is_published(date) != is_published
+    ]
+    if not corrections:
+        return 0
+
+    TradingDay.objects.bulk_create(
+        corrections, update_conflicts=True, unique_fields=['date'], update_fields=['published'],
+    )
+    cache.set(CALENDAR_VERSION_KEY, time.time_ns(), timeout=None)
+    invalidate_trading_calendar()
+    return len(corrections)
+
+
+def invalidate_trading_calendar():
+    '''
+    Drops the calendar of this worker, it is rebuilt from the rules and the learned days on the next lookup.
+    '''
+    global _calendar
+    _calendar = None
@@ -1,5 +1,6 @@
 import os
 from celery import Celery
+from celery.schedules import crontab
 
 # Sets up the Celery application for the currencyExchange project.
 
@@ -9,4 +10,15 @@ app = Celery('currencyExchange')
 
 app.config_from_object('django.conf:settings', namespace='CELERY')
 
-app.autodiscover_tasks()
\ No newline at end of file
+app.autodiscover_tasks()
+
+# NBP publishes table C on business days between 7:45 and 8:15 (Warsaw time). The task is polled every 5 minutes
+# until 10:00, polls after the table was loaded do not call NBP and polls before it was published are answered
+# with 304 Not Modified. Start it with: celery -A currencyExchange beat
+app.conf.beat_schedule = {
+    'refresh-rates': {
+        'task': 'currencyData.tasks.refresh_rates',
+        'schedule': crontab(minute='*/5', hour='7-9', day_of_week='mon-fri'),
+        'options': {'expires': 5 * 60},
+    },
+}
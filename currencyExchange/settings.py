@@ -46,6 +46,7 @@ INSTALLED_APPS = [
 
 
 MIDDLEWARE = [
+    'currencyData.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -139,4 +140,75 @@ STATIC_URL = 'static/'
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 CELERY_BROKER_URL = 'redis://localhost:6379/0'
-CELERY_RESULT_BACKEND = 'redis://localhost:6379/0'
\ No newline at end of file
+CELERY_RESULT_BACKEND = 'redis://localhost:6379/0'
+# the beat schedule follows the NBP publication hours
+CELERY_TIMEZONE = 'Europe/Warsaw'
+
+# Shared cache of all web and Celery workers (rates version, history refresh scheduling, NBP responses).
+# Set CACHE_URL=locmem:// to use a per-process local-memory cache instead of Redis (e.g. for tests).
+CACHE_URL = os.environ.get('CACHE_URL', 'redis://localhost:6379/1')
+
+if CACHE_URL.startswith('locmem://'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_URL,
+            'KEY_PREFIX': 'currencyExchange',
+        }
+    }
+
+# Write-behind buffer of the transactions saved by /currency/<base>/<quote>/.
+# Pending rows are flushed every TRANSACTION_BUFFER_FLUSH_INTERVAL seconds (0 writes immediately),
+# or as soon as the buffer holds TRANSACTION_BUFFER_MAX_SIZE pairs, and on shutdown.
+TRANSACTION_BUFFER_FLUSH_INTERVAL = 5
+TRANSACTION_BUFFER_MAX_SIZE = 500
+
+# NBP API client: pooled session, timeouts (connect, read) in seconds and retries with exponential backoff
+# on 429/5xx responses. NBP_MAX_WORKERS bounds concurrent requests of multi-currency history fetches.
+NBP_API_URL = 'https://api.nbp.pl/api/'
+NBP_TIMEOUT = (3.05, 10)
+NBP_RETRIES = 3
+NBP_BACKOFF = 0.5
+NBP_MAX_WORKERS = 8
+
+# Pairs requested within HISTORY_REFRESH_DEBOUNCE seconds are refreshed together by one update_pair_history task.
+HISTORY_REFRESH_DEBOUNCE = 50
+
+# Prometheus metrics served by /metrics. Values are collected in every process and added to the shared cache
+# every METRICS_FLUSH_INTERVAL seconds (0 adds them immediately). Only METRICS_SAMPLE_RATE of the requests are
+# timed and get their SQL queries counted, all requests are counted.
+METRICS_FLUSH_INTERVAL = 10
+METRICS_SAMPLE_RATE = 0.1
+
+# Server-sent events stream of rate updates (/async/currency/stream/). New rates are announced on a Redis channel
+# of the cache server, the rates version is also polled every RATES_STREAM_POLL_INTERVAL seconds in case a message
+# is lost. A comment is sent every RATES_STREAM_HEARTBEAT seconds to keep idle connections open.
+RATES_STREAM_HEARTBEAT = 15
+RATES_STREAM_POLL_INTERVAL = 30
+RATES_STREAM_MAX_PAIRS = 100
+
+# Maximum number of pairs of one /currency/analytics/ request.
+ANALYTICS_MAX_PAIRS = 100
+
+# Maximum number of items of one /currency/batch/ (and /async/currency/batch/) request.
+BATCH_MAX_ITEMS = 1000
+
+# Maximum number of (pair, date) items of one /currency/as-of/ request.
+AS_OF_MAX_ITEMS = 100000
+# bodies of 100000 as-of items are about 6 MB, Django rejects bodies over 2.5 MB by default
+DATA_UPLOAD_MAX_MEMORY_SIZE = 10 * 1024 * 1024
+
+# An as-of rate more than this number of publication days older than the fixing of the requested date is an error
+# (the stored series were not synced up to the date), future dates are rejected as well.
+AS_OF_MAX_STALE_DAYS = 3
+
+# Binary snapshot of the current rates written with every published rates version. All web and Celery workers of
+# the host memory-map it instead of querying the Currency table. Set it to None (or an empty
+# RATES_SNAPSHOT_PATH variable) to build the rates from the database in every worker.
+RATES_SNAPSHOT_PATH = os.environ.get('RATES_SNAPSHOT_PATH', BASE_DIR / 'rates.snapshot')
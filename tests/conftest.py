@@ -0,0 +1,103 @@
+import hashlib
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from django.conf import settings as django_settings
+from django.core.cache import cache
+from currencyData import rates, snapshot
+from currencyData.trading_calendar import invalidate_trading_calendar
+
+# settings read the secret key from the environment, tests and benchmarks run without it
+if not os.environ.get('currencyExchangeSecretKey'):
+    django_settings.SECRET_KEY = 'tests'
+
+
+@pytest.fixture(autouse=True)
+def local_settings(settings, tmp_path):
+    """Use a local-memory cache and write transactions and metrics immediately instead of from background threads."""
+    settings.CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+    settings.RATES_SNAPSHOT_PATH = tmp_path / 'rates.snapshot'
+    settings.TRANSACTION_BUFFER_FLUSH_INTERVAL = 0
+    settings.METRICS_FLUSH_INTERVAL = 0
+
+
+@pytest.fixture(autouse=True)
+def fresh_worker(local_settings, monkeypatch):
+    """Start every test like a new worker, without the rates published and cached by the previous tests."""
+    cache.clear()
+    monkeypatch.setattr(rates, '_matrix', None)
+    monkeypatch.setattr(snapshot, '_snapshot', None)
+    monkeypatch.setattr(snapshot, '_signature', None)
+
+
+@pytest.fixture(autouse=True)
+def trading_calendar():
+    """Build the trading calendar from the rules and the days learned in every test only."""
+    invalidate_trading_calendar()
+    yield
+    invalidate_trading_calendar()
+
+
+class StubNBPServer(ThreadingHTTPServer):
+    """Local HTTP server answering like the NBP API, used to test and benchmark the client offline."""
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), StubNBPHandler)
+        # { path: [(status, body), ...] } the last response of a path is repeated
+        self.routes = {}
+        self.requests = []
+        # paths answered with 304 Not Modified
+        self.not_modified = []
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server_port}/api/'
+
+    def add(self, path, body, status=200):
+        self.routes.setdefault(f'/api/{path}', []).append((status, body))
+
+
+class StubNBPHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.server.requests.append(self.path)
+        responses = self.server.routes.get(self.path, [(404, 'NotFound - Not Found - Brak danych')])
+        status, body = responses.pop(0) if len(responses) > 1 else responses[0]
+        payload = (body if isinstance(body, str) else json.dumps(body)).encode()
+        etag = f'"{hashlib.md5(payload).hexdigest()}"'
+
+        if status == 200 and self.headers.get('If-None-Match') == etag:
+            self.server.not_modified.append(self.path)
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+
+        self.send_response(status)
+        self.send_header('ETag', etag)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def nbp_server(settings):
+    """Points the NBP client at a local stub server."""
+    server = StubNBPServer()
+    thread = threading.Thread(target=server.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True)
+    thread.start()
+    settings.NBP_API_URL = server.url
+    settings.NBP_BACKOFF = 0
+    cache.clear()
+
+    yield server
+
+    server.shutdown()
+    server.server_close()
@@ -0,0 +1,81 @@
+import datetime
+import io
+import pytest
+from django.urls import reverse
+from openpyxl import load_workbook
+from currencyData import admin
+from currencyData.models import Currency, CurrencyExchangeRate
+from currencyData.services import generate_excel_currencies
+
+
+@pytest.fixture
+def history(db):
+    usd = Currency.objects.create(code='USD', rate_currency=4.0)
+    for pair, rate in (('USDEUR', 0.93), ('USDGBP', 0.79), ('USDJPY', 150.0)):
+        for day in (2, 3, 4):
+            CurrencyExchangeRate.objects.create(currency=usd, currency_exchange_pair=pair, currency_exchange_rate=rate,
+                                                currency_exchange_date=datetime.date(2024, 12, day))
+
+
+def test_export_excel_pair(admin_client, history):
+    """Test exporting history of one pair to Excel."""
+    response = admin_client.get(reverse('admin:export_filtered_currencies') + '?currency_exchange_pair=USDEUR')
+
+    assert response['Content-Disposition'] == 'attachment; filename="USDEUR_exchange_rates.xlsx"'
+    worksheet = load_workbook(io.BytesIO(b''.join(response.streaming_content))).active
+    rows = list(worksheet.values)
+    assert rows[0] == ('Currency Pair', 'Exchange Rate', 'Exchange Date')
+    assert [row[0] for row in rows[1:]] == ['USDEUR'] * 3
+
+
+def test_export_csv_pairs_and_date_range(admin_client, history):
+    """Test streaming many pairs in a date range to CSV."""
+    response = admin_client.get(reverse('admin:export_filtered_currencies'), {
+        'currency_exchange_pair': 'USDEUR,USDGBP',
+        'currency_exchange_date__range__gte': '2024-12-03',
+        'export_format': 'csv',
+    })
+
+    rows = b''.join(response.streaming_content).decode().splitlines()
+    assert rows[0] == 'Currency Pair,Exchange Rate,Exchange Date'
+    assert sorted(rows[1:]) == ['USDEUR,0.93,2024-12-03', 'USDEUR,0.93,2024-12-04',
+                                'USDGBP,0.79,2024-12-03', 'USDGBP,0.79,2024-12-04']
+
+
+def test_export_without_rows(admin_client, history):
+    """Test message when no rows match the filters."""
+    response = admin_client.get(reverse('admin:export_filtered_currencies') + '?currency_exchange_pair=EURCHF')
+
+    assert b'There is no pair of currencies' in response.content
+
+
+def test_export_excel_title_of_any_pair(admin_client, history):
+    """Test that pairs with characters Excel does not allow in sheet titles are exported."""
+    CurrencyExchangeRate.objects.create(currency_exchange_pair='EUR/USD?', currency_exchange_rate=1.05,
+                                        currency_exchange_date=datetime.date(2024, 12, 2))
+
+    response = admin_client.get(reverse('admin:export_filtered_currencies'), {
+        'currency_exchange_pair': 'EUR/USD?,USDEUR,USDGBP,USDJPY',
+    })
+
+    assert response.status_code == 200
+    worksheet = load_workbook(io.BytesIO(b''.join(response.streaming_content))).active
+    assert worksheet.title == 'Exchange Rates currencies'
+    assert len(list(worksheet.values)) == 11
+
+    response = generate_excel_currencies(CurrencyExchangeRate.objects.all(), 'EUR/USD?[1]:*_USDEUR_USDGBP')
+    assert load_workbook(io.BytesIO(b''.join(response.streaming_content))).active.title == \
+        'Exchange Rates EUR_USD__1____US'
+
+
+def test_export_excel_row_limit(admin_client, history, monkeypatch):
+    """Test that histories longer than an Excel sheet are rejected, CSV exports them."""
+    monkeypatch.setattr(admin, 'EXCEL_MAX_ROWS', 2)
+
+    response = admin_client.get(reverse('admin:export_filtered_currencies'), {'currency_exchange_pair': 'USDEUR'})
+    assert response.status_code == 400
+
+    response = admin_client.get(reverse('admin:export_filtered_currencies'), {
+        'currency_exchange_pair': 'USDEUR', 'export_format': 'csv',
+    })
+    assert len(b''.join(response.streaming_content).decode().splitlines()) == 4
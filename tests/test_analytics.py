@@ -0,0 +1,71 @@
+import datetime
+import numpy
+import pytest
+from django.core.cache import cache
+from django.urls import reverse
+from rest_framework.test import APIClient
+from currencyData.analytics import rolling_mean_std, max_drawdowns
+from currencyData.models import CurrencyDailyRate
+from currencyData.series import SERIES_VERSION_KEY
+
+USD = [4.0, 4.1, 4.05, 4.2, 3.9]
+EUR = [4.3, 4.35, 4.3, 4.4, 4.25]
+
+
+def test_rolling_statistics():
+    """Test rolling mean and std of many rows with gaps against a direct calculation."""
+    values = numpy.array([[1.0, 2.0, 4.0, 3.0, 5.0], [2.0, numpy.nan, 2.0, 3.0, 4.0]])
+
+    means, stds = rolling_mean_std(values, 3)
+
+    assert numpy.allclose(means[0], [numpy.nan, numpy.nan, 7 / 3, 3.0, 4.0], equal_nan=True)
+    assert numpy.allclose(stds[0, 2:], [numpy.std(values[0, i - 2:i + 1], ddof=1) for i in range(2, 5)])
+    assert numpy.isnan(means[1, :4]).all() and means[1, 4] == 3.0
+    assert max_drawdowns(values).tolist() == [-0.25, 0.0]
+
+
+@pytest.mark.django_db
+def test_get_currency_analytics(django_assert_num_queries):
+    """Test that the analytics of many pairs are derived from the stored series and cached per series version."""
+    dates = [datetime.date(2024, 12, day) for day in range(2, 7)]
+    CurrencyDailyRate.objects.bulk_create(
+        [CurrencyDailyRate(code='USD', rate_currency=rate, rate_date=date) for date, rate in zip(dates, USD)]
+        + [CurrencyDailyRate(code='EUR', rate_currency=rate, rate_date=date) for date, rate in zip(dates, EUR)]
+    )
+    cache.set(SERIES_VERSION_KEY, 'analytics-1')
+
+    client = APIClient()
+    response = client.get(reverse('getCurrencyAnalytics'), {'pairs': 'usdeur,EURPLN', 'window': 3})
+
+    assert response.status_code == 200
+    assert response.data['dates'][0] == '2024-12-02'
+    usdeur = numpy.array(USD) / numpy.array(EUR)
+    assert response.data['pairs']['USDEUR']['rolling_mean'][:2] == [None, None]
+    assert numpy.allclose(response.data['pairs']['USDEUR']['rolling_mean'][2:],
+                          [usdeur[i - 2:i + 1].mean() for i in range(2, 5)])
+    assert response.data['pairs']['EURPLN']['max_drawdown'] == pytest.approx(4.25 / 4.4 - 1)
+    assert response.data['correlation']['currencies'] == ['EUR', 'USD']
+    assert response.data['correlation']['matrix'][0][0] == pytest.approx(1.0)
+
+    with django_assert_num_queries(0):
+        assert client.get(reverse('getCurrencyAnalytics'), {'pairs': 'USDEUR,EURPLN', 'window': 3}).status_code == 200
+
+    assert client.get(reverse('getCurrencyAnalytics'), {'pairs': 'USDJPY'}).status_code == 400
+    assert client.get(reverse('getCurrencyAnalytics'), {'pairs': 'USDEUR', 'window': 1}).status_code == 400
+
+
+@pytest.mark.django_db
+def test_analytics_without_series_version():
+    """Test that analytics computed before the series version is known are not served after the version is lost."""
+    dates = [datetime.date(2024, 12, day) for day in range(2, 7)]
+    CurrencyDailyRate.objects.bulk_create(
+        [CurrencyDailyRate(code='USD', rate_currency=rate, rate_date=date) for date, rate in zip(dates, USD)]
+    )
+    client = APIClient()
+    assert client.get(reverse('getCurrencyAnalytics'), {'pairs': 'USDEUR'}).status_code == 400
+
+    CurrencyDailyRate.objects.bulk_create(
+        [CurrencyDailyRate(code='EUR', rate_currency=rate, rate_date=date) for date, rate in zip(dates, EUR)]
+    )
+    cache.delete(SERIES_VERSION_KEY)
+    assert client.get(reverse('getCurrencyAnalytics'), {'pairs': 'USDEUR'}).status_code == 200
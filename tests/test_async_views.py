@@ -0,0 +1,138 @@
+import asyncio
+import datetime
+import pytest
+from asgiref.sync import async_to_sync, sync_to_async
+from django.test import AsyncClient, TestCase
+from django.urls import reverse
+from currencyData.models import Currency, CurrencyDailyRate, CurrencyExchangeRate
+from currencyData.stream import broadcaster
+
+
+@pytest.fixture
+def rates(db):
+    Currency.objects.create(code='USD', rate_currency=4.0)
+    Currency.objects.create(code='EUR', rate_currency=4.30)
+    Currency.objects.create(code='JPY', rate_currency=0.0)
+
+
+def test_get_currency_rate_async(rates):
+    """Test the async pair endpoint, its errors and revalidation."""
+    client = AsyncClient()
+    get = async_to_sync(client.get)
+
+    response = get(reverse('getCurrencyRateAsync', args=['USD', 'EUR']))
+    assert response.status_code == 200
+    assert response.json() == {'currency_pair': 'USDEUR', 'exchange_rate': 0.9302325581395349}
+    assert CurrencyExchangeRate.objects.filter(currency_exchange_pair='USDEUR').exists()
+
+    assert get(reverse('getCurrencyRateAsync', args=['USD', 'EUR']), headers={'If-None-Match': response['ETag']}).status_code == 304
+    assert get(reverse('getCurrencyRateAsync', args=['USD', 'GBP'])).status_code == 400
+    assert get(reverse('getCurrencyRateAsync', args=['USD', 'JPY'])).status_code == 400
+
+
+def test_get_currency_rate_async_as_of(db):
+    """Test that the async pair endpoint resolves past dates from the stored series and rejects future ones."""
+    CurrencyDailyRate.objects.create(code='USD', rate_currency=4.1, rate_date=datetime.date(2024, 12, 6))
+    get = async_to_sync(AsyncClient().get)
+
+    response = get(reverse('getCurrencyRateAsync', args=['USD', 'PLN']), {'as_of': '2024-12-08'})
+    assert response.status_code == 200
+    assert response.json() == {'currency_pair': 'USDPLN', 'exchange_rate': 4.1, 'as_of': '2024-12-08',
+                               'effective_date': '2024-12-06'}
+    assert not CurrencyExchangeRate.objects.exists()
+
+    future = (datetime.date.today() + datetime.timedelta(days=1)).isoformat()
+    assert get(reverse('getCurrencyRateAsync', args=['USD', 'PLN']), {'as_of': future}).status_code == 400
+
+
+def test_convert_currencies_async(rates, settings):
+    """Test the async batch endpoint."""
+    client = AsyncClient()
+    post = async_to_sync(client.post)
+
+    response = post(reverse('convertCurrenciesAsync'), {'base': 'USD', 'quotes': ['EUR', 'GBP']},
+                    content_type='application/json')
+    assert response.status_code == 200
+    assert response.json()[0]['exchange_rate'] == 0.9302325581395349
+    assert 'error' in response.json()[1]
+
+    response = post(reverse('convertCurrenciesAsync'), 'not json', content_type='application/json')
+    assert response.status_code == 400
+
+    settings.BATCH_MAX_ITEMS = 1
+    response = post(reverse('convertCurrenciesAsync'), {'base': 'USD', 'quotes': ['EUR', 'GBP']},
+                    content_type='application/json')
+    assert response.status_code == 400
+
+
+def change_rate(code, rate):
+    # saving a currency publishes new rates like load_rates does, after the commit of the (test) transaction
+    with TestCase.captureOnCommitCallbacks(execute=True):
+        currency = Currency.objects.get(code=code)
+        currency.rate_currency = rate
+        currency.save()
+
+
+def test_stream_currency_rates(rates, settings):
+    """Test that the stream sends the current rates, then only the changed pairs after new rates are published."""
+    settings.RATES_STREAM_HEARTBEAT = 0.05
+    client = AsyncClient()
+
+    async def read_stream():
+        response = await client.get(reverse('streamCurrencyRates') + '?pairs=usdeur,EURUSD,USDGBP')
+        assert response['Content-Type'] == 'text/event-stream'
+        stream = response.streaming_content
+        first = await anext(stream)
+        assert await anext(stream) == b': keep-alive\n\n'
+
+        await sync_to_async(change_rate)('EUR', 5.0)
+        updates = b''
+        # keep-alive comments arrive all the time, the whole wait for the updates is bounded
+        async with asyncio.timeout(5):
+            while b'EURUSD' not in updates or b'USDEUR' not in updates:
+                updates += await anext(stream)
+        await stream.aclose()
+        return first.decode(), updates.decode()
+
+    first, updates = async_to_sync(read_stream)()
+
+    assert first.startswith('retry: 5000\n\n')
+    assert 'data: {"currency_pair": "USDEUR", "exchange_rate": 0.9302325581395349}' in first
+    assert 'data: {"currency_pair": "EURUSD", "exchange_rate": 1.075}' in first
+    assert 'USDGBP' not in first
+    assert 'data: {"currency_pair": "USDEUR", "exchange_rate": 0.8}' in updates
+    assert 'data: {"currency_pair": "EURUSD", "exchange_rate": 1.25}' in updates
+
+
+def test_stream_currency_rates_validates_pairs(rates):
+    """Test that a stream needs valid pairs."""
+    get = async_to_sync(AsyncClient().get)
+
+    assert get(reverse('streamCurrencyRates')).status_code == 400
+    assert get(reverse('streamCurrencyRates') + '?pairs=EURUSD,EUR').status_code == 400
+
+
+def test_stream_closed_after_first_event(rates):
+    """Test that a client closing the stream after the current rates is unsubscribed."""
+    client = AsyncClient()
+
+    async def read_first_event():
+        response = await client.get(reverse('streamCurrencyRates') + '?pairs=USDEUR')
+        stream = response.streaming_content
+        first = await anext(stream)
+        subscribed = len(broadcaster.subscribers)
+        await stream.aclose()
+        return first.decode(), subscribed
+
+    first, subscribed = async_to_sync(read_first_event)()
+
+    assert 'USDEUR' in first
+    assert subscribed == 1
+    assert broadcaster.subscribers == set()
+
+
+def test_stream_not_served_under_wsgi(rates, client):
+    """Test that a WSGI server does not hold a worker for the never ending stream."""
+    response = client.get(reverse('streamCurrencyRates') + '?pairs=USDEUR')
+
+    assert response.status_code == 501
@@ -0,0 +1,56 @@
+import datetime
+import json
+import pytest
+from django.core.management import call_command, CommandError
+from currencyData.backfill import history_windows
+from currencyData.models import CurrencyDailyRate, TradingDay
+from currencyData.series import get_series_version
+
+FIRST_WINDOW = 'exchangerates/rates/c/usd/2024-01-02/2024-04-03/'
+SECOND_WINDOW = 'exchangerates/rates/c/usd/2024-04-04/2024-06-28/'
+
+
+def rates(*items):
+    return {'rates': [{'effectiveDate': date, 'bid': bid} for date, bid in items]}
+
+
+def test_history_windows():
+    """Test that a range is split into windows NBP accepts."""
+    windows = history_windows(datetime.date(2024, 1, 2), datetime.date(2024, 6, 28))
+
+    assert windows == [
+        (datetime.date(2024, 1, 2), datetime.date(2024, 4, 3)),
+        (datetime.date(2024, 4, 4), datetime.date(2024, 6, 28)),
+    ]
+    assert all((end - start).days < 93 for start, end in windows)
+
+
+@pytest.mark.django_db
+def test_backfill_resumes_from_checkpoint(nbp_server, settings, tmp_path):
+    """Test that an interrupted backfill keeps the saved windows and fetches only the rest when it is resumed."""
+    settings.NBP_RETRIES = 0
+    checkpoint = tmp_path / 'checkpoint.json'
+    # a fixing on Easter Monday is learned as a correction of the trading calendar
+    nbp_server.add(FIRST_WINDOW, rates(('2024-01-02', 4.0), ('2024-04-01', 4.05), ('2024-04-03', 4.1)))
+    nbp_server.add(SECOND_WINDOW, 'Internal Server Error', status=500)
+    nbp_server.add(SECOND_WINDOW, rates(('2024-06-28', 4.2)))
+    version = get_series_version()
+    options = {'date_start': datetime.date(2024, 1, 2), 'date_end': datetime.date(2024, 6, 28), 'codes': 'usd',
+               'checkpoint': str(checkpoint)}
+
+    with pytest.raises(CommandError):
+        call_command('backfill_history', **options)
+    assert CurrencyDailyRate.objects.count() == 3
+    assert json.loads(checkpoint.read_text())['done'] == ['USD:2024-01-02:2024-04-03']
+    assert get_series_version() != version
+    assert TradingDay.objects.filter(date=datetime.date(2024, 4, 1), published=True).exists()
+    version = get_series_version()
+
+    call_command('backfill_history', **options)
+
+    assert nbp_server.requests.count(f'/api/{FIRST_WINDOW}') == 1
+    assert sorted(CurrencyDailyRate.objects.values_list('rate_date', 'rate_currency')) == [
+        (datetime.date(2024, 1, 2), 4.0), (datetime.date(2024, 4, 1), 4.05), (datetime.date(2024, 4, 3), 4.1),
+        (datetime.date(2024, 6, 28), 4.2),
+    ]
+    assert get_series_version() != version
@@ -0,0 +1,39 @@
+import datetime
+import pytest
+from currencyData.buffer import TransactionBuffer
+from currencyData.models import Currency, CurrencyExchangeRate
+
+
+@pytest.mark.django_db
+def test_buffer_coalesces_observations(settings):
+    """Test that observations of the same pair and date are written as one row."""
+    settings.TRANSACTION_BUFFER_FLUSH_INTERVAL = 60
+    usd = Currency.objects.create(code='USD', rate_currency=4.0)
+    buffer = TransactionBuffer()
+    buffer._ensure_worker = lambda: None
+    today = datetime.date(2024, 12, 4)
+
+    buffer.add('USDEUR', today, 0.93, usd.id)
+    buffer.add('USDEUR', today, 0.94, usd.id)
+    buffer.add('USDGBP', today, 0.79, usd.id)
+    assert CurrencyExchangeRate.objects.count() == 0
+
+    assert buffer.flush() == 2
+    assert CurrencyExchangeRate.objects.get(currency_exchange_pair='USDEUR').currency_exchange_rate == 0.94
+
+
+@pytest.mark.django_db
+def test_buffer_upserts_existing_rows(django_assert_num_queries):
+    """Test that a flush updates rows which are already saved instead of duplicating them."""
+    usd = Currency.objects.create(code='USD', rate_currency=4.0)
+    today = datetime.date(2024, 12, 4)
+    CurrencyExchangeRate.objects.create(currency=usd, currency_exchange_pair='USDEUR',
+                                        currency_exchange_rate=0.93, currency_exchange_date=today)
+    buffer = TransactionBuffer()
+    buffer._pending[('USDEUR', today)] = (0.94, usd.id)
+    buffer._pending[('USDGBP', today)] = (0.79, usd.id)
+
+    with django_assert_num_queries(1):
+        assert buffer.flush() == 2
+    assert CurrencyExchangeRate.objects.count() == 2
+    assert CurrencyExchangeRate.objects.get(currency_exchange_pair='USDEUR').currency_exchange_rate == 0.94
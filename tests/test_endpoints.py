@@ -1,7 +1,11 @@
+import datetime
 import pytest
+from django.core.cache import cache
 from django.urls import reverse
 from rest_framework.test import APIClient
-from currencyData.models import Currency
+from api import views
+from currencyData.models import Currency, CurrencyExchangeRate
+from currencyData.rates import invalidate_rate_matrix, RATES_VERSION_KEY
 
 
 # # USE pytest.mark.django_db to inform pytest-django that have to work with database
@@ -149,6 +153,21 @@ def test_get_currency_rate_transaction_saved():
     response = client.get(reverse('getCurrencyRate', args=['USD', 'EUR']))
 
     assert response.status_code == 200
+    assert CurrencyExchangeRate.objects.filter(currency_exchange_pair='USDEUR').count() == 1
+
+
+@pytest.mark.django_db
+def test_get_currency_rate_transaction_dated_by_rates_table():
+    """Test that a transaction is dated by the table its rate comes from, not by today's fixing date."""
+    Currency.objects.create(code='USD', rate_currency=4.0)
+    Currency.objects.create(code='EUR', rate_currency=4.30)
+    invalidate_rate_matrix(7, datetime.date(2024, 12, 4))
+
+    response = APIClient().get(reverse('getCurrencyRate', args=['USD', 'EUR']))
+
+    assert response.status_code == 200
+    assert CurrencyExchangeRate.objects.get(currency_exchange_pair='USDEUR').currency_exchange_date == \
+        datetime.date(2024, 12, 4)
 
 
 
@@ -163,3 +182,136 @@ def test_get_currency_rate_zero_devision():
 
     assert response.status_code == 400
     assert 'error' in response.data
+
+
+@pytest.mark.django_db
+def test_get_currency_rate_revalidation():
+    """Test that an unchanged rates table answers conditional requests with 304."""
+    Currency.objects.create(code='USD', rate_currency=4.0)
+    Currency.objects.create(code='EUR', rate_currency=4.30)
+
+    client = APIClient()
+    response = client.get(reverse('getCurrencyRate', args=['USD', 'EUR']))
+    etag = response['ETag']
+    assert response.has_header('Last-Modified')
+
+    response = client.get(reverse('getCurrencyRate', args=['USD', 'EUR']), HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 304
+
+    invalidate_rate_matrix()
+    response = client.get(reverse('getCurrencyRate', args=['USD', 'EUR']), HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+    assert response['ETag'] != etag
+
+
+@pytest.mark.django_db
+def test_revalidated_rate_is_saved(monkeypatch):
+    """Test that a request answered with 304 still saves the transaction and errors carry no validators."""
+    Currency.objects.create(code='USD', rate_currency=4.0)
+    Currency.objects.create(code='EUR', rate_currency=4.30)
+    Currency.objects.create(code='JPY', rate_currency=0.0)
+    saved = []
+    monkeypatch.setattr(views, 'save_transaction', lambda symbol, matrix=None: saved.append(symbol))
+    client = APIClient()
+    etag = client.get(reverse('getCurrencyRate', args=['USD', 'EUR']))['ETag']
+
+    response = client.get(reverse('getCurrencyRate', args=['USD', 'EUR']), HTTP_IF_NONE_MATCH=etag)
+
+    assert response.status_code == 304
+    assert saved == ['USDEUR', 'USDEUR']
+
+    response = client.get(reverse('getCurrencyRate', args=['USD', 'JPY']))
+    assert response.status_code == 400
+    assert not response.has_header('ETag') and not response.has_header('Last-Modified')
+
+
+@pytest.mark.django_db
+def test_get_base_rates():
+    """Test that one request returns the rates of a base against every other currency without saving them."""
+    Currency.objects.create(code='USD', rate_currency=4.0)
+    Currency.objects.create(code='EUR', rate_currency=4.30)
+    Currency.objects.create(code='PLN', rate_currency=1)
+    Currency.objects.create(code='JPY', rate_currency=0.0)
+
+    client = APIClient()
+    response = client.get(reverse('getBaseRates', args=['usd']))
+
+    assert response.status_code == 200
+    assert response.data['base'] == 'USD'
+    assert response.data['rates'] == {'EUR': 0.9302325581395349, 'PLN': 4.0}
+    assert not CurrencyExchangeRate.objects.exists()
+
+    response = client.get(reverse('getBaseRates', args=['USD']), HTTP_IF_NONE_MATCH=response['ETag'])
+    assert response.status_code == 304
+    assert client.get(reverse('getBaseRates', args=['XXX'])).status_code == 400
+
+
+@pytest.mark.django_db
+def test_convert_currencies_batch():
+    """Test converting many pairs and amounts in one request with inline errors."""
+    Currency.objects.create(code='USD', rate_currency=4.0)
+    Currency.objects.create(code='EUR', rate_currency=4.30)
+    Currency.objects.create(code='JPY', rate_currency=0.0)
+
+    client = APIClient()
+    response = client.post(reverse('convertCurrencies'), {'items': [
+        {'base': 'usd', 'quote': 'eur', 'amount': 100},
+        {'base': 'USD', 'quote': 'GBP', 'amount': 100},
+        {'base': 'USD', 'quote': 'JPY'},
+        {'base': 'EUR', 'quote': 'USD', 'amount': 'abc'},
+    ]}, format='json')
+
+    assert response.status_code == 200
+    assert response.data[0] == {'currency_pair': 'USDEUR', 'exchange_rate': 0.9302325581395349,
+                                'amount': 100.0, 'converted_amount': 93.02325581395348}
+    assert ['error' in item for item in response.data] == [False, True, True, True]
+    assert CurrencyExchangeRate.objects.filter(currency_exchange_pair='USDEUR').exists()
+
+
+@pytest.mark.django_db
+def test_convert_currencies_base_with_quotes():
+    """Test converting one base currency to a list of quotes."""
+    Currency.objects.create(code='USD', rate_currency=4.0)
+    Currency.objects.create(code='EUR', rate_currency=4.30)
+    Currency.objects.create(code='PLN', rate_currency=1)
+
+    client = APIClient()
+    response = client.post(reverse('convertCurrencies'), {'base': 'PLN', 'quotes': ['USD', 'EUR']}, format='json')
+
+    assert response.status_code == 200
+    assert [item['exchange_rate'] for item in response.data] == [0.25, 1 / 4.30]
+
+    response = client.post(reverse('convertCurrencies'), {'items': []}, format='json')
+    assert response.status_code == 400
+
+
+@pytest.mark.django_db
+def test_convert_currencies_item_limit(settings):
+    """Test that batches of more than BATCH_MAX_ITEMS items are rejected."""
+    settings.BATCH_MAX_ITEMS = 2
+    Currency.objects.create(code='USD', rate_currency=4.0)
+    client = APIClient()
+
+    response = client.post(reverse('convertCurrencies'), {'base': 'PLN', 'quotes': ['USD', 'USD']}, format='json')
+    assert response.status_code == 200
+
+    response = client.post(reverse('convertCurrencies'), {'base': 'PLN', 'quotes': ['USD'] * 3}, format='json')
+    assert response.status_code == 400
+    assert 'at most 2 items' in response.data['error']
+
+
+@pytest.mark.django_db
+def test_get_currency_rate_checks_version_once(monkeypatch):
+    """Test that one request reads the published rates version from the shared cache only once."""
+    Currency.objects.create(code='USD', rate_currency=4.0)
+    Currency.objects.create(code='EUR', rate_currency=4.30)
+    client = APIClient()
+    client.get(reverse('getCurrencyRate', args=['USD', 'EUR']))
+
+    keys = []
+    get = cache.get
+    monkeypatch.setattr(cache, 'get', lambda key, *args, **kwargs: keys.append(key) or get(key, *args, **kwargs))
+    response = client.get(reverse('getCurrencyRate', args=['USD', 'EUR']))
+
+    assert response.status_code == 200
+    assert keys.count(RATES_VERSION_KEY) == 1
@@ -0,0 +1,155 @@
+import datetime
+import numpy
+import pytest
+from django.urls import reverse
+from django.core.cache import cache
+from rest_framework.test import APIClient
+from currencyData.history import resample_ohlc, derived_pair_history
+from currencyData.models import CurrencyExchangeRate, CurrencyDailyRate
+from currencyData.series import SERIES_VERSION_KEY
+
+
+def test_resample_ohlc_week_and_month():
+    """Test OHLC aggregation per week starting on Monday and per month."""
+    dates = numpy.array(['2024-11-28', '2024-11-29', '2024-12-02', '2024-12-03', '2024-12-04'], dtype='datetime64[D]')
+    rates = numpy.array([1.0, 3.0, 2.0, 5.0, 4.0])
+
+    week = resample_ohlc(dates, rates, 'week')
+    assert week['dates'].astype(str).tolist() == ['2024-11-25', '2024-12-02']
+    assert week['open'].tolist() == [1.0, 2.0]
+    assert week['high'].tolist() == [3.0, 5.0]
+    assert week['low'].tolist() == [1.0, 2.0]
+    assert week['close'].tolist() == [3.0, 4.0]
+
+    month = resample_ohlc(dates, rates, 'month')
+    assert month['dates'].astype(str).tolist() == ['2024-11-01', '2024-12-01']
+    assert month['high'].tolist() == [3.0, 5.0]
+
+
+@pytest.mark.django_db
+def test_get_currency_history():
+    """Test history endpoint with a date range and columnar payload."""
+    for day, rate in ((2, 0.91), (3, 0.93), (4, 0.92), (5, 0.94)):
+        CurrencyExchangeRate.objects.create(currency_exchange_pair='USDEUR', currency_exchange_rate=rate,
+                                            currency_exchange_date=datetime.date(2024, 12, day))
+
+    client = APIClient()
+    response = client.get(reverse('getCurrencyHistory', args=['usd', 'eur']), {'from': '2024-12-03'})
+
+    assert response.status_code == 200
+    assert response.data['dates'] == ['2024-12-03', '2024-12-04', '2024-12-05']
+    assert response.data['close'] == [0.93, 0.92, 0.94]
+
+    response = client.get(reverse('getCurrencyHistory', args=['USD', 'EUR']), {'interval': 'week'})
+    assert response.data['dates'] == ['2024-12-02']
+    assert response.data['open'] == [0.91]
+    assert response.data['high'] == [0.94]
+
+
+@pytest.mark.django_db
+def test_get_currency_history_invalid_params():
+    """Test errors for invalid interval and dates."""
+    client = APIClient()
+    url = reverse('getCurrencyHistory', args=['USD', 'EUR'])
+
+    assert client.get(url, {'interval': 'year'}).status_code == 400
+    assert client.get(url, {'from': '2024-13-01'}).status_code == 400
+    assert client.get(url, {'from': '2024-12-05', 'to': '2024-12-01'}).status_code == 400
+
+
+@pytest.mark.django_db
+def test_derived_pair_history():
+    """Test that any pair history is derived from currency series, skipping days without a fixing."""
+    for code, day, rate in (('USD', 2, 4.0), ('USD', 3, 4.1), ('USD', 4, 4.2), ('EUR', 2, 4.3), ('EUR', 4, 4.4)):
+        CurrencyDailyRate.objects.create(code=code, rate_currency=rate, rate_date=datetime.date(2024, 12, day))
+    cache.set(SERIES_VERSION_KEY, 1)
+
+    client = APIClient()
+    response = client.get(reverse('getCurrencyHistory', args=['USD', 'EUR']))
+    assert response.data['dates'] == ['2024-12-02', '2024-12-04']
+    assert response.data['close'] == [4.0 / 4.3, 4.2 / 4.4]
+
+    response = client.get(reverse('getCurrencyHistory', args=['PLN', 'USD']), {'from': '2024-12-03'})
+    assert response.data['dates'] == ['2024-12-03', '2024-12-04']
+    assert response.data['close'] == [1 / 4.1, 1 / 4.2]
+
+
+@pytest.mark.django_db
+def test_derived_pair_history_cached_per_version(django_assert_num_queries):
+    """Test that a hot pair is read once per series version."""
+    CurrencyDailyRate.objects.create(code='USD', rate_currency=4.0, rate_date=datetime.date(2024, 12, 2))
+    CurrencyDailyRate.objects.create(code='EUR', rate_currency=4.3, rate_date=datetime.date(2024, 12, 2))
+    cache.set(SERIES_VERSION_KEY, 2)
+
+    with django_assert_num_queries(1):
+        derived_pair_history('USDEUR')
+        derived_pair_history('USDEUR', datetime.date(2024, 12, 1))
+
+    CurrencyDailyRate.objects.create(code='USD', rate_currency=4.1, rate_date=datetime.date(2024, 12, 3))
+    CurrencyDailyRate.objects.create(code='EUR', rate_currency=4.4, rate_date=datetime.date(2024, 12, 3))
+    cache.set(SERIES_VERSION_KEY, 3)
+    assert len(derived_pair_history('USDEUR')[0]) == 2
+
+
+@pytest.mark.django_db
+def test_derived_pair_history_without_series_version():
+    """Test that a pair derived before the series version is known is not served after the version is lost."""
+    CurrencyDailyRate.objects.create(code='USD', rate_currency=4.0, rate_date=datetime.date(2024, 12, 2))
+    CurrencyDailyRate.objects.create(code='EUR', rate_currency=4.3, rate_date=datetime.date(2024, 12, 2))
+    assert len(derived_pair_history('USDEUR')[0]) == 1
+
+    CurrencyDailyRate.objects.create(code='USD', rate_currency=4.1, rate_date=datetime.date(2024, 12, 3))
+    CurrencyDailyRate.objects.create(code='EUR', rate_currency=4.4, rate_date=datetime.date(2024, 12, 3))
+    cache.delete(SERIES_VERSION_KEY)
+    assert len(derived_pair_history('USDEUR')[0]) == 2
+
+
+@pytest.mark.django_db
+def test_get_currency_rate_as_of():
+    """Test that a past date gets the rate of the previous fixing on weekends and no transaction is saved."""
+    CurrencyDailyRate.objects.create(code='USD', rate_currency=4.0, rate_date=datetime.date(2024, 12, 5))
+    CurrencyDailyRate.objects.create(code='USD', rate_currency=4.1, rate_date=datetime.date(2024, 12, 6))
+    CurrencyDailyRate.objects.create(code='USD', rate_currency=4.2, rate_date=datetime.date(2024, 12, 9))
+    cache.set(SERIES_VERSION_KEY, 'as-of-1')
+
+    client = APIClient()
+    response = client.get(reverse('getCurrencyRate', args=['usd', 'pln']), {'as_of': '2024-12-08'})
+
+    assert response.status_code == 200
+    assert response.data == {'currency_pair': 'USDPLN', 'exchange_rate': 4.1, 'as_of': '2024-12-08',
+                             'effective_date': datetime.date(2024, 12, 6)}
+    assert not response.has_header('ETag')
+    assert not CurrencyExchangeRate.objects.exists()
+    assert client.get(reverse('getCurrencyRate', args=['USD', 'PLN']), {'as_of': '2024-12-01'}).status_code == 400
+
+
+@pytest.mark.django_db
+def test_convert_currencies_as_of(django_assert_num_queries):
+    """Test that many (pair, date) lookups are resolved at once with inline errors."""
+    for day, usd, eur in ((5, 4.0, 4.3), (6, 4.1, 4.4), (9, 4.2, 4.5)):
+        CurrencyDailyRate.objects.create(code='USD', rate_currency=usd, rate_date=datetime.date(2024, 12, day))
+        CurrencyDailyRate.objects.create(code='EUR', rate_currency=eur, rate_date=datetime.date(2024, 12, day))
+    cache.set(SERIES_VERSION_KEY, 'as-of-2')
+    items = [
+        {'pair': 'EURUSD', 'date': '2024-12-07', 'amount': 100},
+        {'pair': 'usdpln', 'date': '2024-12-10'},
+        {'pair': 'EURJPY', 'date': '2024-12-07'},
+        {'pair': 'EURUSD', 'date': '07.12.2024'},
+        {'pair': 'EURUSD', 'date': '2024-12-31'},
+        {'pair': 'EURUSD', 'date': (datetime.date.today() + datetime.timedelta(days=1)).isoformat()},
+    ]
+
+    client = APIClient()
+    response = client.post(reverse('convertCurrenciesAsOf'), {'items': items}, format='json')
+
+    assert response.status_code == 200
+    assert response.data[0] == {'currency_pair': 'EURUSD', 'date': '2024-12-07', 'exchange_rate': 4.4 / 4.1,
+                                'effective_date': datetime.date(2024, 12, 6), 'amount': 100.0,
+                                'converted_amount': 4.4 / 4.1 * 100}
+    assert response.data[1]['exchange_rate'] == 4.2
+    assert ['error' in item for item in response.data] == [False, False, True, True, True, True]
+    assert 'more than 3 publication days' in response.data[4]['error']
+    assert 'future' in response.data[5]['error']
+
+    with django_assert_num_queries(0):
+        client.post(reverse('convertCurrenciesAsOf'), {'items': items * 1000}, format='json')
@@ -0,0 +1,51 @@
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+# seconds of module import time a web or Celery worker may spend on startup (python -X importtime, all modules)
+IMPORT_TIME_BUDGET = float(os.environ.get('IMPORT_TIME_BUDGET', 1.5))
+
+# dependencies loaded only by the code paths which need them (Excel export)
+LAZY_MODULES = ('pandas', 'openpyxl')
+
+STARTUP = '''
+import json
+import sys
+import django
+django.setup()
+import currencyExchange.urls
+import currencyData.tasks
+print(json.dumps(sorted(sys.modules)))
+'''
+
+
+def startup_imports():
+    '''
+    Starts a fresh interpreter with -X importtime which loads Django, the URLs (views and admin) and the Celery tasks.
+
+    :return: tuple (set of the loaded modules, dict { module: self import time in microseconds })
+    '''
+    env = dict(os.environ, DJANGO_SETTINGS_MODULE='currencyExchange.settings', CACHE_URL='locmem://')
+    env.setdefault('currencyExchangeSecretKey', 'import-time')
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', STARTUP],
+        cwd=Path(__file__).resolve().parent.parent, env=env, capture_output=True, text=True, check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_time, cumulative, module = line[len('import time:'):].split('|')
+        times[module.strip()] = int(self_time)
+    return set(json.loads(result.stdout)), times
+
+
+def test_startup_imports():
+    """Test that worker startup does not load the heavy optional dependencies and stays within the budget."""
+    modules, times = startup_imports()
+
+    assert 'currencyData.tasks' in modules
+    assert [module for module in LAZY_MODULES if module in modules] == []
+    assert sum(times.values()) / 1e6 < IMPORT_TIME_BUDGET
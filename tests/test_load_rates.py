@@ -0,0 +1,86 @@
+import datetime
+import pytest
+from django.core.management import call_command
+from currencyData import trading_calendar
+from currencyData.models import Currency, CurrencyDailyRate, CurrencyExchangeRate, RateTable
+from currencyData.rates import get_rate_matrix, get_rates_version
+from currencyData.tasks import refresh_rates
+
+TABLE = [{'table': 'C', 'effectiveDate': '2024-12-04', 'rates': [
+    {'currency': 'dolar amerykański', 'code': 'USD', 'bid': 4.1, 'ask': 4.2},
+    {'currency': 'euro', 'code': 'EUR', 'bid': 4.3, 'ask': 4.4},
+]}]
+
+
+@pytest.fixture
+def nbp_table(nbp_server, monkeypatch):
+    monkeypatch.setattr(trading_calendar, 'today', lambda: datetime.date(2024, 12, 4))
+    nbp_server.add('exchangerates/tables/c/2024-12-04/', TABLE)
+    return nbp_server
+
+
+@pytest.mark.django_db
+def test_load_rates_upserts_and_keeps_history(nbp_table, django_capture_on_commit_callbacks):
+    """Test that load_rates updates currencies in place and keeps their history."""
+    usd = Currency.objects.create(code='USD', rate_currency=4.0)
+    CurrencyExchangeRate.objects.create(currency=usd, currency_exchange_pair='USDEUR', currency_exchange_rate=0.93,
+                                        currency_exchange_date=datetime.date(2024, 12, 3))
+
+    with django_capture_on_commit_callbacks(execute=True):
+        call_command('load_rates')
+
+    assert Currency.objects.get(code='USD').id == usd.id
+    assert dict(Currency.objects.values_list('code', 'rate_currency')) == {'USD': 4.1, 'EUR': 4.3, 'PLN': 1}
+    assert CurrencyExchangeRate.objects.filter(currency=usd).count() == 1
+
+    rate_table = RateTable.objects.get()
+    assert rate_table.effective_date == datetime.date(2024, 12, 4)
+    assert get_rates_version().number == rate_table.version
+    assert get_rate_matrix().rate('USD', 'PLN') == 4.1
+
+
+@pytest.mark.django_db
+def test_load_rates_versions_grow(nbp_table, django_capture_on_commit_callbacks):
+    """Test that every load records a new table version."""
+    with django_capture_on_commit_callbacks(execute=True):
+        call_command('load_rates')
+        call_command('load_rates')
+
+    first, second = RateTable.objects.order_by('version')
+    assert second.version > first.version
+    assert Currency.objects.count() == 3
+    assert get_rates_version().number == second.version
+
+
+@pytest.mark.django_db
+def test_poll_loads_new_table_once(nbp_server, monkeypatch, django_capture_on_commit_callbacks):
+    """Test that the beat task revalidates the current table until a new one is published and extends history."""
+    monkeypatch.setattr(trading_calendar, 'today', lambda: datetime.date(2024, 12, 4))
+    previous_table = [dict(TABLE[0], effectiveDate='2024-12-03')]
+    for table in (previous_table, previous_table, TABLE):
+        nbp_server.add('exchangerates/tables/c/', table)
+
+    RateTable.objects.create(effective_date=datetime.date(2024, 12, 3))
+    usd = Currency.objects.create(code='USD', rate_currency=4.0)
+    CurrencyDailyRate.objects.bulk_create([
+        CurrencyDailyRate(code='USD', rate_currency=4.0, rate_date=datetime.date(2024, 12, 3)),
+        CurrencyDailyRate(code='EUR', rate_currency=4.2, rate_date=datetime.date(2024, 12, 2)),
+    ])
+    CurrencyExchangeRate.objects.create(currency=usd, currency_exchange_pair='USDPLN', currency_exchange_rate=4.0,
+                                        currency_exchange_date=datetime.date(2024, 12, 3))
+
+    with django_capture_on_commit_callbacks(execute=True):
+        assert refresh_rates() is None
+        assert refresh_rates() is None
+        version = refresh_rates()
+        assert refresh_rates() is None
+
+    assert nbp_server.requests == ['/api/exchangerates/tables/c/'] * 3
+    assert nbp_server.not_modified == ['/api/exchangerates/tables/c/']
+    assert RateTable.objects.first().version == version
+    assert get_rate_matrix().rate('EUR', 'PLN') == 4.3
+    # the EUR series has a gap, it is completed from the NBP API when it is read
+    assert list(CurrencyDailyRate.objects.filter(rate_date='2024-12-04').values_list('code', 'rate_currency')) == [
+        ('USD', 4.1),
+    ]
+    assert CurrencyExchangeRate.objects.get(currency_exchange_date='2024-12-04').currency_exchange_rate == 4.1
@@ -0,0 +1,99 @@
+import datetime
+from types import SimpleNamespace
+import pytest
+from celery.signals import task_prerun, task_postrun
+from django.core.cache import cache
+from django.urls import reverse
+from rest_framework.test import APIClient
+from currencyData.metrics import Metrics, VALUE_KEY
+from currencyData.models import Currency
+from currencyData.nbp import nbp_client
+from currencyData.tasks import update_pair_history
+
+
+@pytest.fixture
+def client():
+    cache.clear()
+    return APIClient()
+
+
+def scrape(client):
+    response = client.get(reverse('getMetrics'))
+    assert response.status_code == 200
+    assert response['Content-Type'].startswith('text/plain; version=0.0.4')
+    return response.content.decode().splitlines()
+
+
+@pytest.mark.django_db
+def test_metrics_of_sampled_requests(client, settings):
+    """Test that sampled requests are counted, timed and get their queries counted."""
+    settings.METRICS_SAMPLE_RATE = 1
+    Currency.objects.create(code='USD', rate_currency=4.0)
+    Currency.objects.create(code='EUR', rate_currency=4.3)
+
+    client.get(reverse('getCurrencyRate', args=['EUR', 'USD']))
+    client.get(reverse('getCurrencyRate', args=['EUR', 'XXX']))
+    lines = scrape(client)
+
+    assert 'http_requests_total{view="getCurrencyRate",method="GET",status="200"} 1' in lines
+    assert 'http_requests_total{view="getCurrencyRate",method="GET",status="400"} 1' in lines
+    assert 'http_request_duration_seconds_count{view="getCurrencyRate"} 2' in lines
+    assert 'http_request_duration_seconds_bucket{view="getCurrencyRate",le="+Inf"} 2' in lines
+    assert 'http_request_db_queries_count{view="getCurrencyRate"} 2' in lines
+    assert '# TYPE http_request_db_queries histogram' in lines
+
+
+@pytest.mark.django_db
+def test_unsampled_requests_are_only_counted(client, settings):
+    """Test that requests outside of the sample pay only for the request counter."""
+    settings.METRICS_SAMPLE_RATE = 0
+
+    client.get(reverse('getCurrencyRate', args=['EUR', 'USD']))
+    lines = scrape(client)
+
+    assert 'http_requests_total{view="getCurrencyRate",method="GET",status="400"} 1' in lines
+    assert not [line for line in lines if line.startswith('http_request_duration_seconds_count{view="getCurrencyRate"}')]
+
+
+@pytest.mark.django_db
+def test_nbp_and_task_metrics(client, nbp_server):
+    """Test that NBP API calls and Celery tasks are counted and timed."""
+    nbp_server.add('exchangerates/tables/c/2024-12-04/', [{'effectiveDate': '2024-12-04', 'rates': []}])
+
+    nbp_client.table(datetime.date(2024, 12, 4))
+    nbp_client.table(datetime.date(2024, 12, 5))
+    # the signals a Celery worker sends around every task
+    task_prerun.send(sender=update_pair_history, task_id='1', task=update_pair_history)
+    task_postrun.send(sender=update_pair_history, task_id='1', task=update_pair_history, state='SUCCESS')
+    lines = scrape(client)
+
+    assert 'nbp_requests_total{endpoint="tables",result="ok"} 1' in lines
+    assert 'nbp_requests_total{endpoint="tables",result="not_found"} 1' in lines
+    assert 'nbp_request_duration_seconds_count{endpoint="tables"} 2' in lines
+    assert 'celery_tasks_total{task="currencyData.tasks.update_pair_history",state="SUCCESS"} 1' in lines
+    assert 'celery_task_duration_seconds_count{task="currencyData.tasks.update_pair_history"} 1' in lines
+
+
+def test_flush_keeps_deltas_when_cache_fails(monkeypatch):
+    """Test that the deltas not added to an unavailable cache are flushed with the next flush, exactly once."""
+    metrics = Metrics()
+    metric = SimpleNamespace(name='test_duration')
+    incr = cache.incr
+    calls = []
+
+    def failing_incr(key, delta=1):
+        calls.append(key)
+        if len(calls) > 1:
+            raise ConnectionError('cache is down')
+        return incr(key, delta)
+
+    monkeypatch.setattr(cache, 'incr', failing_incr)
+    with pytest.raises(ConnectionError):
+        metrics.add(metric, ('a',), {'count': 1, 'sum': 5})
+    with pytest.raises(ConnectionError):
+        metrics.add(metric, ('a',), {'count': 1, 'sum': 7})
+    monkeypatch.setattr(cache, 'incr', incr)
+
+    assert metrics.flush() == 1
+    assert cache.get(VALUE_KEY.format(name='test_duration', labels='a', part='count')) == 2
+    assert cache.get(VALUE_KEY.format(name='test_duration', labels='a', part='sum')) == 12
@@ -0,0 +1,56 @@
+import datetime
+import pytest
+from currencyData import services, trading_calendar
+from currencyData.nbp import NBPClient, NBPError, fetch_concurrently
+
+TABLE = [{'table': 'C', 'effectiveDate': '2024-12-04', 'rates': [
+    {'currency': 'dolar amerykański', 'code': 'USD', 'bid': 4.0, 'ask': 4.1},
+    {'currency': 'euro', 'code': 'EUR', 'bid': 4.3, 'ask': 4.4},
+]}]
+
+
+def test_client_caches_closed_days(nbp_server):
+    """Test that a table of a closed day is downloaded only once."""
+    nbp_server.add('exchangerates/tables/c/2024-12-04/', TABLE)
+    client = NBPClient()
+
+    assert client.table(datetime.date(2024, 12, 4))['rates'][1]['code'] == 'EUR'
+    assert client.table(datetime.date(2024, 12, 4))['effectiveDate'] == '2024-12-04'
+    assert len(nbp_server.requests) == 1
+
+
+def test_client_retries_server_errors(nbp_server):
+    """Test that 5xx and 429 responses are retried."""
+    path = 'exchangerates/rates/c/usd/2024-12-02/2024-12-04/'
+    nbp_server.add(path, 'Service Unavailable', status=503)
+    nbp_server.add(path, 'Too Many Requests', status=429)
+    nbp_server.add(path, {'code': 'USD', 'rates': [{'effectiveDate': '2024-12-02', 'bid': 4.0}]})
+
+    rates = NBPClient().rates('USD', datetime.date(2024, 12, 2), datetime.date(2024, 12, 4))
+
+    assert rates == [{'effectiveDate': '2024-12-02', 'bid': 4.0}]
+    assert len(nbp_server.requests) == 3
+
+
+def test_client_errors(nbp_server):
+    """Test that missing data returns nothing and other errors raise NBPError."""
+    nbp_server.add('exchangerates/rates/c/usd/2024-12-02/2024-12-04/', 'Bad Request', status=400)
+    client = NBPClient()
+
+    assert client.table(datetime.date(2024, 12, 7)) is None
+    with pytest.raises(NBPError):
+        client.rates('USD', datetime.date(2024, 12, 2), datetime.date(2024, 12, 4))
+
+
+def test_fetch_concurrently():
+    """Test that every item is mapped to its result."""
+    assert fetch_concurrently(str.lower, ['USD', 'EUR']) == {'USD': 'usd', 'EUR': 'eur'}
+
+
+@pytest.mark.django_db
+def test_get_currency(nbp_server, monkeypatch):
+    """Test fetching current rates through the stub server."""
+    monkeypatch.setattr(trading_calendar, 'today', lambda: datetime.date(2024, 12, 4))
+    nbp_server.add('exchangerates/tables/c/2024-12-04/', TABLE)
+
+    assert services.get_currency() == {'USD': 4.0, 'EUR': 4.3}
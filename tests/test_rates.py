@@ -0,0 +1,116 @@
+import datetime
+import pytest
+from django.core.cache import cache
+from django.db import transaction
+from currencyData.models import Currency
+from currencyData import rates, snapshot
+from currencyData.rates import RateMatrix, get_rate_matrix, get_rates_version, invalidate_rate_matrix
+
+
+def test_rate_matrix_cross_rates():
+    """Test cross rates calculated by the rate matrix."""
+    matrix = RateMatrix(['USD', 'EUR', 'PLN'], [4.0, 4.30, 1.0], [1, 2, 3])
+
+    assert matrix.rate('USD', 'EUR') == 4.0 / 4.30
+    assert matrix.rate('EUR', 'PLN') == 4.30
+    assert matrix.currency_id('EUR') == 2
+    assert 'JPY' not in matrix
+
+
+def test_rate_matrix_errors():
+    """Test errors for unknown codes and a zero quote rate."""
+    matrix = RateMatrix(['USD', 'JPY'], [4.0, 0.0], [1, 2])
+
+    with pytest.raises(KeyError):
+        matrix.rate('USD', 'GBP')
+    with pytest.raises(ZeroDivisionError):
+        matrix.rate('USD', 'JPY')
+
+
+@pytest.mark.django_db
+def test_rate_matrix_built_once(settings, django_assert_num_queries):
+    """Test that without a snapshot the matrix is built with one query and reused afterwards."""
+    settings.RATES_SNAPSHOT_PATH = None
+    Currency.objects.create(code='USD', rate_currency=4.0)
+    Currency.objects.create(code='EUR', rate_currency=4.30)
+    get_rates_version()
+
+    with django_assert_num_queries(1):
+        get_rate_matrix()
+    with django_assert_num_queries(0):
+        assert get_rate_matrix().rate('USD', 'EUR') == 4.0 / 4.30
+
+
+@pytest.mark.django_db
+def test_rate_matrix_invalidated():
+    """Test that a published rates version rebuilds the matrix."""
+    usd = Currency.objects.create(code='USD', rate_currency=4.0)
+    Currency.objects.create(code='EUR', rate_currency=4.30)
+    assert get_rate_matrix().rate('USD', 'EUR') == 4.0 / 4.30
+
+    Currency.objects.filter(pk=usd.pk).update(rate_currency=4.30)
+    invalidate_rate_matrix()
+
+    assert get_rate_matrix().rate('USD', 'EUR') == 1.0
+
+
+@pytest.mark.django_db
+def test_rolled_back_currency_is_not_published(django_capture_on_commit_callbacks):
+    """Test that a currency change is published only when its transaction commits."""
+    usd = Currency.objects.create(code='USD', rate_currency=4.0)
+    Currency.objects.create(code='PLN', rate_currency=1)
+    version = get_rates_version()
+
+    with django_capture_on_commit_callbacks(execute=True) as callbacks:
+        with pytest.raises(RuntimeError):
+            with transaction.atomic():
+                usd.rate_currency = 232.3
+                usd.save()
+                raise RuntimeError
+
+    assert callbacks == []
+    assert get_rates_version() == version
+    assert get_rate_matrix().rate('USD', 'PLN') == 4.0
+
+
+@pytest.mark.django_db
+def test_rate_matrix_read_from_snapshot(settings, monkeypatch, django_assert_num_queries):
+    """Test that a worker maps the snapshot written with the published version instead of querying the database."""
+    usd = Currency.objects.create(code='USD', rate_currency=4.0)
+    Currency.objects.create(code='EUR', rate_currency=4.30)
+    invalidate_rate_matrix(7, datetime.date(2024, 12, 4))
+    # a fresh worker process
+    monkeypatch.setattr(rates, '_matrix', None)
+    monkeypatch.setattr(snapshot, '_signature', None)
+
+    with django_assert_num_queries(0):
+        matrix = get_rate_matrix()
+        assert matrix.rate('USD', 'EUR') == 4.0 / 4.30
+        assert matrix.currency_id('USD') == usd.id
+        # the cross rates are the shared read-only pages of the file, not a copy of the worker
+        assert not matrix.matrix.flags.writeable
+        assert matrix.version == get_rates_version()
+        assert snapshot.read_snapshot().version.effective_date == datetime.date(2024, 12, 4)
+
+    Currency.objects.filter(pk=usd.pk).update(rate_currency=4.30)
+    invalidate_rate_matrix()
+    monkeypatch.setattr(rates, '_matrix', None)
+
+    with django_assert_num_queries(0):
+        assert get_rate_matrix().rate('USD', 'EUR') == 1.0
+
+
+@pytest.mark.django_db
+def test_worker_does_not_write_snapshot():
+    """Test that a worker building its matrix from the database leaves the snapshot of the publisher alone."""
+    Currency.objects.create(code='USD', rate_currency=4.0)
+    Currency.objects.create(code='PLN', rate_currency=1)
+    invalidate_rate_matrix(7, datetime.date(2024, 12, 4))
+    published = snapshot.read_snapshot().version
+
+    # a version the snapshot does not have yet, e.g. announced by a publisher on another host
+    cache.set(rates.RATES_VERSION_KEY, rates.RatesVersion(8, datetime.date(2024, 12, 5), 1))
+
+    assert get_rate_matrix().version.number == 8
+    assert snapshot.read_snapshot().version == published
+
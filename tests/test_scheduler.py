@@ -0,0 +1,76 @@
+import time
+import types
+import pytest
+from django.core.cache import cache
+from currencyData import scheduler, tasks, services
+
+
+@pytest.fixture
+def queued(monkeypatch):
+    cache.clear()
+    calls = []
+    monkeypatch.setattr(scheduler.update_pair_history, 'apply_async', lambda **kwargs: calls.append(kwargs))
+    return calls
+
+
+def test_pairs_share_one_debounced_task(queued, settings):
+    """Test that many requested pairs queue one task which refreshes only them."""
+    settings.HISTORY_REFRESH_DEBOUNCE = 10
+
+    assert scheduler.schedule_history_refresh('EURUSD')
+    assert not scheduler.schedule_history_refresh('EURUSD')
+    assert scheduler.schedule_history_refresh('USDGBP')
+
+    assert queued == [{'countdown': 10}]
+    assert scheduler.pop_dirty_pairs() == {'EURUSD', 'USDGBP'}
+    assert scheduler.pop_dirty_pairs() == set()
+
+
+def test_pair_can_be_scheduled_again_after_refresh(queued):
+    """Test that a refreshed pair queues a new task when it is requested again."""
+    scheduler.schedule_history_refresh('EURUSD')
+    scheduler.pop_dirty_pairs()
+
+    assert scheduler.schedule_history_refresh('EURUSD')
+    assert len(queued) == 2
+    assert scheduler.pop_dirty_pairs() == {'EURUSD'}
+
+
+def test_task_refreshes_dirty_pairs(queued, monkeypatch):
+    """Test that the celery task refreshes only the dirty pairs."""
+    refreshed = []
+    monkeypatch.setattr(services, 'fetch_historical_rate', refreshed.append)
+    scheduler.schedule_history_refresh('EURUSD')
+
+    tasks.update_pair_history()
+    tasks.update_pair_history()
+
+    assert refreshed == [{'EURUSD'}]
+
+
+def test_slot_written_late_is_not_lost(queued, monkeypatch):
+    """Test that a slot numbered but not written yet stops the consumption until it is written."""
+    scheduler.schedule_history_refresh('EURUSD')
+    # a slow request took slot 2 but did not write it yet
+    cache.incr(scheduler.SEQUENCE_KEY)
+    cache.add(scheduler.DIRTY_KEY.format(pair='USDGBP'), True)
+    scheduler.schedule_history_refresh('EURPLN')
+
+    assert scheduler.pop_dirty_pairs() == {'EURUSD'}
+
+    cache.set(scheduler.SLOT_KEY.format(slot=2), 'USDGBP')
+    assert scheduler.pop_dirty_pairs() == {'USDGBP', 'EURPLN'}
+    assert scheduler.schedule_history_refresh('USDGBP')
+
+
+def test_slot_never_written_is_skipped(queued, monkeypatch):
+    """Test that a slot whose writer died does not block the later pairs forever."""
+    # slot 1 was numbered by a request which never wrote it
+    cache.set(scheduler.SEQUENCE_KEY, 1, timeout=None)
+    scheduler.schedule_history_refresh('EURUSD')
+
+    assert scheduler.pop_dirty_pairs() == set()
+
+    later = time.time() + scheduler.get_debounce() * 5 + 1
+    monkeypatch.setattr(scheduler, 'time', types.SimpleNamespace(time=lambda: later))
+    assert scheduler.pop_dirty_pairs() == {'EURUSD'}
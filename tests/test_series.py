@@ -0,0 +1,72 @@
+import datetime
+import pytest
+from currencyData.models import CurrencyDailyRate, TradingDay
+from currencyData.series import currency_series, get_series_version
+from currencyData.trading_calendar import learn_trading_days
+
+
+def rates(*items):
+    return {'rates': [{'effectiveDate': date, 'bid': bid} for date, bid in items]}
+
+
+@pytest.mark.django_db
+def test_series_fetches_only_missing_tail(nbp_server):
+    """Test that stored fixings are not requested from the NBP API again."""
+    CurrencyDailyRate.objects.create(code='USD', rate_currency=4.0, rate_date=datetime.date(2024, 12, 2))
+    CurrencyDailyRate.objects.create(code='USD', rate_currency=4.1, rate_date=datetime.date(2024, 12, 3))
+    nbp_server.add('exchangerates/rates/c/usd/2024-12-04/2024-12-05/', rates(('2024-12-04', 4.2), ('2024-12-05', 4.3)))
+    version = get_series_version()
+
+    series = currency_series(['USD'], datetime.date(2024, 12, 2), datetime.date(2024, 12, 5))
+
+    assert series['USD'] == {
+        datetime.date(2024, 12, 2): 4.0, datetime.date(2024, 12, 3): 4.1,
+        datetime.date(2024, 12, 4): 4.2, datetime.date(2024, 12, 5): 4.3,
+    }
+    assert nbp_server.requests == ['/api/exchangerates/rates/c/usd/2024-12-04/2024-12-05/']
+    assert get_series_version() != version
+
+    currency_series(['USD'], datetime.date(2024, 12, 2), datetime.date(2024, 12, 5))
+    assert len(nbp_server.requests) == 1
+
+
+@pytest.mark.django_db
+def test_series_fills_gaps_inside_stored_series(nbp_server):
+    """Test that publication days missing inside a stored series are requested, days NBP has no fixing for are
+    learned as closed and not requested again."""
+    for day, rate in ((2, 4.0), (3, 4.1), (6, 4.4)):
+        CurrencyDailyRate.objects.create(code='USD', rate_currency=rate, rate_date=datetime.date(2024, 12, day))
+    nbp_server.add('exchangerates/rates/c/usd/2024-12-04/2024-12-05/', rates(('2024-12-04', 4.2)))
+
+    series = currency_series(['USD'], datetime.date(2024, 12, 2), datetime.date(2024, 12, 6))
+
+    assert list(series['USD']) == [datetime.date(2024, 12, day) for day in (2, 3, 4, 6)]
+    assert nbp_server.requests == ['/api/exchangerates/rates/c/usd/2024-12-04/2024-12-05/']
+    assert TradingDay.objects.get(date=datetime.date(2024, 12, 5)).published is False
+
+    currency_series(['USD'], datetime.date(2024, 12, 2), datetime.date(2024, 12, 6))
+    assert len(nbp_server.requests) == 1
+
+
+@pytest.mark.django_db
+def test_series_requests_long_ranges_in_windows(nbp_server):
+    """Test that a missing range longer than NBP accepts is requested in windows."""
+    nbp_server.add('exchangerates/rates/c/usd/2024-01-02/2024-04-03/', rates(('2024-01-02', 4.0)))
+    nbp_server.add('exchangerates/rates/c/usd/2024-04-04/2024-04-30/', rates(('2024-04-30', 4.1)))
+
+    series = currency_series(['USD'], datetime.date(2024, 1, 2), datetime.date(2024, 4, 30))
+
+    assert series['USD'] == {datetime.date(2024, 1, 2): 4.0, datetime.date(2024, 4, 30): 4.1}
+    assert len(nbp_server.requests) == 2
+
+
+@pytest.mark.django_db
+def test_series_pln_follows_nbp_calendar(nbp_server):
+    """Test that PLN has a rate of 1 on every publication day of the trading calendar without NBP requests."""
+    learn_trading_days(closed=[datetime.date(2024, 12, 3)])
+
+    series = currency_series(['PLN'], datetime.date(2024, 12, 2), datetime.date(2024, 12, 8))
+
+    assert series == {'PLN': {datetime.date(2024, 12, 2): 1, datetime.date(2024, 12, 4): 1,
+                              datetime.date(2024, 12, 5): 1, datetime.date(2024, 12, 6): 1}}
+    assert nbp_server.requests == []
@@ -0,0 +1,40 @@
+import datetime
+import pytest
+from currencyData import services
+from currencyData.models import Currency, CurrencyExchangeRate
+
+
+HISTORY = {
+    'USD': {'2024-12-02': 4.0, '2024-12-03': 4.1, '2024-12-04': 4.2},
+    'EUR': {'2024-12-02': 4.3, '2024-12-03': 4.4},
+    'GBP': {'2024-12-02': 5.0, '2024-12-03': 5.1, '2024-12-04': 5.2},
+}
+
+
+@pytest.mark.django_db
+def test_fetch_historical_rate_saves_missing_rows(monkeypatch, django_assert_max_num_queries):
+    """Test that history of all pairs is calculated in bulk and only missing rows are saved."""
+    usd = Currency.objects.create(code='USD', rate_currency=4.2)
+    Currency.objects.create(code='EUR', rate_currency=4.4)
+    Currency.objects.create(code='GBP', rate_currency=5.2)
+    CurrencyExchangeRate.objects.create(currency=usd, currency_exchange_pair='USDEUR',
+                                        currency_exchange_rate=4.1 / 4.4,
+                                        currency_exchange_date=datetime.date(2024, 12, 3))
+    CurrencyExchangeRate.objects.create(currency=usd, currency_exchange_pair='USDGBP',
+                                        currency_exchange_rate=4.2 / 5.2,
+                                        currency_exchange_date=datetime.date(2024, 12, 4))
+    monkeypatch.setattr(services, 'currency_series', lambda codes, start, end: {code: HISTORY[code] for code in codes})
+
+    with django_assert_max_num_queries(5):
+        services.fetch_historical_rate()
+
+    assert services.save_historical_data([
+        ('USDEUR', datetime.date(2024, 12, 3), 4.1 / 4.4), ('USDEUR', datetime.date(2024, 12, 4), 0.95),
+    ]) == 1
+
+    usd_eur = dict(CurrencyExchangeRate.objects.filter(currency_exchange_pair='USDEUR')
+                   .values_list('currency_exchange_date', 'currency_exchange_rate'))
+    assert usd_eur == {datetime.date(2024, 12, 2): 4.0 / 4.3, datetime.date(2024, 12, 3): 4.1 / 4.4,
+                       datetime.date(2024, 12, 4): 0.95}
+    assert CurrencyExchangeRate.objects.filter(currency_exchange_pair='USDGBP').count() == 3
+    assert not CurrencyExchangeRate.objects.filter(currency__isnull=True).exists()
@@ -0,0 +1,45 @@
+import datetime
+import pytest
+from currencyData import services, trading_calendar
+from currencyData.models import TradingDay
+from currencyData.trading_calendar import TradingCalendar, easter_sunday, get_trading_calendar, learn_trading_days
+
+
+def test_calendar_skips_weekends_and_holidays():
+    """Test that the calendar follows the Polish public holidays."""
+    calendar = TradingCalendar(built_on=datetime.date(2024, 12, 4))
+
+    assert easter_sunday(2024) == datetime.date(2024, 3, 31)
+    assert calendar.days_between(datetime.date(2024, 12, 23), datetime.date(2025, 1, 7)) == [
+        datetime.date(2024, 12, 23), datetime.date(2024, 12, 24), datetime.date(2024, 12, 27),
+        datetime.date(2024, 12, 30), datetime.date(2024, 12, 31), datetime.date(2025, 1, 2),
+        datetime.date(2025, 1, 3), datetime.date(2025, 1, 7),
+    ]
+    # Easter Monday
+    assert calendar.latest_fixing_date(datetime.date(2024, 4, 1)) == datetime.date(2024, 3, 29)
+    assert calendar.latest_fixing_date(datetime.date(2024, 12, 8)) == datetime.date(2024, 12, 6)
+    assert calendar.business_days_back(3, datetime.date(2024, 12, 8)) == datetime.date(2024, 12, 3)
+    assert calendar.business_days_back_many(3, [datetime.date(2024, 12, 8), datetime.date(2001, 1, 1)]).tolist() == [
+        datetime.date(2024, 12, 3), None,
+    ]
+
+
+def test_calendar_corrections():
+    """Test that learned days override the rules."""
+    calendar = TradingCalendar({datetime.date(2024, 12, 6): False, datetime.date(2024, 12, 7): True},
+                               built_on=datetime.date(2024, 12, 4))
+
+    assert not calendar.is_published(datetime.date(2024, 12, 6))
+    assert calendar.latest_fixing_date(datetime.date(2024, 12, 8)) == datetime.date(2024, 12, 7)
+    assert calendar.business_days_back(1, datetime.date(2024, 12, 8)) == datetime.date(2024, 12, 5)
+
+
+@pytest.mark.django_db
+def test_missing_table_is_learned(nbp_server, monkeypatch):
+    """Test that a business day without a table is saved and skipped by every later lookup."""
+    monkeypatch.setattr(trading_calendar, 'today', lambda: datetime.date(2024, 12, 7))
+
+    assert services.get_currency_table() is None
+    assert list(TradingDay.objects.values_list('date', 'published')) == [(datetime.date(2024, 12, 6), False)]
+    assert get_trading_calendar().latest_fixing_date() == datetime.date(2024, 12, 5)
+    assert learn_trading_days(closed=[datetime.date(2024, 12, 6)]) == 0